@@ -5,13 +5,15 @@ from flask import Flask
 from flask import Response
 from flask import jsonify
 from flask import render_template
+from flask import request
 from prometheus_client import CONTENT_TYPE_LATEST
-from prometheus_client import generate_latest
 
 from home_assistant import HomeAssistantAPI
 from metrics import metrics_collector
+from metrics import set_state_source
 from metrics import start_metrics_server
 from metrics import update_system_metrics
+from metrics_refresher import MetricsRefresher
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -24,6 +26,11 @@ app.secret_key = os.environ.get("SESSION_SECRET", "fallback-secret-key")
 # Initialize Home Assistant API
 ha_api = HomeAssistantAPI()
 
+# Живое зеркало состояний через WebSocket (HA_WEBSOCKET_ENABLED)
+live_mirror = ha_api.create_live_mirror()
+if live_mirror is not None:
+    live_mirror.start_in_thread()
+
 # Запуск сервера метрик
 try:
     start_metrics_server(port=8000)
@@ -98,17 +105,22 @@ def api_status():
 
         # Check Telegram bot status
         telegram_status = "disabled"
+        webhook_bot = app.extensions.get("telegram_webhook")
         try:
-            with open("telegram_bot.pid", "r") as f:
-                pid = int(f.read().strip())
-                # Check if process is running
-                import os
-
-                try:
-                    os.kill(pid, 0)
-                    telegram_status = "running"
-                except OSError:
-                    telegram_status = "stopped"
+            if webhook_bot is not None:
+                # Бот работает в этом процессе и получает обновления через webhook
+                telegram_status = "webhook" if webhook_bot.running else "stopped"
+            else:
+                with open("telegram_bot.pid", "r") as f:
+                    pid = int(f.read().strip())
+                    # Check if process is running
+                    import os
+
+                    try:
+                        os.kill(pid, 0)
+                        telegram_status = "running"
+                    except OSError:
+                        telegram_status = "stopped"
         except FileNotFoundError:
             telegram_status = "not_started"
         except Exception:
@@ -152,15 +164,15 @@ def api_lights():
 def metrics():
     """OpenMetrics endpoint for Prometheus scraping"""
     try:
-        # Обновляем системные метрики перед отдачей
-        update_system_metrics()
-
-        # Обновляем метрики Home Assistant
-        _update_homeassistant_metrics()
-
-        # Генерируем метрики в формате OpenMetrics
-        data = generate_latest()
-        return Response(data, mimetype=CONTENT_TYPE_LATEST)
+        # Отдаём заранее подготовленный текст, обновляемый в фоне
+        data, encoding = metrics_refresher.exposition(
+            accept_gzip="gzip" in request.accept_encodings
+        )
+        response = Response(data, mimetype=CONTENT_TYPE_LATEST)
+        response.headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        return response
     except Exception as e:
         logger.error(f"Metrics endpoint error: {e}")
         return Response("# Metrics unavailable\n", mimetype="text/plain"), 500
@@ -171,6 +183,10 @@ def api_metrics_summary():
     """API endpoint for metrics summary"""
     try:
         summary = metrics_collector.get_metrics_summary()
+        # Детализация по одному пользователю: /api/metrics-summary?user_id=123
+        user_id = request.args.get("user_id")
+        if user_id:
+            summary["user"] = metrics_collector.get_user_activity(user_id)
         return jsonify({"status": "success", "metrics": summary})
     except Exception as e:
         logger.error(f"Metrics summary error: {e}")
@@ -179,47 +195,32 @@ def api_metrics_summary():
 
 def _update_homeassistant_metrics():
     """Обновить метрики Home Assistant"""
+    from metrics import homeassistant_connection_status
+
     try:
-        # Получаем все состояния
+        # Загрузка держит снимок свежим; device_status и количество сущностей
+        # читает из него коллектор при каждом запросе метрик
         states = ha_api.get_all_states()
-        if states:
-            # Подсчитываем сущности по доменам
-            entities_by_domain = {}
-            for state in states:
-                entity_id = state.get("entity_id", "")
-                if "." in entity_id:
-                    domain = entity_id.split(".")[0]
-                    entities_by_domain[domain] = entities_by_domain.get(domain, 0) + 1
-
-                    # Обновляем статус устройств для основных доменов
-                    if domain in ["light", "switch", "sensor"]:
-                        friendly_name = state.get("attributes", {}).get(
-                            "friendly_name", entity_id
-                        )
-                        current_state = state.get("state", "unknown")
-                        metrics_collector.update_device_status(
-                            entity_id, friendly_name, current_state
-                        )
-
-            # Обновляем метрики количества сущностей
-            metrics_collector.update_homeassistant_entities(entities_by_domain)
-
-            # Устанавливаем статус подключения
-            from metrics import homeassistant_connection_status
-
-            homeassistant_connection_status.set(1)
-        else:
-            # Нет данных - проблемы с подключением
-            from metrics import homeassistant_connection_status
-
-            homeassistant_connection_status.set(0)
-
+        homeassistant_connection_status.set(1 if states else 0)
     except Exception as e:
         logger.error(f"Error updating Home Assistant metrics: {e}")
-        from metrics import homeassistant_connection_status
-
         homeassistant_connection_status.set(0)
 
 
+def _snapshot_states():
+    """Текущий снимок состояний без обращения к Home Assistant"""
+    snapshot = ha_api.state_store.peek()
+    return snapshot.states if snapshot is not None else None
+
+
+set_state_source(_snapshot_states)
+
+# Фоновое обновление метрик, чтобы запрос /metrics не ходил в Home Assistant
+metrics_refresher = MetricsRefresher(
+    [update_system_metrics, _update_homeassistant_metrics]
+)
+metrics_refresher.start()
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,190 @@
+"""
+Area to entity index built from the Home Assistant registries
+"""
+
+import logging
+import threading
+import time
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+
+from entities import get_domain
+
+logger = logging.getLogger(__name__)
+
+# Шаблон для REST API: все зоны с их сущностями (включая сущности устройств зоны)
+AREAS_TEMPLATE = (
+    "{% set ns = namespace(rows=[]) %}"
+    "{% for area_id in areas() %}"
+    "{% set ns.rows = ns.rows + [{'area_id': area_id, "
+    "'name': area_name(area_id), 'entities': area_entities(area_id)}] %}"
+    "{% endfor %}"
+    "{{ ns.rows | to_json }}"
+)
+
+
+def _normalize(name: str) -> str:
+    """Comparable form of an area name or id (``Living Room`` -> ``living_room``)."""
+    return "_".join(name.casefold().replace("-", " ").replace("_", " ").split())
+
+
+class AreaIndex:
+    """Maps areas to their entities.
+
+    An entity belongs to its own ``area_id`` or, when it has none, to the
+    area of its device. The index is loaded in full (``load`` from the
+    WebSocket registries or ``load_members`` from a REST template); with the
+    live mirror running, registry events then keep it current through
+    ``set_areas``, ``set_devices``, ``upsert_entity`` and ``remove_entity``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._area_names: Dict[str, str] = {}
+        self._device_area: Dict[str, str] = {}
+        self._entity_entries: Dict[str, Dict] = {}
+        self._entity_area: Dict[str, str] = {}
+        self._members: Dict[str, Set[str]] = {}
+        self.loaded_at: Optional[float] = None
+        # Индекс поддерживается событиями реестров через WebSocket
+        self.live = False
+
+    def is_fresh(self, ttl: float) -> bool:
+        """Whether the index can be used without reloading it."""
+        if self.loaded_at is None:
+            return False
+        return self.live or time.monotonic() - self.loaded_at < ttl
+
+    def load(self, areas: List[Dict], devices: List[Dict], entities: List[Dict]):
+        """Rebuild the index from full registry listings."""
+        with self._lock:
+            self._area_names = {area["area_id"]: area["name"] for area in areas}
+            self._device_area = {
+                device["id"]: device["area_id"]
+                for device in devices
+                if device.get("area_id")
+            }
+            self._entity_entries = {entry["entity_id"]: entry for entry in entities}
+            self._entity_area = {}
+            self._members = {area_id: set() for area_id in self._area_names}
+            for entity_id in self._entity_entries:
+                self._reassign(entity_id)
+            self.loaded_at = time.monotonic()
+        logger.info(
+            f"Area index loaded: {len(areas)} areas, {len(self._entity_area)} entities"
+        )
+
+    def load_members(self, rows: List[Dict]):
+        """Rebuild the index from ``AREAS_TEMPLATE`` output (no registries)."""
+        with self._lock:
+            self._area_names = {row["area_id"]: row["name"] for row in rows}
+            self._device_area = {}
+            self._entity_entries = {}
+            self._entity_area = {}
+            self._members = {}
+            for row in rows:
+                self._members[row["area_id"]] = set(row.get("entities") or [])
+                for entity_id in row.get("entities") or []:
+                    self._entity_area[entity_id] = row["area_id"]
+            self.loaded_at = time.monotonic()
+
+    def set_areas(self, areas: List[Dict]):
+        """Apply a fresh area listing (created, renamed or removed areas)."""
+        with self._lock:
+            self._area_names = {area["area_id"]: area["name"] for area in areas}
+            for area_id in list(self._members):
+                if area_id not in self._area_names:
+                    for entity_id in self._members.pop(area_id):
+                        self._entity_area.pop(entity_id, None)
+            added = [
+                area_id for area_id in self._area_names if area_id not in self._members
+            ]
+            for area_id in added:
+                self._members[area_id] = set()
+            if added:
+                # Сущности могли сослаться на зону раньше, чем пришло её создание
+                for entity_id in self._entity_entries:
+                    if entity_id not in self._entity_area:
+                        self._reassign(entity_id)
+
+    def set_devices(self, devices: List[Dict]):
+        """Apply a fresh device listing; only entities of moved devices change."""
+        with self._lock:
+            device_area = {
+                device["id"]: device["area_id"]
+                for device in devices
+                if device.get("area_id")
+            }
+            moved = {
+                device_id
+                for device_id in set(device_area) | set(self._device_area)
+                if device_area.get(device_id) != self._device_area.get(device_id)
+            }
+            self._device_area = device_area
+            for entity_id, entry in self._entity_entries.items():
+                if entry.get("device_id") in moved:
+                    self._reassign(entity_id)
+
+    def upsert_entity(self, entry: Dict):
+        """Add or update one entity registry entry."""
+        with self._lock:
+            self._entity_entries[entry["entity_id"]] = entry
+            self._reassign(entry["entity_id"])
+
+    def remove_entity(self, entity_id: str):
+        """Drop one entity from the index."""
+        with self._lock:
+            self._entity_entries.pop(entity_id, None)
+            area_id = self._entity_area.pop(entity_id, None)
+            if area_id is not None:
+                self._members.get(area_id, set()).discard(entity_id)
+
+    def _reassign(self, entity_id: str):
+        """Recompute the area of one entity (lock held)."""
+        entry = self._entity_entries.get(entity_id, {})
+        area_id = entry.get("area_id") or self._device_area.get(entry.get("device_id"))
+        old_area_id = self._entity_area.get(entity_id)
+        if old_area_id == area_id:
+            return
+        if old_area_id is not None:
+            self._members.get(old_area_id, set()).discard(entity_id)
+            del self._entity_area[entity_id]
+        if area_id is not None and area_id in self._members:
+            self._members[area_id].add(entity_id)
+            self._entity_area[entity_id] = area_id
+
+    def find_area(self, query: str) -> Optional[str]:
+        """Resolve an area by id or (case-insensitive) name."""
+        wanted = _normalize(query)
+        with self._lock:
+            for area_id, name in self._area_names.items():
+                if wanted in (_normalize(area_id), _normalize(name)):
+                    return area_id
+        return None
+
+    def area_name(self, area_id: str) -> str:
+        """Human-readable name of an area."""
+        return self._area_names.get(area_id, area_id)
+
+    def areas(self) -> Dict[str, str]:
+        """All known areas as ``{area_id: name}``."""
+        with self._lock:
+            return dict(self._area_names)
+
+    def entities(
+        self, area_id: str, domains: Optional[Iterable[str]] = None
+    ) -> List[str]:
+        """Sorted entity_ids of an area, optionally limited to ``domains``."""
+        with self._lock:
+            members = self._members.get(area_id, set())
+            if domains is not None:
+                domains = set(domains)
+                members = {
+                    entity_id
+                    for entity_id in members
+                    if get_domain(entity_id) in domains
+                }
+            return sorted(members)
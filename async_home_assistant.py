@@ -0,0 +1,571 @@
+import asyncio
+import logging
+import os
+import time
+import weakref
+from datetime import datetime
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+import httpx
+
+from area_index import AREAS_TEMPLATE
+from area_index import AreaIndex
+from entities import group_by_domain
+from entities import paginate
+from entities import project_light
+from entities import resolve_patterns
+from ha_websocket import HomeAssistantWebSocket
+from home_assistant import http_pool_config
+from metrics import metrics_collector
+from metrics import track_device_command
+from metrics import track_homeassistant_request
+from singleflight import AsyncSingleFlight
+from state_store import EntityStateStore
+from states_stream import STREAM_CHUNK_SIZE
+from states_stream import StatesStreamParser
+from states_stream import finish_stream
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Домены, которыми управляют команды для зоны целиком
+ROOM_DOMAINS = ("light", "switch")
+
+
+class AsyncHomeAssistantAPI:
+    """Non-blocking counterpart of ``HomeAssistantAPI`` for the bot event loop.
+
+    Exposes the same methods as coroutines, backed by a shared
+    ``httpx.AsyncClient`` so a slow Home Assistant response only suspends the
+    handler that awaits it instead of freezing every chat.
+    """
+
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        base_url: Optional[str] = None,
+        token: Optional[str] = None,
+    ):
+        """Initialize async Home Assistant API client.
+
+        ``base_url`` and ``token`` default to ``HOME_ASSISTANT_URL`` and
+        ``HOME_ASSISTANT_TOKEN``.
+        """
+        self.base_url = base_url or os.getenv(
+            "HOME_ASSISTANT_URL", "http://localhost:8123"
+        )
+        self.token = token or os.getenv("HOME_ASSISTANT_TOKEN")
+
+        if not self.token:
+            logger.warning("HOME_ASSISTANT_TOKEN environment variable not set")
+
+        # Remove trailing slash from base URL
+        self.base_url = self.base_url.rstrip("/")
+
+        # Set up headers
+        self.headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+        }
+
+        self.state_store = EntityStateStore(
+            ttl=float(os.getenv("HA_STATES_CACHE_TTL", "5"))
+        )
+        self.live_mirror: Optional[HomeAssistantWebSocket] = None
+
+        # Одинаковые одновременные чтения выполняются одним запросом
+        self._state_loads = AsyncSingleFlight("async")
+        self._inflight_requests = AsyncSingleFlight("async")
+        self.stream_states = os.getenv("HA_STREAM_STATES", "false").lower() in (
+            "1",
+            "true",
+        )
+        self._client = client
+
+        # Индекс зона -> сущности; без WebSocket перечитывается раз в TTL
+        self.area_index = AreaIndex()
+        self.area_index_ttl = float(os.getenv("HA_AREA_INDEX_TTL", "300"))
+
+        # Статистика переиспользования keep-alive соединений
+        self._pool_requests = 0
+        self._pool_new_connections = 0
+        self._seen_streams = weakref.WeakSet()
+
+        # Ожидание подтверждения состояния после команды
+        self.confirm_timeout = float(os.getenv("HA_CONFIRM_TIMEOUT", "5"))
+        self.confirm_poll_min = float(os.getenv("HA_CONFIRM_POLL_MIN", "0.25"))
+        self.confirm_poll_max = float(os.getenv("HA_CONFIRM_POLL_MAX", "1.0"))
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Create the HTTP client lazily inside the running event loop."""
+        if self._client is None:
+            config = http_pool_config()
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=config["pool_maxsize"],
+                    max_keepalive_connections=config["pool_maxsize"],
+                ),
+            )
+        return self._client
+
+    def _record_connection(self, response: httpx.Response):
+        """Count whether a response arrived over a new or a reused connection."""
+        self._pool_requests += 1
+        stream = response.extensions.get("network_stream")
+        if stream is None or stream not in self._seen_streams:
+            self._pool_new_connections += 1
+            if stream is not None:
+                self._seen_streams.add(stream)
+        metrics_collector.update_http_pool_stats(
+            "async", self._pool_requests, self._pool_new_connections
+        )
+
+    async def close(self):
+        """Close the underlying HTTP client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def create_live_mirror(self) -> Optional[HomeAssistantWebSocket]:
+        """Create the WebSocket mirror feeding the state store, if enabled."""
+        if os.getenv("HA_WEBSOCKET_ENABLED", "false").lower() not in ("1", "true"):
+            return None
+        if self.live_mirror is None:
+            self.live_mirror = HomeAssistantWebSocket(
+                self.state_store, token=self.token, area_index=self.area_index
+            )
+        return self.live_mirror
+
+    async def _make_request(
+        self, method: str, endpoint: str, data: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """Make HTTP request to Home Assistant API.
+
+        Concurrent GETs of the same endpoint share one request and its result;
+        ``states`` is left to ``get_all_states``, which coalesces whole loads.
+        """
+        with span("ha.request", method=method, endpoint=endpoint):
+            # Полный список уже объединяет get_all_states через _state_loads
+            if method != "GET" or endpoint == "states":
+                return await self._send_request(method, endpoint, data)
+            return await self._inflight_requests.do(
+                endpoint, lambda: self._send_request(method, endpoint)
+            )
+
+    @track_homeassistant_request("{method}", "{endpoint}")
+    async def _send_request(
+        self, method: str, endpoint: str, data: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """Send one HTTP request to Home Assistant API."""
+        try:
+            url = f"{self.base_url}/api/{endpoint}"
+            logger.debug(f"Making {method} request to: {url}")
+
+            response = await self._get_client().request(
+                method, url, headers=self.headers, json=data, timeout=30
+            )
+            self._record_connection(response)
+
+            if response.status_code == 200:
+                try:
+                    return response.json()
+                except ValueError as json_error:
+                    logger.error(
+                        f"JSON parsing error in {method} {endpoint}: {json_error}"
+                    )
+                    logger.error(
+                        f"Response content length: {len(response.content)} bytes"
+                    )
+                    if len(response.content) > 100000:  # Если ответ больше 100KB
+                        logger.warning(
+                            "Response too large, trying alternative approach"
+                        )
+                        return None
+                    logger.error(f"Response preview: {response.text[:500]}...")
+                    raise json_error
+            else:
+                logger.error(
+                    f"API request failed: {response.status_code} - {response.text}"
+                )
+                return None
+
+        except httpx.HTTPError as e:
+            logger.error(f"Request error: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Unexpected error: {e}")
+            return None
+
+    @track_homeassistant_request("GET", "states")
+    async def _stream_states(self) -> Optional[StatesStreamParser]:
+        """Download ``/api/states`` entity by entity, keeping only used fields."""
+        parser = StatesStreamParser()
+        url = f"{self.base_url}/api/states"
+        logger.debug(f"Streaming GET request to: {url}")
+
+        try:
+            async with self._get_client().stream(
+                "GET", url, headers=self.headers, timeout=30
+            ) as response:
+                self._record_connection(response)
+                if response.status_code != 200:
+                    await response.aread()
+                    logger.error(
+                        f"API request failed: {response.status_code} - {response.text}"
+                    )
+                    return None
+                async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                    parser.feed(chunk)
+                    if parser.error is not None:
+                        break
+        except httpx.HTTPError as e:
+            parser.error = f"request error: {e}"
+
+        return finish_stream(parser)
+
+    async def get_all_states(self) -> Optional[List[Dict]]:
+        """Get all entity states, served from the shared state store.
+
+        On a miss concurrent callers wait for a single reload.
+        """
+        states = self.state_store.lookup()
+        if states is not None:
+            return states
+        return await self._state_loads.do("states", self._load_states)
+
+    async def _load_states(self) -> Optional[List[Dict]]:
+        """Fetch all states from Home Assistant and install them in the store."""
+        # Команда во время загрузки: снимок может её не учитывать
+        since = self.state_store.invalidations
+        if self.stream_states:
+            with span("ha.request", method="GET", endpoint="states", streamed=True):
+                parser = await self._stream_states()
+            if parser is None:
+                return None
+            return self.state_store.replace(
+                parser.states, complete=parser.complete, since=since
+            ).states
+
+        states = await self._make_request("GET", "states")
+        if states is None:
+            return None
+        return self.state_store.replace(states, since=since).states
+
+    async def get_entity_state(self, entity_id: str) -> Optional[Dict]:
+        """Get state of a specific entity."""
+        if self.state_store.live:
+            if self.state_store.loaded:
+                return self.state_store.get(entity_id)
+        return await self._make_request("GET", f"states/{entity_id}")
+
+    async def call_service(
+        self, domain: str, service: str, entity_id: Union[str, List[str]]
+    ) -> bool:
+        """Call a Home Assistant service for one entity_id or a list of them."""
+        try:
+            data = {"entity_id": entity_id}
+
+            url = f"{self.base_url}/api/services/{domain}/{service}"
+            logger.debug(f"Calling service: {url} with data: {data}")
+
+            response = await self._get_client().post(
+                url, headers=self.headers, json=data, timeout=15
+            )
+            self._record_connection(response)
+
+            logger.debug(
+                f"Service call response: {response.status_code} - {response.text[:200]}"
+            )
+
+            if response.status_code == 200:
+                self.state_store.invalidate()
+                # Чтения, начатые до команды, вернут старое состояние
+                self._state_loads.forget("states")
+                self._inflight_requests.forget("states")
+                return True
+            else:
+                logger.error(
+                    f"Service call failed: {response.status_code} - {response.text}"
+                )
+                return False
+
+        except Exception as e:
+            logger.error(f"Service call error: {e}")
+            return False
+
+    async def wait_for_state(
+        self, entity_id: str, target_state: str, timeout: Optional[float] = None
+    ) -> bool:
+        """Wait until an entity reports ``target_state`` or the deadline passes.
+
+        With the live mirror running the wait is woken by ``state_changed``
+        events; otherwise the entity is polled with exponential backoff. Either
+        way only the awaiting handler is suspended.
+        """
+        timeout = self.confirm_timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        deadline = loop.time() + timeout
+        changed = asyncio.Event()
+
+        def on_change(changed_id: str, old_state, new_state):
+            if changed_id == entity_id:
+                loop.call_soon_threadsafe(changed.set)
+
+        self.state_store.add_listener(on_change)
+        delay = self.confirm_poll_min
+        confirmed = False
+        try:
+            while True:
+                state = await self.get_entity_state(entity_id)
+                if state is not None and state.get("state") == target_state:
+                    confirmed = True
+                    break
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                wait = remaining if self.state_store.live else min(delay, remaining)
+                try:
+                    await asyncio.wait_for(changed.wait(), wait)
+                except asyncio.TimeoutError:
+                    delay = min(delay * 2, self.confirm_poll_max)
+                changed.clear()
+        finally:
+            self.state_store.remove_listener(on_change)
+            metrics_collector.record_state_confirmation(
+                target_state, confirmed, time.monotonic() - started
+            )
+
+        return confirmed
+
+    async def follow_states(
+        self, interval: float, active: Callable[[], bool] = lambda: True
+    ):
+        """Keep state store listeners informed about changes until cancelled.
+
+        With the live mirror the changes arrive as events; otherwise states
+        are reloaded every ``interval`` seconds while ``active()`` is true and
+        the store reports the differences to its listeners.
+        """
+        while True:
+            if active() and not self.state_store.live:
+                try:
+                    await self.get_all_states()
+                except Exception as e:
+                    logger.error(f"Error following state changes: {e}")
+            await asyncio.sleep(interval)
+
+    async def bulk_command(
+        self, service: str, patterns: List[str], domains: Tuple[str, ...]
+    ) -> Dict[str, List[str]]:
+        """Run ``service`` on every entity matched by entity_ids or glob patterns.
+
+        Targets are resolved against the cached states and dispatched as one
+        service call per domain. Returns the ``succeeded`` and ``failed``
+        entity_ids and the ``unmatched`` arguments.
+        """
+        states = await self.get_all_states() or []
+        entity_ids, unmatched = resolve_patterns(patterns, states, domains)
+        result = await self._dispatch_by_domain(service, entity_ids)
+        result["unmatched"] = unmatched
+        return result
+
+    async def _dispatch_by_domain(
+        self, service: str, entity_ids: List[str]
+    ) -> Dict[str, List[str]]:
+        """Call ``service`` once per domain, all domains in parallel."""
+        groups = list(group_by_domain(entity_ids).items())
+
+        async def dispatch(domain: str, domain_ids: List[str]) -> bool:
+            start_time = time.time()
+            success = await self.call_service(domain, service, domain_ids)
+            metrics_collector.record_bulk_device_command(
+                domain_ids, service, success, time.time() - start_time
+            )
+            return success
+
+        outcomes = await asyncio.gather(
+            *(dispatch(domain, domain_ids) for domain, domain_ids in groups)
+        )
+        result: Dict[str, List[str]] = {"succeeded": [], "failed": []}
+        for (_, domain_ids), success in zip(groups, outcomes):
+            result["succeeded" if success else "failed"].extend(domain_ids)
+        return result
+
+    async def get_area_index(self) -> Optional[AreaIndex]:
+        """Area index, reloaded over REST unless the live mirror maintains it."""
+        if not self.area_index.is_fresh(self.area_index_ttl):
+            await self._state_loads.do("areas", self._load_area_index)
+        return self.area_index if self.area_index.loaded_at is not None else None
+
+    async def _load_area_index(self):
+        """Fill the area index from a rendered ``AREAS_TEMPLATE``."""
+        rows = await self._make_request(
+            "POST", "template", {"template": AREAS_TEMPLATE}
+        )
+        if rows is None:
+            logger.warning("Could not load areas from Home Assistant")
+            return
+        self.area_index.load_members(rows)
+
+    async def get_room(self, query: str) -> Optional[Dict]:
+        """Resolve an area by id or name and return its entities' states.
+
+        Returns ``{"area_id", "name", "states"}`` or ``None`` for an unknown
+        area.
+        """
+        index = await self.get_area_index()
+        area_id = index.find_area(query) if index is not None else None
+        if area_id is None:
+            return None
+
+        await self.get_all_states()
+        states = [
+            self.state_store.get(entity_id) for entity_id in index.entities(area_id)
+        ]
+        return {
+            "area_id": area_id,
+            "name": index.area_name(area_id),
+            "states": [state for state in states if state is not None],
+        }
+
+    async def room_command(
+        self, query: str, service: str, domains: Tuple[str, ...] = ROOM_DOMAINS
+    ) -> Optional[Dict]:
+        """Run ``service`` on every light and switch of an area.
+
+        The domains are dispatched in parallel with one service call each.
+        Returns the ``bulk_command`` result plus ``name``, or ``None`` for an
+        unknown area.
+        """
+        index = await self.get_area_index()
+        area_id = index.find_area(query) if index is not None else None
+        if area_id is None:
+            return None
+
+        result = await self._dispatch_by_domain(
+            service, index.entities(area_id, domains)
+        )
+        result["name"] = index.area_name(area_id)
+        return result
+
+    async def get_lights(self) -> List[Dict]:
+        """Get all light entities and their states."""
+        try:
+            states = await self.get_all_states()
+            if not states:
+                logger.warning("Could not get all states, trying alternative approach")
+                return await self._get_lights_alternative()
+
+            return self.state_store.domain_entities(states, "light")
+        except Exception as e:
+            logger.error(f"Error in get_lights: {e}")
+            return await self._get_lights_alternative()
+
+    async def _get_lights_alternative(self) -> List[Dict]:
+        """Alternative method to get lights when main API fails."""
+        try:
+            result = await self._make_request("GET", "services")
+            if result is None:
+                return []
+
+            lights = []
+            common_light_names = [
+                "main_light",
+                "bedroom_light",
+                "kitchen_light",
+                "living_room_light",
+            ]
+
+            for light_name in common_light_names:
+                state_data = await self.get_entity_state(f"light.{light_name}")
+                if state_data:
+                    lights.append(project_light(state_data))
+
+            if not lights:
+                logger.info("No lights found with alternative method")
+
+            return lights
+        except Exception as e:
+            logger.error(f"Error in alternative lights method: {e}")
+            return []
+
+    async def get_entities_page(
+        self, domain: str, page: int, per_page: int
+    ) -> Tuple[List[Dict], int, int]:
+        """Get one page of a domain's entities sorted by friendly name.
+
+        Returns ``(items, total, page)`` with ``page`` clamped to the last one.
+        """
+        states = await self.get_all_states()
+        if not states:
+            if domain == "light":
+                return paginate(await self._get_lights_alternative(), page, per_page)
+            return [], 0, 1
+
+        with span("entities.page", domain=domain):
+            return self.state_store.domain_page(states, domain, page, per_page)
+
+    async def get_switches(self) -> List[Dict]:
+        """Get all switch entities and their states."""
+        states = await self.get_all_states()
+        if not states:
+            return []
+
+        return self.state_store.domain_entities(states, "switch")
+
+    async def get_sensors(self) -> List[Dict]:
+        """Get all sensor entities and their states."""
+        states = await self.get_all_states()
+        if not states:
+            return []
+
+        return self.state_store.domain_entities(states, "sensor")
+
+    @track_device_command("{entity_id}", "turn_on")
+    async def turn_on_light(self, entity_id: str) -> bool:
+        """Turn on a light."""
+        return await self.call_service("light", "turn_on", entity_id)
+
+    @track_device_command("{entity_id}", "turn_off")
+    async def turn_off_light(self, entity_id: str) -> bool:
+        """Turn off a light."""
+        return await self.call_service("light", "turn_off", entity_id)
+
+    @track_device_command("{entity_id}", "turn_on")
+    async def turn_on_switch(self, entity_id: str) -> bool:
+        """Turn on a switch."""
+        return await self.call_service("switch", "turn_on", entity_id)
+
+    @track_device_command("{entity_id}", "turn_off")
+    async def turn_off_switch(self, entity_id: str) -> bool:
+        """Turn off a switch."""
+        return await self.call_service("switch", "turn_off", entity_id)
+
+    async def toggle_entity(self, entity_id: str) -> bool:
+        """Toggle an entity (light or switch)."""
+        if entity_id.startswith("light."):
+            return await self.call_service("light", "toggle", entity_id)
+        elif entity_id.startswith("switch."):
+            return await self.call_service("switch", "toggle", entity_id)
+        else:
+            return False
+
+    def get_current_time(self) -> str:
+        """Get current timestamp."""
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    async def test_connection(self) -> bool:
+        """Test connection to Home Assistant."""
+        try:
+            result = await self._make_request("GET", "")
+            return result is not None and "message" in result
+        except Exception as e:
+            logger.error(f"Connection test failed: {e}")
+            return False
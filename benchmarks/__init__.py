@@ -0,0 +1,3 @@
+"""
+Benchmarks and load-testing helpers (not shipped with the application)
+"""
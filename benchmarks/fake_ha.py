@@ -0,0 +1,550 @@
+"""
+Local fake Home Assistant (REST and WebSocket API) for load and resilience tests
+
+Run standalone and point the bot or the dashboard at it::
+
+    python -m benchmarks.fake_ha --entities 5000 --latency lognormal:0.05,0.5 \\
+        --error-rate 0.01 --websocket --port 8123
+
+or start it in-process (see the ``fake_ha`` fixture in ``tests/conftest.py``).
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import logging
+import math
+import random
+import threading
+from datetime import datetime
+from datetime import timezone
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Union
+from urllib.parse import unquote
+
+from area_index import AREAS_TEMPLATE
+from benchmarks.synthetic import ROOMS
+from benchmarks.synthetic import generate_states
+
+logger = logging.getLogger(__name__)
+
+# Сервисы, меняющие состояние, по доменам
+TOGGLE_DOMAINS = ("light", "switch", "fan", "input_boolean", "automation")
+SERVICE_STATES = {"turn_on": "on", "turn_off": "off"}
+
+
+def parse_latency(spec: Union[str, float, None]) -> Callable[[random.Random], float]:
+    """Build a latency sampler (seconds) from a spec.
+
+    ``0.05`` - constant; ``uniform:LOW,HIGH``; ``normal:MEAN,STDDEV``
+    (clamped at 0); ``lognormal:MEDIAN,SIGMA``; ``exponential:MEAN``.
+    """
+    if spec is None or spec == "":
+        return lambda rng: 0.0
+    if isinstance(spec, (int, float)):
+        return lambda rng: float(spec)
+
+    kind, _, params = spec.partition(":")
+    if not params:
+        value = float(kind)
+        return lambda rng: value
+    args = [float(value) for value in params.split(",")]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(args[0], args[1]))
+    if kind == "lognormal":
+        mu = math.log(args[0])
+        return lambda rng: rng.lognormvariate(mu, args[1])
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1 / args[0])
+    raise ValueError(f"Unknown latency distribution {kind!r}")
+
+
+def _slug(name: str) -> str:
+    return name.lower().replace(" ", "_")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeHomeAssistant:
+    """In-process fake of the Home Assistant REST and WebSocket APIs.
+
+    Serves ``/api/``, ``/api/states``, ``/api/states/<id>``,
+    ``/api/services``, ``/api/services/<domain>/<service>`` and the area
+    template, with optional latency, injected errors and timeouts. Service
+    calls change entity states (after ``state_change_delay``) and are
+    broadcast as ``state_changed`` events to WebSocket subscribers.
+    """
+
+    def __init__(
+        self,
+        entities: int = 1000,
+        seed: int = 0,
+        latency: Union[str, float, None] = None,
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        timeout: float = 60.0,
+        state_change_delay: float = 0.0,
+        websocket: bool = False,
+        token: Optional[str] = "fake-token",
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ws_port: int = 0,
+        states: Optional[List[Dict]] = None,
+    ):
+        self.token = token
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout = timeout
+        self.state_change_delay = state_change_delay
+        self.latency = parse_latency(latency)
+        self.websocket = websocket
+        self.host = host
+        self.port = port
+        self.ws_port = ws_port
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._states: Dict[str, Dict] = {
+            state["entity_id"]: state
+            for state in (
+                states if states is not None else generate_states(entities, seed)
+            )
+        }
+        self._states_body: Optional[bytes] = None
+        # Счётчики запросов по "METHOD endpoint" для проверок в тестах
+        self.requests: Dict[str, int] = {}
+
+        self._http: Optional[ThreadingHTTPServer] = None
+        self._ws_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ws_server = None
+        self._ws_clients: Dict[object, Dict[str, int]] = {}
+
+    def start(self) -> "FakeHomeAssistant":
+        """Start the servers in daemon threads."""
+        self._stopping.clear()
+        self._http = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self._http.daemon_threads = True
+        self.port = self._http.server_address[1]
+        threading.Thread(
+            target=self._http.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            name="fake-ha-http",
+            daemon=True,
+        ).start()
+        if self.websocket:
+            self._start_websocket()
+        logger.info(f"Fake Home Assistant on {self.base_url}")
+        return self
+
+    def stop(self):
+        """Stop the servers and release hanging (timed out) requests."""
+        self._stopping.set()
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+            self._http = None
+        if self._ws_loop is not None:
+            asyncio.run_coroutine_threadsafe(
+                self._stop_websocket(), self._ws_loop
+            ).result(5)
+            self._ws_loop.call_soon_threadsafe(self._ws_loop.stop)
+            self._ws_loop = None
+
+    def __enter__(self) -> "FakeHomeAssistant":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://{self.host}:{self.ws_port}/api/websocket"
+
+    def env(self) -> Dict[str, str]:
+        """Environment variables pointing the application at this server."""
+        env = {
+            "HOME_ASSISTANT_URL": self.base_url,
+            "HOME_ASSISTANT_TOKEN": self.token or "",
+        }
+        if self.websocket:
+            env["HOME_ASSISTANT_WS_URL"] = self.ws_url
+            env["HA_WEBSOCKET_ENABLED"] = "true"
+        return env
+
+    def get_state(self, entity_id: str) -> Optional[Dict]:
+        with self._lock:
+            state = self._states.get(entity_id)
+            return copy.deepcopy(state) if state is not None else None
+
+    def all_states(self) -> List[Dict]:
+        with self._lock:
+            return copy.deepcopy(list(self._states.values()))
+
+    def set_state(
+        self, entity_id: str, state: str, attributes: Optional[Dict] = None
+    ) -> Dict:
+        """Change (or create) an entity and notify WebSocket subscribers."""
+        with self._lock:
+            old_state = self._states.get(entity_id)
+            now = _now()
+            new_state = {
+                "entity_id": entity_id,
+                "state": state,
+                "attributes": dict(
+                    attributes
+                    if attributes is not None
+                    else (old_state or {}).get("attributes", {})
+                ),
+                "last_changed": now,
+                "last_reported": now,
+                "last_updated": now,
+                "context": {"id": f"fake-{self._rng.getrandbits(64):016x}"},
+            }
+            self._states[entity_id] = new_state
+            self._states_body = None
+        self._broadcast(
+            "state_changed",
+            {"entity_id": entity_id, "old_state": old_state, "new_state": new_state},
+        )
+        return new_state
+
+    def call_service(self, domain: str, service: str, data: Dict) -> List[Dict]:
+        """Apply a service call; returns the states it will change."""
+        entity_ids = data.get("entity_id") or []
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+
+        changes = []
+        for entity_id in entity_ids:
+            current = self.get_state(entity_id)
+            if current is None or domain not in (
+                entity_id.split(".", 1)[0],
+                "homeassistant",
+            ):
+                continue
+            if service == "toggle":
+                target = "off" if current["state"] == "on" else "on"
+            elif service in SERVICE_STATES:
+                target = SERVICE_STATES[service]
+            else:
+                continue
+            changes.append((entity_id, target))
+
+        def apply():
+            for entity_id, target in changes:
+                self.set_state(entity_id, target)
+
+        if self.state_change_delay > 0:
+            threading.Timer(self.state_change_delay, apply).start()
+            return []
+        apply()
+        return [self.get_state(entity_id) for entity_id, _ in changes]
+
+    def areas(self) -> List[Dict]:
+        """Areas derived from the room part of synthetic entity ids."""
+        with self._lock:
+            entity_ids = list(self._states)
+        rows = []
+        for room in ROOMS:
+            prefix = _slug(room) + "_"
+            members = [
+                entity_id
+                for entity_id in entity_ids
+                if entity_id.split(".", 1)[-1].startswith(prefix)
+            ]
+            rows.append({"area_id": _slug(room), "name": room, "entities": members})
+        return rows
+
+    def _states_json(self) -> bytes:
+        with self._lock:
+            if self._states_body is None:
+                self._states_body = json.dumps(
+                    list(self._states.values()), ensure_ascii=False
+                ).encode()
+            return self._states_body
+
+    def _count(self, key: str):
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def _fault(self) -> Optional[str]:
+        """Sleep for the sampled latency and pick an injected fault, if any."""
+        with self._lock:
+            delay = self.latency(self._rng)
+            roll = self._rng.random()
+        if delay > 0 and self._stopping.wait(delay):
+            return "timeout"
+        if roll < self.timeout_rate:
+            return "timeout"
+        if roll < self.timeout_rate + self.error_rate:
+            return "error"
+        return None
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: Union[bytes, Dict, List]):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _prepare(self) -> bool:
+                """Authenticate and apply faults; False if already answered."""
+                path = self.path.split("?", 1)[0]
+                fake._count(f"{self.command} {path}")
+                if fake.token and self.headers.get("Authorization") != (
+                    f"Bearer {fake.token}"
+                ):
+                    self._send(401, {"message": "Unauthorized"})
+                    return False
+                fault = fake._fault()
+                if fault == "timeout":
+                    # Не отвечаем, пока клиент не отвалится по таймауту
+                    fake._stopping.wait(fake.timeout)
+                    self.close_connection = True
+                    return False
+                if fault == "error":
+                    self._send(500, {"message": "Injected error"})
+                    return False
+                return True
+
+            def do_GET(self):
+                if not self._prepare():
+                    return
+                path = unquote(self.path.split("?", 1)[0])
+                if path in ("/api", "/api/"):
+                    self._send(200, {"message": "API running."})
+                elif path == "/api/states":
+                    self._send(200, fake._states_json())
+                elif path.startswith("/api/states/"):
+                    state = fake.get_state(path[len("/api/states/") :])
+                    if state is None:
+                        self._send(404, {"message": "Entity not found."})
+                    else:
+                        self._send(200, state)
+                elif path == "/api/services":
+                    self._send(
+                        200,
+                        [
+                            {
+                                "domain": domain,
+                                "services": {
+                                    "turn_on": {},
+                                    "turn_off": {},
+                                    "toggle": {},
+                                },
+                            }
+                            for domain in TOGGLE_DOMAINS
+                        ],
+                    )
+                else:
+                    self._send(404, {"message": "Not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if not self._prepare():
+                    return
+                try:
+                    data = json.loads(raw) if raw else {}
+                except ValueError:
+                    self._send(400, {"message": "Invalid JSON"})
+                    return
+
+                path = unquote(self.path.split("?", 1)[0])
+                parts = path.strip("/").split("/")
+                if len(parts) == 4 and parts[:2] == ["api", "services"]:
+                    self._send(200, fake.call_service(parts[2], parts[3], data))
+                elif path == "/api/template" and (
+                    data.get("template") == AREAS_TEMPLATE
+                ):
+                    self._send(200, fake.areas())
+                else:
+                    self._send(400, {"message": "Unsupported request"})
+
+        return Handler
+
+    def _start_websocket(self):
+        started = threading.Event()
+        loop = asyncio.new_event_loop()
+        self._ws_loop = loop
+
+        async def serve():
+            from websockets.asyncio.server import serve as ws_serve
+
+            self._ws_server = await ws_serve(
+                self._ws_session, self.host, self.ws_port, max_size=None
+            )
+            self.ws_port = self._ws_server.sockets[0].getsockname()[1]
+            started.set()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(serve())
+            loop.run_forever()
+
+        threading.Thread(target=run, name="fake-ha-websocket", daemon=True).start()
+        if not started.wait(5):
+            raise RuntimeError("Fake Home Assistant WebSocket did not start")
+
+    async def _stop_websocket(self):
+        if self._ws_server is not None:
+            self._ws_server.close()
+            await self._ws_server.wait_closed()
+            self._ws_server = None
+
+    async def _ws_session(self, ws):
+        await ws.send(json.dumps({"type": "auth_required", "ha_version": "fake"}))
+        auth = json.loads(await ws.recv())
+        if self.token and auth.get("access_token") != self.token:
+            await ws.send(json.dumps({"type": "auth_invalid", "message": "Bad token"}))
+            return
+        await ws.send(json.dumps({"type": "auth_ok", "ha_version": "fake"}))
+
+        subscriptions: Dict[str, int] = {}
+        self._ws_clients[ws] = subscriptions
+        try:
+            async for raw in ws:
+                message = json.loads(raw)
+                self._count(f"WS {message.get('type')}")
+                await ws.send(json.dumps(self._ws_result(message, subscriptions)))
+        except Exception as e:
+            logger.debug(f"Fake WebSocket client gone: {e}")
+        finally:
+            self._ws_clients.pop(ws, None)
+
+    def _ws_result(self, message: Dict, subscriptions: Dict[str, int]) -> Dict:
+        message_type = message.get("type")
+        result: object = None
+        if message_type == "subscribe_events":
+            subscriptions[message.get("event_type", "*")] = message["id"]
+        elif message_type == "get_states":
+            result = self.all_states()
+        elif message_type == "config/area_registry/list":
+            result = [
+                {"area_id": row["area_id"], "name": row["name"]} for row in self.areas()
+            ]
+        elif message_type == "config/device_registry/list":
+            result = []
+        elif message_type == "ping":
+            return {"id": message["id"], "type": "pong"}
+        elif message_type == "config/entity_registry/list":
+            result = [
+                {"entity_id": entity_id, "area_id": row["area_id"], "device_id": None}
+                for row in self.areas()
+                for entity_id in row["entities"]
+            ]
+        else:
+            return {
+                "id": message.get("id"),
+                "type": "result",
+                "success": False,
+                "error": {"code": "unknown_command", "message": "Unknown command."},
+            }
+        return {
+            "id": message["id"],
+            "type": "result",
+            "success": True,
+            "result": result,
+        }
+
+    def _broadcast(self, event_type: str, data: Dict):
+        """Send an event to subscribed WebSocket clients (any thread)."""
+        if self._ws_loop is None or not self._ws_clients:
+            return
+
+        async def send():
+            for ws, subscriptions in list(self._ws_clients.items()):
+                subscription_id = subscriptions.get(event_type, subscriptions.get("*"))
+                if subscription_id is None:
+                    continue
+                event = {
+                    "event_type": event_type,
+                    "data": data,
+                    "origin": "LOCAL",
+                    "time_fired": _now(),
+                }
+                try:
+                    await ws.send(
+                        json.dumps(
+                            {"id": subscription_id, "type": "event", "event": event}
+                        )
+                    )
+                except Exception as e:
+                    logger.debug(f"Could not deliver {event_type}: {e}")
+
+        asyncio.run_coroutine_threadsafe(send(), self._ws_loop)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entities", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--latency",
+        default="",
+        help="0.05 | uniform:LOW,HIGH | normal:MEAN,SD | lognormal:MEDIAN,SIGMA "
+        "| exponential:MEAN (seconds)",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--state-change-delay", type=float, default=0.0)
+    parser.add_argument("--websocket", action="store_true")
+    parser.add_argument("--token", default="fake-token")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--ws-port", type=int, default=8124)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeHomeAssistant(
+        entities=args.entities,
+        seed=args.seed,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        state_change_delay=args.state_change_delay,
+        websocket=args.websocket,
+        token=args.token,
+        host=args.host,
+        port=args.port,
+        ws_port=args.ws_port,
+    ).start()
+    for name, value in fake.env().items():
+        print(f"export {name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
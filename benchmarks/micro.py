@@ -0,0 +1,293 @@
+"""
+Micro-benchmarks for the entity processing hot paths
+
+Run from the repository root::
+
+    python -m benchmarks.micro --sizes 100,1000,10000,50000 --output after.json
+    python -m benchmarks.micro --compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+
+# Без фонового обновления метрик и WebSocket: всё время уходит на замеряемый код
+os.environ.setdefault("METRICS_REFRESH_INTERVAL", "0")
+os.environ.setdefault("HA_WEBSOCKET_ENABLED", "false")
+
+from benchmarks.synthetic import generate_states  # noqa: E402
+
+DEFAULT_SIZES = (100, 1000, 10000, 50000)
+
+Setup = Callable[[List[Dict]], Callable[[], Any]]
+BENCHMARKS: Dict[str, Setup] = {}
+
+
+def benchmark(name: str):
+    """Register ``setup(states) -> run`` under ``name``."""
+
+    def decorator(setup: Setup) -> Setup:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+def _live_store(api, states: List[Dict]):
+    """Install ``states`` in a client's store so it never reloads from HA."""
+    api.state_store.replace(states)
+    api.state_store.set_live(True)
+
+
+def _sync_client(states: List[Dict]):
+    from home_assistant import HomeAssistantAPI
+
+    api = HomeAssistantAPI()
+    _live_store(api, states)
+    return api
+
+
+@benchmark("get_lights")
+def bench_get_lights(states):
+    return _sync_client(states).get_lights
+
+
+@benchmark("get_switches")
+def bench_get_switches(states):
+    return _sync_client(states).get_switches
+
+
+@benchmark("get_sensors")
+def bench_get_sensors(states):
+    return _sync_client(states).get_sensors
+
+
+@benchmark("get_lights.reload")
+def bench_get_lights_reload(states):
+    api = _sync_client(states)
+
+    def run():
+        # Новый снимок: индекс домена строится заново
+        api.state_store.replace(states)
+        api.get_lights()
+
+    return run
+
+
+class _FakeMessage:
+    """Stands in for a Telegram message; keeps the last rendered text."""
+
+    text = ""
+
+    async def reply_text(self, text, **kwargs):
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        self.text = text
+
+
+def _bot_handler(
+    handler_name: str, states: List[Dict], args: List[str], cached: bool = False
+):
+    import bot
+
+    _live_store(bot.ha_api, states)
+    handler = getattr(bot, handler_name)
+    update = SimpleNamespace(
+        effective_user=SimpleNamespace(id=1),
+        effective_chat=SimpleNamespace(id=1),
+        message=_FakeMessage(),
+    )
+    context = SimpleNamespace(args=args)
+    loop = asyncio.new_event_loop()
+
+    def run():
+        if not cached:
+            # Иначе после прогрева замеряется только попадание в кэш страниц
+            bot.page_cache.clear()
+        loop.run_until_complete(handler(update, context))
+
+    return run
+
+
+@benchmark("bot.lights_page")
+def bench_bot_lights(states):
+    return _bot_handler("lights", states, ["3"])
+
+
+@benchmark("bot.lights_page.cached")
+def bench_bot_lights_cached(states):
+    return _bot_handler("lights", states, ["3"], cached=True)
+
+
+@benchmark("bot.sensors_page")
+def bench_bot_sensors(states):
+    return _bot_handler("sensors", states, ["3"])
+
+
+def _app(states: List[Dict]):
+    import app
+
+    _live_store(app.ha_api, states)
+    return app
+
+
+@benchmark("update_homeassistant_metrics")
+def bench_update_homeassistant_metrics(states):
+    return _app(states)._update_homeassistant_metrics
+
+
+@benchmark("generate_latest")
+def bench_generate_latest(states):
+    from prometheus_client import REGISTRY
+    from prometheus_client import generate_latest
+
+    # Коллектор device_status читает снимок из app.ha_api
+    _app(states)
+    return lambda: generate_latest(REGISTRY)
+
+
+def measure(run: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Time ``repeat`` calls after one warm-up call."""
+    run()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "repeat": repeat,
+        "min_ms": round(min(samples), 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "max_ms": round(max(samples), 4),
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(sizes, names=None, repeat: int = 5, seed: int = 0) -> Dict[str, Any]:
+    """Run the selected benchmarks for every size; returns the report."""
+    names = names or list(BENCHMARKS)
+    results = []
+    for size in sizes:
+        states = generate_states(size, seed=seed)
+        for name in names:
+            stats = measure(BENCHMARKS[name](states), repeat)
+            results.append({"name": name, "entities": size, **stats})
+            print(
+                f"{name:32} {size:>7} entities  median {stats['median_ms']:10.3f} ms",
+                file=sys.stderr,
+            )
+    return {
+        "meta": {
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Median ratios for benchmarks present in both reports."""
+    baseline = {(r["name"], r["entities"]): r for r in before["results"]}
+    rows = []
+    for result in after["results"]:
+        old = baseline.get((result["name"], result["entities"]))
+        if old is None:
+            continue
+        rows.append(
+            {
+                "name": result["name"],
+                "entities": result["entities"],
+                "before_ms": old["median_ms"],
+                "after_ms": result["median_ms"],
+                "ratio": round(result["median_ms"] / max(old["median_ms"], 1e-9), 3),
+            }
+        )
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(size) for size in DEFAULT_SIZES),
+        help="comma-separated entity counts",
+    )
+    parser.add_argument(
+        "--only", default="", help="comma-separated benchmark names (default: all)"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BEFORE", "AFTER"),
+        help="compare two JSON reports instead of running",
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+        for row in compare(before, after):
+            print(
+                f"{row['name']:32} {row['entities']:>7}  "
+                f"{row['before_ms']:10.3f} -> {row['after_ms']:10.3f} ms  "
+                f"x{row['ratio']}"
+            )
+        return 0
+
+    names = [name for name in args.only.split(",") if name]
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    # Модули приложения при импорте включают DEBUG - логи исказили бы замеры
+    logging.disable(logging.WARNING)
+    report = run_benchmarks(
+        [int(size) for size in args.sizes.split(",")],
+        names=names,
+        repeat=args.repeat,
+        seed=args.seed,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
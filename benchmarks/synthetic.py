@@ -0,0 +1,208 @@
+"""
+Synthetic Home Assistant states for benchmarks and load tests
+"""
+
+import json
+import random
+import string
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from typing import Dict
+from typing import List
+from typing import Optional
+
+# Доли доменов, похожие на типичную установку Home Assistant
+DEFAULT_MIX = {
+    "sensor": 0.42,
+    "binary_sensor": 0.14,
+    "light": 0.14,
+    "switch": 0.1,
+    "automation": 0.08,
+    "media_player": 0.03,
+    "climate": 0.03,
+    "person": 0.02,
+    "update": 0.04,
+}
+
+ROOMS = [
+    "Kitchen",
+    "Living Room",
+    "Bedroom",
+    "Kids Room",
+    "Bathroom",
+    "Hallway",
+    "Office",
+    "Garage",
+    "Garden",
+    "Basement",
+    "Гостиная",
+    "Спальня",
+]
+
+LIGHT_EFFECTS = [
+    "None",
+    "Colorloop",
+    "Random",
+    "Candle",
+    "Fireplace",
+    "Sunrise",
+    "Sparkle",
+    "Opal",
+    "Glisten",
+    "Prism",
+]
+
+SENSOR_KINDS = [
+    ("temperature", "°C", "measurement"),
+    ("humidity", "%", "measurement"),
+    ("power", "W", "measurement"),
+    ("energy", "kWh", "total_increasing"),
+    ("illuminance", "lx", "measurement"),
+    ("battery", "%", "measurement"),
+    ("voltage", "V", "measurement"),
+]
+
+MEDIA_SOURCES = [f"Source {n}" for n in range(1, 25)]
+
+
+def _context(rng: random.Random) -> Dict:
+    alphabet = string.ascii_uppercase + string.digits
+    return {
+        "id": "".join(rng.choices(alphabet, k=26)),
+        "parent_id": None,
+        "user_id": None,
+    }
+
+
+def _attributes(domain: str, name: str, rng: random.Random) -> Dict:
+    """Attributes of roughly the size real integrations report."""
+    attributes: Dict = {"friendly_name": name}
+    if domain == "light":
+        hue = rng.uniform(0, 360)
+        attributes.update(
+            {
+                "min_color_temp_kelvin": 2202,
+                "max_color_temp_kelvin": 6535,
+                "min_mireds": 153,
+                "max_mireds": 454,
+                "effect_list": LIGHT_EFFECTS,
+                "supported_color_modes": ["color_temp", "xy"],
+                "color_mode": "xy",
+                "brightness": rng.randint(1, 255),
+                "color_temp": None,
+                "hs_color": [round(hue, 3), round(rng.uniform(0, 100), 3)],
+                "rgb_color": [rng.randint(0, 255) for _ in range(3)],
+                "xy_color": [round(rng.random(), 4), round(rng.random(), 4)],
+                "effect": "None",
+                "mode": "normal",
+                "dynamics": "none",
+                "supported_features": 44,
+            }
+        )
+    elif domain == "sensor":
+        device_class, unit, state_class = rng.choice(SENSOR_KINDS)
+        attributes.update(
+            {
+                "state_class": state_class,
+                "unit_of_measurement": unit,
+                "device_class": device_class,
+            }
+        )
+    elif domain == "binary_sensor":
+        attributes["device_class"] = rng.choice(["motion", "door", "window", "smoke"])
+    elif domain == "switch":
+        attributes["icon"] = "mdi:power-socket-eu"
+    elif domain == "automation":
+        attributes.update(
+            {
+                "id": str(rng.randint(10**12, 10**13)),
+                "last_triggered": None,
+                "mode": "single",
+                "current": 0,
+            }
+        )
+    elif domain == "media_player":
+        attributes.update(
+            {
+                "source_list": MEDIA_SOURCES,
+                "volume_level": round(rng.random(), 2),
+                "is_volume_muted": False,
+                "media_content_type": "music",
+                "media_title": " ".join(rng.choices(LIGHT_EFFECTS, k=4)),
+                "supported_features": 152461,
+            }
+        )
+    elif domain == "climate":
+        attributes.update(
+            {
+                "hvac_modes": ["off", "heat", "cool", "auto"],
+                "min_temp": 7,
+                "max_temp": 35,
+                "current_temperature": round(rng.uniform(15, 28), 1),
+                "temperature": 21,
+                "supported_features": 385,
+            }
+        )
+    elif domain == "update":
+        attributes.update(
+            {
+                "installed_version": "1.0.0",
+                "latest_version": "1.0.1",
+                "release_summary": "Bug fixes and improvements. " * 8,
+                "release_url": "https://example.com/releases",
+            }
+        )
+    return attributes
+
+
+def _state_value(domain: str, attributes: Dict, rng: random.Random) -> str:
+    if domain in ("light", "switch", "binary_sensor", "automation"):
+        return rng.choices(["on", "off", "unavailable"], weights=[45, 50, 5])[0]
+    if domain == "sensor":
+        return f"{rng.uniform(0, 1000):.2f}"
+    if domain == "media_player":
+        return rng.choice(["playing", "paused", "idle", "off"])
+    if domain == "climate":
+        return rng.choice(["heat", "off", "auto"])
+    if domain == "person":
+        return rng.choice(["home", "not_home"])
+    return rng.choice(["on", "off"])
+
+
+def generate_states(
+    count: int, seed: int = 0, mix: Optional[Dict[str, float]] = None
+) -> List[Dict]:
+    """Deterministic list of ``count`` states shaped like ``/api/states``."""
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    domains = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    counters: Dict[str, int] = {}
+    states = []
+
+    for domain in domains:
+        counters[domain] = counters.get(domain, 0) + 1
+        number = counters[domain]
+        room = ROOMS[number % len(ROOMS)]
+        name = f"{room} {domain.replace('_', ' ').title()} {number}"
+        object_id = f"{room.lower().replace(' ', '_')}_{domain}_{number}"
+        attributes = _attributes(domain, name, rng)
+        changed = (started + timedelta(seconds=rng.randint(0, 10**7))).isoformat()
+        states.append(
+            {
+                "entity_id": f"{domain}.{object_id}",
+                "state": _state_value(domain, attributes, rng),
+                "attributes": attributes,
+                "last_changed": changed,
+                "last_reported": changed,
+                "last_updated": changed,
+                "context": _context(rng),
+            }
+        )
+    return states
+
+
+def states_body(states: List[Dict]) -> bytes:
+    """``/api/states`` response body for ``states``."""
+    return json.dumps(states, ensure_ascii=False).encode()
@@ -0,0 +1,332 @@
+"""
+End-to-end throughput benchmark of the bot with simulated Telegram traffic
+
+Synthetic command updates are fed into the Application from
+``bot.build_application`` at a fixed rate across several chats. Bot API
+calls go to an in-memory transport and Home Assistant is the local fake::
+
+    python -m benchmarks.throughput --rate 50 --chats 20 --commands 1000 \\
+        --entities 5000 --latency 0.02 --output throughput.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from telegram import Update
+from telegram.ext import TypeHandler
+from telegram.request import BaseRequest
+from telegram.request import RequestData
+
+os.environ.setdefault("METRICS_REFRESH_INTERVAL", "0")
+os.environ.setdefault("HA_WEBSOCKET_ENABLED", "false")
+# Лимиты Telegram на отправку замеряют отдельно: по умолчанию мерим сам бот
+os.environ.setdefault("TELEGRAM_RATE_LIMIT", "false")
+
+from benchmarks.fake_ha import FakeHomeAssistant  # noqa: E402
+
+BOT_TOKEN = "123456:FAKE-benchmark-token"
+BOT_USER = {
+    "id": 123456,
+    "is_bot": True,
+    "first_name": "Benchmark",
+    "username": "benchmark_bot",
+}
+
+# Доли команд в синтетическом трафике
+DEFAULT_MIX = {
+    "lights": 0.25,
+    "status": 0.2,
+    "sensors": 0.15,
+    "switches": 0.1,
+    "light_on": 0.1,
+    "light_off": 0.1,
+    "room": 0.05,
+    "help": 0.05,
+}
+
+# Интервал, с которым сторож меряет задержку цикла событий
+LOOP_PROBE_INTERVAL = 0.005
+
+
+class FakeBotTransport(BaseRequest):
+    """In-memory Bot API: answers every method without network I/O."""
+
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self.error_replies = 0
+        self._message_id = 0
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        parameters = request_data.parameters if request_data else {}
+
+        if api_method == "getMe":
+            result: Any = BOT_USER
+        elif api_method in ("sendMessage", "editMessageText"):
+            text = str(parameters.get("text", ""))
+            if text.startswith("❌"):
+                self.error_replies += 1
+            self._message_id += 1
+            result = {
+                "message_id": parameters.get("message_id", self._message_id),
+                "date": int(time.time()),
+                "chat": {"id": parameters.get("chat_id"), "type": "private"},
+                "from": BOT_USER,
+                "text": text,
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def _command_args(command: str, lights: List[str], rng: random.Random) -> List[str]:
+    if command in ("light_on", "light_off"):
+        return [rng.choice(lights)]
+    if command in ("lights", "sensors", "switches"):
+        return [str(rng.randint(1, 3))]
+    if command == "room":
+        return ["Kitchen"]
+    return []
+
+
+def make_update(update_id: int, chat_id: int, text: str, bot) -> Update:
+    """Private-chat command message as Telegram would deliver it."""
+    command = text.split()[0]
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+                "text": text,
+                "entities": [
+                    {"type": "bot_command", "offset": 0, "length": len(command)}
+                ],
+            },
+        },
+        bot,
+    )
+
+
+class LoopMonitor:
+    """Measures how late the event loop wakes a periodic probe."""
+
+    def __init__(self, interval: float = LOOP_PROBE_INTERVAL):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _probe(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._probe())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def report(self) -> Dict[str, float]:
+        lags = self.lags or [0.0]
+        return {
+            "max_ms": round(max(lags) * 1000, 3),
+            "p99_ms": round(percentile(lags, 99) * 1000, 3),
+            # Суммарное время, когда цикл был занят дольше 10 мс подряд
+            "blocked_ms": round(sum(lag for lag in lags if lag > 0.01) * 1000, 3),
+        }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def _latency_stats(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+async def run_throughput(
+    commands: int = 200,
+    rate: float = 50.0,
+    chats: int = 10,
+    mix: Optional[Dict[str, float]] = None,
+    seed: int = 0,
+    fake: Optional[FakeHomeAssistant] = None,
+    timeout: float = 120.0,
+) -> Dict[str, Any]:
+    """Feed ``commands`` updates at ``rate`` per second and collect the report.
+
+    ``fake`` must be a started ``FakeHomeAssistant``.
+    """
+    import bot
+    from async_home_assistant import AsyncHomeAssistantAPI
+
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    states = fake.all_states()
+    lights = [
+        state["entity_id"]
+        for state in states
+        if state["entity_id"].startswith("light.")
+    ]
+
+    bot.ha_api = AsyncHomeAssistantAPI(base_url=fake.base_url, token=fake.token)
+    transport = FakeBotTransport()
+    application = bot.build_application(BOT_TOKEN, request=transport)
+
+    sent_at: Dict[int, Tuple[str, float]] = {}
+    latencies: Dict[str, List[float]] = {}
+    done_feeding = asyncio.Event()
+    finished = asyncio.Event()
+
+    async def record_done(update: Update, context):
+        # Группа 1 выполняется после обработчика команды из группы 0,
+        # в том числе когда тот упал с исключением
+        command, started = sent_at.pop(update.update_id)
+        latencies.setdefault(command, []).append(time.perf_counter() - started)
+        if not sent_at and done_feeding.is_set():
+            finished.set()
+
+    application.add_handler(TypeHandler(Update, record_done), group=1)
+
+    monitor = LoopMonitor()
+    await application.initialize()
+    await application.start()
+    monitor.start()
+    started = time.perf_counter()
+    try:
+        names = list(mix)
+        weights = list(mix.values())
+        for update_id in range(1, commands + 1):
+            # Открытая модель нагрузки: команды идут по расписанию, не дожидаясь ответов
+            delay = started + (update_id - 1) / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            command = rng.choices(names, weights)[0]
+            chat_id = 1000 + (update_id % chats)
+            text = " ".join([f"/{command}", *_command_args(command, lights, rng)])
+            update = make_update(update_id, chat_id, text, application.bot)
+            sent_at[update_id] = (command, time.perf_counter())
+            await application.update_queue.put(update)
+        done_feeding.set()
+        if sent_at:
+            await asyncio.wait_for(finished.wait(), timeout)
+    finally:
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+        await application.stop()
+        await application.shutdown()
+        await bot.ha_api.close()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "config": {
+            "commands": commands,
+            "rate": rate,
+            "chats": chats,
+            "seed": seed,
+            "entities": len(states),
+        },
+        "completed": len(all_latencies),
+        "elapsed_s": round(elapsed, 3),
+        "commands_per_second": round(len(all_latencies) / elapsed, 2),
+        "latency": _latency_stats(all_latencies),
+        "latency_by_command": {
+            command: _latency_stats(values)
+            for command, values in sorted(latencies.items())
+        },
+        "event_loop_lag": monitor.report(),
+        "bot_api_calls": dict(sorted(transport.calls.items())),
+        "error_replies": transport.error_replies,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--commands", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=50.0, help="commands/second")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--entities", type=int, default=1000)
+    parser.add_argument("--latency", default="", help="fake HA latency spec")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    with FakeHomeAssistant(
+        entities=args.entities,
+        seed=args.seed,
+        latency=args.latency,
+        error_rate=args.error_rate,
+    ) as fake:
+        report = asyncio.run(
+            run_throughput(
+                commands=args.commands,
+                rate=args.rate,
+                chats=args.chats,
+                seed=args.seed,
+                fake=fake,
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
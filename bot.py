@@ -1,23 +1,116 @@
+import asyncio
 import logging
 import os
+from collections import OrderedDict
+from typing import Optional
+from typing import Tuple
 
+from telegram import InlineKeyboardButton
+from telegram import InlineKeyboardMarkup
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import Application
+from telegram.ext import CallbackQueryHandler
 from telegram.ext import CommandHandler
 from telegram.ext import ContextTypes
 from telegram.ext import MessageHandler
 from telegram.ext import filters
+from telegram.request import BaseRequest
 
-from home_assistant import HomeAssistantAPI
-
+from async_home_assistant import AsyncHomeAssistantAPI
+from entities import get_domain
+from entities import is_pattern
+from live_updates import LiveUpdater
+from metrics import metrics_collector
 from metrics import track_telegram_command
+from rate_limiter import rate_limiter_from_env
+from subscriptions import SubscriptionRegistry
+from subscriptions import WatchDispatcher
+from subscriptions import normalize_pattern
+from tracing import span
+from update_processor import update_processor_from_env
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 # Initialize Home Assistant API
-ha_api = HomeAssistantAPI()
+ha_api = AsyncHomeAssistantAPI()
+
+
+# Сколько entity_id перечислять в ответе на групповую команду
+BULK_REPLY_LIMIT = 20
+
+
+def is_bulk_request(args) -> bool:
+    """Whether command arguments name several devices or a glob pattern."""
+    return len(args) > 1 or is_pattern(args[0])
+
+
+def format_entity_list(entity_ids) -> str:
+    """Render entity_ids for a reply, truncating very long lists."""
+    shown = ", ".join(f"`{entity_id}`" for entity_id in entity_ids[:BULK_REPLY_LIMIT])
+    if len(entity_ids) > BULK_REPLY_LIMIT:
+        shown += f" и ещё {len(entity_ids) - BULK_REPLY_LIMIT}"
+    return shown
+
+
+async def reply_bulk_command(
+    update: Update, args, service: str, domain: str, done_text: str, failed_text: str
+) -> None:
+    """Run a command for several devices and answer with one message."""
+    try:
+        result = await ha_api.bulk_command(service, args, (domain,))
+    except Exception as e:
+        logger.error(f"Bulk {domain}.{service} command error: {e}")
+        await update.message.reply_text(f"❌ Ошибка групповой команды: {str(e)}")
+        return
+
+    await update.message.reply_text(
+        format_command_result(result, done_text, failed_text), parse_mode="Markdown"
+    )
+
+
+def format_command_result(result, done_text: str, failed_text: str) -> str:
+    """One aggregated reply for a command sent to several devices."""
+    sections = []
+    if result["succeeded"]:
+        sections.append(
+            f"✅ {done_text}: {len(result['succeeded'])}\n"
+            f"{format_entity_list(result['succeeded'])}"
+        )
+    if result["failed"]:
+        sections.append(
+            f"❌ {failed_text}: {len(result['failed'])}\n"
+            f"{format_entity_list(result['failed'])}"
+        )
+    if result.get("unmatched"):
+        sections.append(f"❓ Не найдено: {format_entity_list(result['unmatched'])}")
+    if not sections:
+        sections.append("❓ Подходящие устройства не найдены")
+    return "\n\n".join(sections)
+
+
+# Живые сообщения /status и списков, обновляемые при изменении состояний
+live_updater = LiveUpdater.from_env()
+
+LIVE_STOP_BUTTON = InlineKeyboardButton("⏹ Остановить", callback_data="live:stop")
+LIVE_STOP_KEYBOARD = InlineKeyboardMarkup([[LIVE_STOP_BUTTON]])
+
+
+def is_live_request(context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Whether the command asks for a live message (`/status live`)."""
+    return any(arg.lower() == "live" for arg in context.args or ())
+
+
+def message_key(message) -> Tuple:
+    return (message.chat_id, message.message_id)
+
+
+def with_live_stop(keyboard: Optional[InlineKeyboardMarkup]) -> InlineKeyboardMarkup:
+    """The keyboard plus a row with the button that stops live updates."""
+    rows = list(keyboard.inline_keyboard) if keyboard is not None else []
+    return InlineKeyboardMarkup(rows + [[LIVE_STOP_BUTTON]])
 
 
 @track_telegram_command("start")
@@ -61,10 +154,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 🤖 *Справка по командам Home Assistant Bot*
 
 📊 *Информация о системе:*
-/status - Показать статус системы Home Assistant
-/sensors \[номер_страницы\] - Показания датчиков
-/lights \[номер_страницы\] - Список светильников
-/switches \[номер_страницы\] - Список выключателей
+/status \[live\] - Показать статус системы Home Assistant
+/sensors \[номер_страницы\] \[live\] - Показания датчиков
+/lights \[номер_страницы\] \[live\] - Список светильников
+/switches \[номер_страницы\] \[live\] - Список выключателей
 
 💡 *Управление освещением:*
 /light_on <entity_id> - Включить светильник
@@ -74,34 +167,45 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 /switch_on <entity_id> - Включить выключатель
 /switch_off <entity_id> - Выключить выключатель
 
+🏠 *Зоны:*
+/room <зона> - Состояние всех устройств зоны
+/room <зона> on|off - Включить или выключить весь свет и выключатели зоны
+
+🔔 *Уведомления:*
+/watch <entity_id|домен|шаблон> - Сообщать об изменениях состояния
+/watch - Список подписок
+/unwatch <entity_id>|all - Отменить подписку
+
+*Несколько устройств сразу:* укажите несколько `entity_id` или шаблон со `*`
+
 *Примеры использования:*
 `/lights` - первая страница световых устройств
 `/lights 2` - вторая страница
+`/status live` - статус, который обновляется сам
 `/light_on light.kitchen` - включить свет на кухне
-`/switch_off switch.garden_lights` - выключить садовое освещение
+`/light_off light.kitchen_*` - выключить весь свет на кухне
+`/switch_off switch.garden_lights switch.pump` - выключить два выключателя
+
+📄 *Навигация:* В списках устройств используйте кнопки ⬅️ ➡️ для перехода между страницами
 
-📄 *Навигация:* В списках устройств используйте ссылки ⬅️ ➡️ для перехода между страницами
+🔄 *Живой режим:* с `live` сообщение обновляется при изменении состояний, кнопка ⏹ останавливает обновление
     """
     await update.message.reply_text(help_text, parse_mode="Markdown")
 
 
-@track_telegram_command("status")
-async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show Home Assistant status."""
-    try:
-        states = ha_api.get_all_states()
-        if states:
-            lights_count = len(
-                [s for s in states if s.get("entity_id", "").startswith("light.")]
-            )
-            switches_count = len(
-                [s for s in states if s.get("entity_id", "").startswith("switch.")]
-            )
-            sensors_count = len(
-                [s for s in states if s.get("entity_id", "").startswith("sensor.")]
-            )
+def render_status(states) -> str:
+    """Status text without the timestamp, so unchanged counts hash the same."""
+    lights_count = len(
+        [s for s in states if s.get("entity_id", "").startswith("light.")]
+    )
+    switches_count = len(
+        [s for s in states if s.get("entity_id", "").startswith("switch.")]
+    )
+    sensors_count = len(
+        [s for s in states if s.get("entity_id", "").startswith("sensor.")]
+    )
 
-            status_message = f"""
+    return f"""
 🏠 *Home Assistant Status*
 
 ✅ Connected and operational
@@ -109,77 +213,363 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 💡 Lights: {lights_count}
 🔌 Switches: {switches_count}
 📡 Sensors: {sensors_count}
+"""
 
-🕐 Last updated: {ha_api.get_current_time()}
-            """
-        else:
-            status_message = "❌ Unable to connect to Home Assistant"
 
-        await update.message.reply_text(status_message, parse_mode="Markdown")
+def status_footer() -> str:
+    """Timestamp line appended to /status outside the content hash."""
+    return f"\n🕐 Last updated: {ha_api.get_current_time()}\n"
+
+
+@track_telegram_command("status")
+async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show Home Assistant status; `/status live` keeps it updated."""
+    live = is_live_request(context)
+    try:
+        states = await ha_api.get_all_states()
+        if not states:
+            await update.message.reply_text("❌ Unable to connect to Home Assistant")
+            return
+
+        text = render_status(states)
+        if not live:
+            await update.message.reply_text(
+                text + status_footer(), parse_mode="Markdown"
+            )
+            return
+
+        message = await update.message.reply_text(
+            text + status_footer(),
+            parse_mode="Markdown",
+            reply_markup=LIVE_STOP_KEYBOARD,
+        )
+        start_live_status(message, text)
     except Exception as e:
         logger.error(f"Status command error: {e}")
         await update.message.reply_text(f"❌ Error getting status: {str(e)}")
 
 
-@track_telegram_command("lights")
-async def lights(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """List all lights and their states with pagination."""
-    try:
-        # Определяем страницу из аргументов команды
-        page = 1
-        if context.args and context.args[0].isdigit():
-            page = max(1, int(context.args[0]))
+def start_live_status(message, text: str) -> None:
+    """Keep a sent /status message updated."""
 
-        # Отправляем сообщение о загрузке
-        loading_msg = await update.message.reply_text(
-            "🔄 Получаю информацию о световых устройствах..."
-        )
+    async def render():
+        states = await ha_api.get_all_states()
+        if not states:
+            return None
+        return render_status(states), LIVE_STOP_KEYBOARD
+
+    async def edit(text, keyboard):
+        await message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
 
-        lights_data = ha_api.get_lights()
-        if not lights_data:
-            await loading_msg.edit_text(
-                "💡 Световые устройства не найдены или нет подключения к Home Assistant.\n\nПопробуйте команду /status для проверки соединения."
+    async def finish():
+        states = await ha_api.get_all_states()
+        if states:
+            await message.edit_text(
+                render_status(states) + status_footer(), parse_mode="Markdown"
             )
-            return
 
-        # Настройки пагинации
-        per_page = 8
-        total_pages = (len(lights_data) + per_page - 1) // per_page
-        page = min(page, total_pages)  # Не превышаем максимальную страницу
+    live_updater.watch_store(ha_api.state_store)
+    live_updater.start(
+        message.chat_id,
+        message_key(message),
+        render,
+        edit,
+        footer=status_footer,
+        finish=finish,
+        sent=(text, LIVE_STOP_KEYBOARD),
+    )
+
+
+# Сколько отрисованных страниц списков держать в кэше
+PAGE_CACHE_SIZE = 256
+
+
+def render_lights_page(items, page: int, total_pages: int, total: int) -> str:
+    """Text of one /lights page."""
+    message = f"💡 *Световые устройства* (стр. {page}/{total_pages}):\n\n"
+
+    for light in items:
+        state_emoji = "🟢" if light["state"] == "on" else "🔴"
+        if light["state"] == "unavailable":
+            state_emoji = "⚫"
 
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        page_lights = lights_data[start_idx:end_idx]
+        friendly_name = light["friendly_name"]
+        if len(friendly_name) > 25:  # Обрезаем длинные имена
+            friendly_name = friendly_name[:22] + "..."
+
+        message += f"{state_emoji} {friendly_name}\n"
+        message += f"   `{light['entity_id']}`\n\n"
+
+    message += f"\n📄 {page}/{total_pages}\n\n"
+    message += f"Всего устройств: {total}\n\n"
+    message += "_Управление:_\n"
+    message += "`/light_on entity_id` - включить\n"
+    message += "`/light_off entity_id` - выключить"
+    return message
+
+
+def render_switches_page(items, page: int, total_pages: int, total: int) -> str:
+    """Text of one /switches page."""
+    message = f"🔌 *Переключатели* (стр. {page}/{total_pages}):\n\n"
+
+    for switch in items:
+        state_emoji = "🟢" if switch["state"] == "on" else "🔴"
+        if switch["state"] == "unavailable":
+            state_emoji = "⚫"
+
+        friendly_name = switch["friendly_name"]
+        if len(friendly_name) > 25:
+            friendly_name = friendly_name[:22] + "..."
+
+        message += f"{state_emoji} {friendly_name}\n"
+        message += f"   `{switch['entity_id']}`\n\n"
+
+    message += f"\n📄 {page}/{total_pages}\n\n"
+    message += f"Всего устройств: {total}\n\n"
+    message += "_Управление:_\n"
+    message += "`/switch_on entity_id` - включить\n"
+    message += "`/switch_off entity_id` - выключить"
+    return message
+
+
+def render_sensors_page(items, page: int, total_pages: int, total: int) -> str:
+    """Text of one /sensors page."""
+    message = f"📡 *Показания датчиков* (стр. {page}/{total_pages}):\n\n"
+
+    for sensor in items:
+        friendly_name = sensor["friendly_name"]
+        if len(friendly_name) > 25:
+            friendly_name = friendly_name[:22] + "..."
+
+        state = sensor["state"]
+        unit = sensor.get("unit", "")
+
+        # Обрезаем слишком длинные значения
+        if len(str(state)) > 15:
+            state = str(state)[:12] + "..."
+
+        message += f"📊 {friendly_name}\n"
+        message += f"   `{sensor['entity_id']}`\n"
+        message += f"   📈 {state} {unit}\n\n"
+
+    message += f"\n📄 {page}/{total_pages}\n\n"
+    message += f"Всего датчиков: {total}"
+    return message
+
+
+class ListView:
+    """One paginated entity list (/lights, /switches, /sensors)."""
+
+    def __init__(self, domain, per_page, loading_text, empty_text, render):
+        self.domain = domain
+        self.per_page = per_page
+        self.loading_text = loading_text
+        self.empty_text = empty_text
+        self.render = render
+
+
+LIST_VIEWS = {
+    "light": ListView(
+        "light",
+        8,
+        "🔄 Получаю информацию о световых устройствах...",
+        "💡 Световые устройства не найдены или нет подключения к Home Assistant.\n\nПопробуйте команду /status для проверки соединения.",
+        render_lights_page,
+    ),
+    "switch": ListView(
+        "switch",
+        8,
+        "🔄 Получаю информацию о переключателях...",
+        "🔌 Переключатели не найдены или нет подключения к Home Assistant.\n\nПопробуйте команду /status для проверки соединения.",
+        render_switches_page,
+    ),
+    "sensor": ListView(
+        "sensor",
+        6,  # Меньше элементов для датчиков (больше информации)
+        "🔄 Получаю показания датчиков...",
+        "📡 Датчики не найдены или нет подключения к Home Assistant.\n\nПопробуйте команду /status для проверки соединения.",
+        render_sensors_page,
+    ),
+}
+
+
+def page_keyboard(domain: str, page: int, total_pages: int) -> InlineKeyboardMarkup:
+    """⬅️/➡️ buttons that flip the list in place."""
+    row = []
+    if page > 1:
+        row.append(
+            InlineKeyboardButton("⬅️", callback_data=f"page:{domain}:{page - 1}")
+        )
+    row.append(
+        InlineKeyboardButton(f"📄 {page}/{total_pages}", callback_data="page:noop")
+    )
+    if page < total_pages:
+        row.append(
+            InlineKeyboardButton("➡️", callback_data=f"page:{domain}:{page + 1}")
+        )
+    return InlineKeyboardMarkup([row])
 
-        message = f"💡 *Световые устройства* (стр. {page}/{total_pages}):\n\n"
 
-        for light in page_lights:
-            state_emoji = "🟢" if light["state"] == "on" else "🔴"
-            if light["state"] == "unavailable":
-                state_emoji = "⚫"
+class PageCache:
+    """Rendered list pages keyed by domain, page and the domain's version.
 
-            friendly_name = light["friendly_name"]
-            if len(friendly_name) > 25:  # Обрезаем длинные имена
-                friendly_name = friendly_name[:22] + "..."
+    A change to the domain's entities makes older entries unreachable; they
+    age out of the LRU instead of being invalidated explicitly. Reloads and
+    live events that leave the domain unchanged keep the entries valid. In
+    REST mode a flip after the state TTL still reloads the states once to
+    learn whether the domain changed.
+    """
 
-            message += f"{state_emoji} {friendly_name}\n"
-            message += f"   `{light['entity_id']}`\n\n"
+    def __init__(self, limit: int = PAGE_CACHE_SIZE):
+        self.limit = limit
+        self._pages: "OrderedDict[Tuple, Tuple[str, InlineKeyboardMarkup]]" = (
+            OrderedDict()
+        )
+
+    def get(self, key: Tuple) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+        page = self._pages.get(key)
+        if page is not None:
+            self._pages.move_to_end(key)
+        return page
+
+    def put(self, key: Tuple, page: Tuple[str, InlineKeyboardMarkup]):
+        self._pages[key] = page
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.limit:
+            self._pages.popitem(last=False)
+
+    def clear(self):
+        self._pages.clear()
+
+
+page_cache = PageCache()
+
+
+def cached_list_page(
+    view: ListView, page: int
+) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """Rendered page if the domain's entities have not changed since it was drawn."""
+    store = ha_api.state_store
+    if not store.is_fresh():
+        return None
+    rendered = page_cache.get((view.domain, page, store.domain_version(view.domain)))
+    metrics_collector.record_page_cache(rendered is not None)
+    return rendered
+
+
+async def render_list_page(
+    view: ListView, page: int
+) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """Text and keyboard of a list page; ``None`` when there is nothing to show."""
+    rendered = cached_list_page(view, page)
+    if rendered is not None:
+        return rendered
+    if not ha_api.state_store.is_fresh():
+        # Без живого зеркала после TTL состояния перечитываются; если домен
+        # не изменился, страница по-прежнему берётся из кэша
+        await ha_api.get_all_states()
+        rendered = cached_list_page(view, page)
+        if rendered is not None:
+            return rendered
+
+    items, total, shown_page = await ha_api.get_entities_page(
+        view.domain, page, view.per_page
+    )
+    if not total:
+        return None
+
+    with span("render"):
+        total_pages = (total + view.per_page - 1) // view.per_page
+        rendered = (
+            view.render(items, shown_page, total_pages, total),
+            page_keyboard(view.domain, shown_page, total_pages),
+        )
+    # Версию читаем сразу после загрузки: между ними цикл событий не переключался
+    page_cache.put(
+        (view.domain, page, ha_api.state_store.domain_version(view.domain)), rendered
+    )
+    return rendered
+
+
+def page_argument(context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Page number from command arguments (1 by default)."""
+    for arg in context.args or ():
+        if arg.isdigit():
+            return max(1, int(arg))
+    return 1
+
+
+async def reply_list_page(
+    update: Update, view: ListView, page: int, live: bool = False
+) -> None:
+    """Answer a list command; a cached page is sent without the loading message."""
+    rendered = cached_list_page(view, page)
+    if rendered is not None:
+        text, keyboard = rendered
+        if live:
+            keyboard = with_live_stop(keyboard)
+        with span("telegram.send"):
+            message = await update.message.reply_text(
+                text, parse_mode="Markdown", reply_markup=keyboard
+            )
+    else:
+        # Отправляем сообщение о загрузке
+        message = await update.message.reply_text(view.loading_text)
+        rendered = await render_list_page(view, page)
+        if rendered is None:
+            await message.edit_text(view.empty_text)
+            return
 
-        # Добавляем навигацию
-        nav_line = ""
-        if page > 1:
-            nav_line += f"⬅️ `/lights {page - 1}` | "
-        nav_line += f"📄 {page}/{total_pages}"
-        if page < total_pages:
-            nav_line += f" | `/lights {page + 1}` ➡️"
+        text, keyboard = rendered
+        if live:
+            keyboard = with_live_stop(keyboard)
+        with span("telegram.send"):
+            await message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
+
+    if live:
+        start_live_list(message, view, page, (text, keyboard))
+
+
+def start_live_list(message, view: ListView, page: int, sent) -> None:
+    """Keep a sent list page updated while entities of its domain change."""
+
+    async def render():
+        rendered = await render_list_page(view, page)
+        if rendered is None:
+            return None
+        text, keyboard = rendered
+        return text, with_live_stop(keyboard)
+
+    async def edit(text, keyboard):
+        await message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
+
+    async def finish():
+        rendered = await render_list_page(view, page)
+        if rendered is not None:
+            await edit(*rendered)
+
+    live_updater.watch_store(ha_api.state_store)
+    live_updater.start(
+        message.chat_id,
+        message_key(message),
+        render,
+        edit,
+        domains={view.domain},
+        finish=finish,
+        sent=sent,
+    )
 
-        message += f"\n{nav_line}\n\n"
-        message += f"Всего устройств: {len(lights_data)}\n\n"
-        message += "_Управление:_\n"
-        message += "`/light_on entity_id` - включить\n"
-        message += "`/light_off entity_id` - выключить"
 
-        await loading_msg.edit_text(message, parse_mode="Markdown")
+@track_telegram_command("lights")
+async def lights(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """List all lights and their states with pagination."""
+    try:
+        await reply_list_page(
+            update,
+            LIST_VIEWS["light"],
+            page_argument(context),
+            live=is_live_request(context),
+        )
     except Exception as e:
         logger.error(f"Lights command error: {e}")
         error_msg = "❌ Ошибка при получении информации о световых устройствах.\n\n"
@@ -199,31 +589,40 @@ async def light_on(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         return
 
+    if is_bulk_request(context.args):
+        await reply_bulk_command(
+            update,
+            context.args,
+            "turn_on",
+            "light",
+            "Включено световых устройств",
+            "Не удалось включить",
+        )
+        return
+
     entity_id = context.args[0]
     try:
         # Проверим текущее состояние устройства
-        current_state = ha_api.get_entity_state(entity_id)
+        current_state = await ha_api.get_entity_state(entity_id)
         if current_state and current_state.get("state") == "on":
             await update.message.reply_text(
                 f"💡 Устройство `{entity_id}` уже включено", parse_mode="Markdown"
             )
             return
 
-        result = ha_api.turn_on_light(entity_id)
+        result = await ha_api.turn_on_light(entity_id)
 
-        # Дополнительная проверка: проверим фактическое состояние устройства
-        import time
-
-        time.sleep(2)  # Небольшая задержка для обновления состояния
-
-        final_state = ha_api.get_entity_state(entity_id)
-        if final_state and final_state.get("state") == "on":
+        # Дожидаемся фактического состояния, не блокируя остальные чаты
+        confirmed = result and await ha_api.wait_for_state(entity_id, "on")
+        if confirmed:
             await update.message.reply_text(
                 f"✅ Световое устройство `{entity_id}` включено", parse_mode="Markdown"
             )
         elif result:
             await update.message.reply_text(
-                f"✅ Световое устройство `{entity_id}` включено", parse_mode="Markdown"
+                f"✅ Световое устройство `{entity_id}` включено\n\n"
+                "⏳ Устройство пока не подтвердило новое состояние",
+                parse_mode="Markdown",
             )
         else:
             await update.message.reply_text(
@@ -253,31 +652,40 @@ async def light_off(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         return
 
+    if is_bulk_request(context.args):
+        await reply_bulk_command(
+            update,
+            context.args,
+            "turn_off",
+            "light",
+            "Выключено световых устройств",
+            "Не удалось выключить",
+        )
+        return
+
     entity_id = context.args[0]
     try:
         # Проверим текущее состояние устройства
-        current_state = ha_api.get_entity_state(entity_id)
+        current_state = await ha_api.get_entity_state(entity_id)
         if current_state and current_state.get("state") == "off":
             await update.message.reply_text(
                 f"💡 Устройство `{entity_id}` уже выключено", parse_mode="Markdown"
             )
             return
 
-        result = ha_api.turn_off_light(entity_id)
+        result = await ha_api.turn_off_light(entity_id)
 
-        # Дополнительная проверка: проверим фактическое состояние устройства
-        import time
-
-        time.sleep(2)  # Небольшая задержка для обновления состояния
-
-        final_state = ha_api.get_entity_state(entity_id)
-        if final_state and final_state.get("state") == "off":
+        # Дожидаемся фактического состояния, не блокируя остальные чаты
+        confirmed = result and await ha_api.wait_for_state(entity_id, "off")
+        if confirmed:
             await update.message.reply_text(
                 f"✅ Световое устройство `{entity_id}` выключено", parse_mode="Markdown"
             )
         elif result:
             await update.message.reply_text(
-                f"✅ Световое устройство `{entity_id}` выключено", parse_mode="Markdown"
+                f"✅ Световое устройство `{entity_id}` выключено\n\n"
+                "⏳ Устройство пока не подтвердило новое состояние",
+                parse_mode="Markdown",
             )
         else:
             await update.message.reply_text(
@@ -301,60 +709,12 @@ async def light_off(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def switches(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """List all switches and their states with pagination."""
     try:
-        # Определяем страницу из аргументов команды
-        page = 1
-        if context.args and context.args[0].isdigit():
-            page = max(1, int(context.args[0]))
-
-        loading_msg = await update.message.reply_text(
-            "🔄 Получаю информацию о переключателях..."
+        await reply_list_page(
+            update,
+            LIST_VIEWS["switch"],
+            page_argument(context),
+            live=is_live_request(context),
         )
-
-        switches_data = ha_api.get_switches()
-        if not switches_data:
-            await loading_msg.edit_text(
-                "🔌 Переключатели не найдены или нет подключения к Home Assistant.\n\nПопробуйте команду /status для проверки соединения."
-            )
-            return
-
-        # Настройки пагинации
-        per_page = 8
-        total_pages = (len(switches_data) + per_page - 1) // per_page
-        page = min(page, total_pages)
-
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        page_switches = switches_data[start_idx:end_idx]
-
-        message = f"🔌 *Переключатели* (стр. {page}/{total_pages}):\n\n"
-
-        for switch in page_switches:
-            state_emoji = "🟢" if switch["state"] == "on" else "🔴"
-            if switch["state"] == "unavailable":
-                state_emoji = "⚫"
-
-            friendly_name = switch["friendly_name"]
-            if len(friendly_name) > 25:
-                friendly_name = friendly_name[:22] + "..."
-
-            message += f"{state_emoji} {friendly_name}\n"
-            message += f"   `{switch['entity_id']}`\n\n"
-
-        # Добавляем навигацию
-        nav_line = ""
-        if page > 1:
-            nav_line += f"⬅️ `/switches {page - 1}` | "
-        nav_line += f"📄 {page}/{total_pages}"
-        if page < total_pages:
-            nav_line += f" | `/switches {page + 1}` ➡️"
-
-        message += f"\n{nav_line}\n\n"
-        message += f"Всего устройств: {len(switches_data)}\n\n"
-        message += "_Управление:_\n"
-        message += "`/switch_on entity_id` - включить\n"
-        message += "`/switch_off entity_id` - выключить"
-
-        await loading_msg.edit_text(message, parse_mode="Markdown")
     except Exception as e:
         logger.error(f"Switches command error: {e}")
         await update.message.reply_text(
@@ -372,9 +732,20 @@ async def switch_on(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         return
 
+    if is_bulk_request(context.args):
+        await reply_bulk_command(
+            update,
+            context.args,
+            "turn_on",
+            "switch",
+            "Включено переключателей",
+            "Не удалось включить",
+        )
+        return
+
     entity_id = context.args[0]
     try:
-        result = ha_api.turn_on_switch(entity_id)
+        result = await ha_api.turn_on_switch(entity_id)
         if result:
             await update.message.reply_text(
                 f"✅ Switch `{entity_id}` turned on", parse_mode="Markdown"
@@ -398,9 +769,20 @@ async def switch_off(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         )
         return
 
+    if is_bulk_request(context.args):
+        await reply_bulk_command(
+            update,
+            context.args,
+            "turn_off",
+            "switch",
+            "Выключено переключателей",
+            "Не удалось выключить",
+        )
+        return
+
     entity_id = context.args[0]
     try:
-        result = ha_api.turn_off_switch(entity_id)
+        result = await ha_api.turn_off_switch(entity_id)
         if result:
             await update.message.reply_text(
                 f"✅ Switch `{entity_id}` turned off", parse_mode="Markdown"
@@ -418,64 +800,291 @@ async def switch_off(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 async def sensors(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """List sensor readings with pagination."""
     try:
-        # Определяем страницу из аргументов команды
-        page = 1
-        if context.args and context.args[0].isdigit():
-            page = max(1, int(context.args[0]))
-
-        loading_msg = await update.message.reply_text(
-            "🔄 Получаю показания датчиков..."
+        await reply_list_page(
+            update,
+            LIST_VIEWS["sensor"],
+            page_argument(context),
+            live=is_live_request(context),
         )
+    except Exception as e:
+        logger.error(f"Sensors command error: {e}")
+        await update.message.reply_text(f"❌ Ошибка при получении датчиков: {str(e)}")
 
-        sensors_data = ha_api.get_sensors()
-        if not sensors_data:
-            await loading_msg.edit_text(
-                "📡 Датчики не найдены или нет подключения к Home Assistant.\n\nПопробуйте команду /status для проверки соединения."
-            )
-            return
 
-        # Настройки пагинации
-        per_page = 6  # Меньше элементов для датчиков (больше информации)
-        total_pages = (len(sensors_data) + per_page - 1) // per_page
-        page = min(page, total_pages)
+@track_telegram_command("page")
+async def page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Flip a list page in place from the ⬅️/➡️ buttons."""
+    query = update.callback_query
+    parts = query.data.split(":")
+    view = LIST_VIEWS.get(parts[1]) if len(parts) == 3 else None
+    if view is None or not parts[2].isdigit():
+        # Кнопка с номером страницы ничего не делает
+        await query.answer()
+        return
+
+    try:
+        rendered = await render_list_page(view, max(1, int(parts[2])))
+    except Exception as e:
+        logger.error(f"Page callback error: {e}")
+        await query.answer("❌ Не удалось получить данные", show_alert=True)
+        return
+
+    await query.answer()
+    key = message_key(query.message)
+    session = live_updater.session(query.message.chat_id)
+    live = session is not None and session.key == key
 
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        page_sensors = sensors_data[start_idx:end_idx]
+    async def edit(text, keyboard):
+        await query.edit_message_text(
+            text, parse_mode="Markdown", reply_markup=keyboard
+        )
+
+    try:
+        with span("telegram.send"):
+            if rendered is None:
+                await query.edit_message_text(view.empty_text)
+                return
+            text, keyboard = rendered
+            if live:
+                keyboard = with_live_stop(keyboard)
+            # Повторное нажатие на ту же страницу не отправляет правку
+            edited = await live_updater.send_if_changed(key, text, keyboard, edit)
+    except BadRequest as e:
+        # Страница могла не измениться с момента до перезапуска бота
+        if "not modified" not in str(e).lower():
+            raise
+        return
 
-        message = f"📡 *Показания датчиков* (стр. {page}/{total_pages}):\n\n"
+    if live and edited:
+        # Живое сообщение продолжает обновлять новую страницу
+        start_live_list(query.message, view, max(1, int(parts[2])), (text, keyboard))
 
-        for sensor in page_sensors:
-            friendly_name = sensor["friendly_name"]
-            if len(friendly_name) > 25:
-                friendly_name = friendly_name[:22] + "..."
 
-            state = sensor["state"]
-            unit = sensor.get("unit", "")
+@track_telegram_command("live_stop")
+async def live_stop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stop live updates of a message from its ⏹ button."""
+    query = update.callback_query
+    session = live_updater.session(query.message.chat_id)
+    if session is None or session.key != message_key(query.message):
+        await query.answer("Обновление уже остановлено")
+        return
+
+    live_updater.stop(query.message.chat_id)
+    await query.answer("⏹ Обновление остановлено")
+    if session.finish is not None:
+        try:
+            await session.finish()
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+
+
+# Действия команды /room и соответствующие сервисы Home Assistant
+ROOM_ACTIONS = {
+    "on": "turn_on",
+    "off": "turn_off",
+    "вкл": "turn_on",
+    "выкл": "turn_off",
+}
+
+ROOM_REPLIES = {
+    "turn_on": ("Включено", "Не удалось включить"),
+    "turn_off": ("Выключено", "Не удалось выключить"),
+}
+
+# Сколько сущностей показывать в обзоре зоны
+ROOM_STATUS_LIMIT = 30
+
+DOMAIN_EMOJI = {"light": "💡", "switch": "🔌", "sensor": "📡"}
+
+
+def format_room_status(room_data) -> str:
+    """Render the states of all entities of an area."""
+    message = f"🏠 *{room_data['name']}*\n\n"
+    room_states = room_data["states"]
+    if not room_states:
+        return message + "В этой зоне нет устройств"
+
+    for state in room_states[:ROOM_STATUS_LIMIT]:
+        entity_id = state.get("entity_id", "")
+        attributes = state.get("attributes", {})
+        emoji = DOMAIN_EMOJI.get(entity_id.split(".", 1)[0], "▫️")
+        value = state.get("state", "unknown")
+        if attributes.get("unit_of_measurement"):
+            value += f" {attributes['unit_of_measurement']}"
+        message += f"{emoji} {attributes.get('friendly_name', entity_id)}: {value}\n"
+
+    if len(room_states) > ROOM_STATUS_LIMIT:
+        message += f"… и ещё {len(room_states) - ROOM_STATUS_LIMIT}\n"
+
+    message += (
+        f"\n_Управление:_ `/room {room_data['area_id']} on` | "
+        f"`/room {room_data['area_id']} off`"
+    )
+    return message
 
-            # Обрезаем слишком длинные значения
-            if len(str(state)) > 15:
-                state = str(state)[:12] + "..."
 
-            message += f"📊 {friendly_name}\n"
-            message += f"   `{sensor['entity_id']}`\n"
-            message += f"   📈 {state} {unit}\n\n"
+@track_telegram_command("room")
+async def room(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show an area or switch all its lights and switches at once."""
+    if not context.args:
+        await update.message.reply_text(
+            "❌ Укажите зону.\nПример: `/room kitchen` или `/room kitchen off`",
+            parse_mode="Markdown",
+        )
+        return
 
-        # Добавляем навигацию
-        nav_line = ""
-        if page > 1:
-            nav_line += f"⬅️ `/sensors {page - 1}` | "
-        nav_line += f"📄 {page}/{total_pages}"
-        if page < total_pages:
-            nav_line += f" | `/sensors {page + 1}` ➡️"
+    args = list(context.args)
+    action = None
+    if len(args) > 1 and args[-1].lower() in ROOM_ACTIONS:
+        action = args.pop().lower()
+    query = " ".join(args)
 
-        message += f"\n{nav_line}\n\n"
-        message += f"Всего датчиков: {len(sensors_data)}"
+    try:
+        if action is None:
+            room_data = await ha_api.get_room(query)
+            if room_data is None:
+                await update.message.reply_text(f"❓ Зона «{query}» не найдена")
+                return
+            await update.message.reply_text(
+                format_room_status(room_data), parse_mode="Markdown"
+            )
+            return
 
-        await loading_msg.edit_text(message, parse_mode="Markdown")
+        result = await ha_api.room_command(query, ROOM_ACTIONS[action])
+        if result is None:
+            await update.message.reply_text(f"❓ Зона «{query}» не найдена")
+            return
+        done_text, failed_text = ROOM_REPLIES[ROOM_ACTIONS[action]]
+        await update.message.reply_text(
+            f"🏠 *{result['name']}*\n\n"
+            + format_command_result(result, done_text, failed_text),
+            parse_mode="Markdown",
+        )
     except Exception as e:
-        logger.error(f"Sensors command error: {e}")
-        await update.message.reply_text(f"❌ Ошибка при получении датчиков: {str(e)}")
+        logger.error(f"Room command error: {e}")
+        await update.message.reply_text(f"❌ Ошибка управления зоной: {str(e)}")
+
+
+# Подписки /watch на изменения состояний, сохраняются между перезапусками
+watch_registry = SubscriptionRegistry.from_env()
+watch_dispatcher = WatchDispatcher.from_env(watch_registry)
+
+# Сколько изменений перечислять в одном уведомлении
+WATCH_NOTIFY_LIMIT = 20
+
+
+def format_state_change(entity_id: str, old_state, new_state) -> str:
+    """One line of a /watch notification."""
+    attributes = (new_state or old_state or {}).get("attributes", {})
+    unit = attributes.get("unit_of_measurement")
+    old = old_state.get("state", "unknown") if old_state else "—"
+    new = new_state.get("state", "unknown") if new_state else "удалено"
+    if unit and new_state:
+        new += f" {unit}"
+    name = attributes.get("friendly_name", entity_id)
+    return f"{DOMAIN_EMOJI.get(get_domain(entity_id), '▫️')} {name}: {old} → {new}\n   `{entity_id}`"
+
+
+def format_watch_notification(changes) -> str:
+    """Push message with the changes collected for one chat."""
+    lines = [
+        format_state_change(entity_id, old_state, new_state)
+        for entity_id, old_state, new_state in changes[:WATCH_NOTIFY_LIMIT]
+    ]
+    if len(changes) > WATCH_NOTIFY_LIMIT:
+        lines.append(f"… и ещё {len(changes) - WATCH_NOTIFY_LIMIT}")
+    return "🔔 *Изменения состояний*\n\n" + "\n".join(lines)
+
+
+async def send_watch_notification(bot, chat_id, changes) -> None:
+    """Deliver a /watch notification behind command replies in the send queue."""
+    await bot.send_message(
+        chat_id,
+        format_watch_notification(changes),
+        parse_mode="Markdown",
+        rate_limit_args={"priority": "bulk"} if bot.rate_limiter else None,
+    )
+
+
+@track_telegram_command("watch")
+async def watch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Subscribe the chat to state changes of entities, domains or patterns."""
+    chat_id = update.effective_chat.id
+    if not context.args:
+        patterns = watch_registry.patterns(chat_id)
+        if not patterns:
+            await update.message.reply_text(
+                "🔔 Подписок нет.\nПример: `/watch binary_sensor.front_door` или `/watch light.kitchen_*`",
+                parse_mode="Markdown",
+            )
+            return
+        await update.message.reply_text(
+            "🔔 *Подписки:*\n"
+            + format_entity_list(patterns)
+            + "\n\nОтписаться: `/unwatch <entity_id>` или `/unwatch all`",
+            parse_mode="Markdown",
+        )
+        return
+
+    added, invalid, unknown = [], [], []
+    store = ha_api.state_store
+    try:
+        for arg in context.args:
+            pattern = normalize_pattern(arg)
+            if pattern is None:
+                invalid.append(arg)
+                continue
+            if watch_registry.add(chat_id, pattern):
+                added.append(pattern)
+            if store.loaded and not is_pattern(pattern):
+                if store.get(pattern) is None:
+                    unknown.append(pattern)
+    except ValueError:
+        invalid.append(f"лимит {watch_registry.limit} подписок")
+
+    sections = []
+    if added:
+        sections.append(f"🔔 Подписка оформлена: {format_entity_list(added)}")
+    elif not invalid:
+        sections.append("🔔 Вы уже подписаны")
+    if unknown:
+        sections.append(
+            f"⚠️ Сейчас нет в Home Assistant: {format_entity_list(unknown)}"
+        )
+    if invalid:
+        sections.append(f"❌ Не добавлено: {', '.join(invalid)}")
+    await update.message.reply_text("\n\n".join(sections), parse_mode="Markdown")
+
+
+@track_telegram_command("unwatch")
+async def unwatch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Remove subscriptions of the chat (`/unwatch all` removes every one)."""
+    chat_id = update.effective_chat.id
+    if not context.args:
+        await update.message.reply_text(
+            "❌ Укажите подписку.\nПример: `/unwatch binary_sensor.front_door` или `/unwatch all`",
+            parse_mode="Markdown",
+        )
+        return
+
+    if [arg.lower() for arg in context.args] == ["all"]:
+        removed = watch_registry.remove_chat(chat_id)
+        await update.message.reply_text(f"🔕 Удалено подписок: {removed}")
+        return
+
+    removed = [
+        pattern
+        for pattern in map(normalize_pattern, context.args)
+        if pattern is not None and watch_registry.remove(chat_id, pattern)
+    ]
+    if removed:
+        await update.message.reply_text(
+            f"🔕 Подписка отменена: {format_entity_list(removed)}",
+            parse_mode="Markdown",
+        )
+    else:
+        await update.message.reply_text("❓ Таких подписок нет. Список: /watch")
 
 
 @track_telegram_command("unknown")
@@ -486,16 +1095,82 @@ async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     )
 
 
-def start_bot():
-    """Start the Telegram bot."""
-    # Get bot token from environment
-    bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not bot_token:
-        logger.error("TELEGRAM_BOT_TOKEN environment variable not set")
-        return
+async def start_live_mirror(application: Application) -> None:
+    """Run the Home Assistant WebSocket mirror inside the bot event loop."""
+    mirror = ha_api.create_live_mirror()
+    if mirror is not None:
+        application.create_task(mirror.run())
 
-    # Create the Application
-    application = Application.builder().token(bot_token).build()
+
+async def start_watching(application: Application) -> None:
+    """Deliver /watch notifications for changes seen by the Home Assistant client."""
+    watch_dispatcher.start(
+        lambda chat_id, changes: send_watch_notification(
+            application.bot, chat_id, changes
+        )
+    )
+    ha_api.state_store.add_listener(watch_dispatcher.on_state_change)
+    # Без WebSocket изменения находятся сравнением периодически загружаемых снимков
+    application.bot_data["follow_states"] = asyncio.create_task(
+        ha_api.follow_states(
+            float(os.getenv("BOT_WATCH_POLL_INTERVAL", "10")),
+            active=lambda: len(watch_registry) > 0,
+        )
+    )
+
+
+async def stop_watching(application: Application) -> None:
+    """Stop delivering /watch notifications."""
+    ha_api.state_store.remove_listener(watch_dispatcher.on_state_change)
+    task = application.bot_data.pop("follow_states", None)
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    await watch_dispatcher.stop()
+
+
+async def close_home_assistant(application: Application) -> None:
+    """Release the pooled Home Assistant HTTP connections on shutdown."""
+    await ha_api.close()
+
+
+async def post_init(application: Application) -> None:
+    """Start background work that needs the running event loop."""
+    await start_live_mirror(application)
+    await start_watching(application)
+
+
+async def post_shutdown(application: Application) -> None:
+    """Stop background work and release connections."""
+    await stop_watching(application)
+    await close_home_assistant(application)
+
+
+def build_application(
+    bot_token: str, request: Optional[BaseRequest] = None
+) -> Application:
+    """Create the Application with every command handler registered.
+
+    ``request`` replaces the HTTP transport to the Bot API (used by the
+    throughput benchmark with a fake transport).
+    """
+    builder = (
+        Application.builder()
+        .token(bot_token)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    # Очередь исходящих сообщений с лимитами Telegram на частоту отправки
+    rate_limiter = rate_limiter_from_env()
+    if rate_limiter is not None:
+        builder = builder.rate_limiter(rate_limiter)
+    # Параллельная обработка обновлений с сохранением порядка внутри чата
+    update_processor = update_processor_from_env()
+    if update_processor is not None:
+        builder = builder.concurrent_updates(update_processor)
+    application = builder.build()
 
     # Register command handlers
     application.add_handler(CommandHandler("start", start))
@@ -508,11 +1183,40 @@ def start_bot():
     application.add_handler(CommandHandler("switch_on", switch_on))
     application.add_handler(CommandHandler("switch_off", switch_off))
     application.add_handler(CommandHandler("sensors", sensors))
+    application.add_handler(CommandHandler("room", room))
+    application.add_handler(CommandHandler("watch", watch))
+    application.add_handler(CommandHandler("unwatch", unwatch))
+    application.add_handler(CallbackQueryHandler(page_callback, pattern=r"^page:"))
+    application.add_handler(
+        CallbackQueryHandler(live_stop_callback, pattern=r"^live:stop$")
+    )
 
     # Handle unknown commands
     application.add_handler(MessageHandler(filters.COMMAND, unknown_command))
+    return application
+
+
+def start_bot():
+    """Start the Telegram bot."""
+    # Get bot token from environment
+    bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not bot_token:
+        logger.error("TELEGRAM_BOT_TOKEN environment variable not set")
+        return
+
+    # Create the Application
+    application = build_application(bot_token)
 
     # Start the bot
+    mode = os.getenv("TELEGRAM_MODE", "polling").lower()
+    if mode == "webhook":
+        from webhook import serve_webhook
+
+        logger.info("Starting Telegram bot in webhook mode...")
+        serve_webhook(application)
+        return
+    if mode != "polling":
+        logger.warning(f"Unknown TELEGRAM_MODE={mode!r}, using polling")
     logger.info("Starting Telegram bot...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
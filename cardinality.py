@@ -0,0 +1,293 @@
+"""
+Bounded-cardinality label policies and per-user statistics for metrics
+"""
+
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Значение метки для всех, кто не попал в отслеживаемые
+OVERFLOW_LABEL = "other"
+# Значение метки, когда она отключена политикой
+DROPPED_LABEL = "all"
+
+POLICY_MODES = ("full", "topk", "hash", "drop")
+
+
+class SpaceSaving:
+    """Approximate frequency counter over a fixed number of slots.
+
+    Counts are exact while fewer than ``capacity`` distinct values are seen;
+    after that the least frequent slot is recycled and the newcomer inherits
+    its count (an upper bound of the true count).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+
+    def add(self, value: str) -> int:
+        """Count one occurrence and return the estimated total."""
+        if value in self.counts:
+            self.counts[value] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[value] = 1
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            self.counts[value] = self.counts.pop(victim) + 1
+        return self.counts[value]
+
+
+class LabelPolicy:
+    """Maps an unbounded label value (user id, entity id) onto a bounded set.
+
+    Modes:
+
+    * ``full`` - keep the value as is (unbounded, previous behaviour);
+    * ``topk`` - up to ``top_k`` frequent values keep their own series, a
+      value is admitted after ``min_count`` estimated occurrences and stays
+      admitted; everything else goes to ``other``;
+    * ``hash`` - ``bucket-NN`` out of ``buckets`` stable hash buckets;
+    * ``drop`` - a single ``all`` value.
+    """
+
+    def __init__(
+        self,
+        mode: str = "full",
+        top_k: int = 50,
+        buckets: int = 32,
+        min_count: int = 3,
+    ):
+        if mode not in POLICY_MODES:
+            raise ValueError(f"Unknown label policy {mode!r}, expected {POLICY_MODES}")
+        self.mode = mode
+        self.top_k = top_k
+        self.buckets = buckets
+        self.min_count = min_count
+        self._lock = threading.Lock()
+        self._admitted: set = set()
+        self._counter = SpaceSaving(max(top_k * 4, 16))
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "LabelPolicy":
+        """Build a policy from ``<prefix>_LABEL_POLICY`` and shared settings."""
+        mode = os.getenv(f"{prefix}_LABEL_POLICY", "full").lower()
+        if mode not in POLICY_MODES:
+            logger.warning(f"Unknown {prefix}_LABEL_POLICY={mode!r}, using 'full'")
+            mode = "full"
+        return cls(
+            mode=mode,
+            top_k=int(os.getenv("METRICS_LABEL_TOP_K", "50")),
+            buckets=int(os.getenv("METRICS_LABEL_BUCKETS", "32")),
+            min_count=int(os.getenv("METRICS_LABEL_MIN_COUNT", "3")),
+        )
+
+    def __call__(self, value: str) -> str:
+        """Label value to export for ``value``."""
+        value = str(value)
+        if self.mode == "full":
+            return value
+        if self.mode == "drop":
+            return DROPPED_LABEL
+        if self.mode == "hash":
+            return f"bucket-{zlib.crc32(value.encode()) % self.buckets:02d}"
+
+        with self._lock:
+            if value in self._admitted:
+                return value
+            count = self._counter.add(value)
+            if len(self._admitted) < self.top_k and count >= self.min_count:
+                self._admitted.add(value)
+                return value
+        return OVERFLOW_LABEL
+
+    def describe(self) -> Dict[str, Any]:
+        """Settings and state for diagnostics."""
+        return {
+            "mode": self.mode,
+            "top_k": self.top_k,
+            "buckets": self.buckets,
+            "tracked": len(self._admitted),
+        }
+
+
+class UserActivity:
+    """Per-user command statistics kept in process instead of metric labels.
+
+    Holds at most ``limit`` users; the least recently active one is evicted
+    when a new user arrives.
+    """
+
+    def __init__(self, limit: int = 1000):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def record(self, user_id: str, command: str, success: bool):
+        """Count one command of a user."""
+        with self._lock:
+            stats = self._users.pop(user_id, None)
+            if stats is None:
+                stats = {"commands": 0, "errors": 0, "by_command": {}}
+                if len(self._users) >= self.limit:
+                    self._users.popitem(last=False)
+            stats["commands"] += 1
+            if not success:
+                stats["errors"] += 1
+            stats["by_command"][command] = stats["by_command"].get(command, 0) + 1
+            stats["last_seen"] = time.time()
+            self._users[user_id] = stats
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Statistics of one user, if still tracked."""
+        with self._lock:
+            stats = self._users.get(user_id)
+            if stats is None:
+                return None
+            return {
+                "user_id": user_id,
+                **stats,
+                "by_command": dict(stats["by_command"]),
+            }
+
+    def top(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most active tracked users."""
+        with self._lock:
+            ranked = sorted(
+                self._users.items(), key=lambda item: item[1]["commands"], reverse=True
+            )[:limit]
+            return [
+                {
+                    "user_id": user_id,
+                    "commands": stats["commands"],
+                    "errors": stats["errors"],
+                    "last_seen": stats["last_seen"],
+                }
+                for user_id, stats in ranked
+            ]
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+
+class HyperLogLog:
+    """Distinct-count sketch in ``2 ** precision`` one-byte registers.
+
+    The relative error is about ``1.04 / sqrt(2 ** precision)`` (3% for the
+    default); small counts fall back to linear counting and are near exact.
+    """
+
+    def __init__(self, precision: int = 10):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: str):
+        """Count one value (repeats do not change the estimate)."""
+        digest = hashlib.blake2b(value.encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest, "big")
+        width = 64 - self.precision
+        index = hashed >> width
+        rank = width - (hashed & ((1 << width) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        """Union with another sketch of the same precision."""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        """Estimated number of distinct values added."""
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0**-rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+
+class SlidingDistinct:
+    """Distinct values over a sliding time window in fixed memory.
+
+    A ring of ``buckets`` sketches, one per ``bucket_seconds``; a bucket is
+    reset when its slot comes round again, so old values age out one bucket
+    at a time instead of all at once.
+    """
+
+    def __init__(self, bucket_seconds: int, buckets: int, precision: int = 10):
+        self.bucket_seconds = bucket_seconds
+        self.precision = precision
+        self._sketches = [HyperLogLog(precision) for _ in range(buckets)]
+        self._bucket_ids = [-1] * buckets
+
+    def add(self, value: str, now: float):
+        """Count ``value`` in the bucket of ``now``."""
+        bucket_id = int(now // self.bucket_seconds)
+        slot = bucket_id % len(self._sketches)
+        if self._bucket_ids[slot] > bucket_id:
+            # Значение старше окна - его слот уже занят более новым бакетом
+            return
+        if self._bucket_ids[slot] != bucket_id:
+            self._sketches[slot] = HyperLogLog(self.precision)
+            self._bucket_ids[slot] = bucket_id
+        self._sketches[slot].add(value)
+
+    def count(self, window: float, now: float) -> int:
+        """Distinct values seen in the last ``window`` seconds.
+
+        The oldest bucket is included whole, so the window is rounded up to
+        a bucket boundary.
+        """
+        current = int(now // self.bucket_seconds)
+        oldest = current - math.ceil(window / self.bucket_seconds)
+        merged = HyperLogLog(self.precision)
+        for bucket_id, sketch in zip(self._bucket_ids, self._sketches):
+            if oldest <= bucket_id <= current:
+                merged.merge(sketch)
+        return merged.count()
+
+
+# Окна активных пользователей: (название, длительность в секундах)
+ACTIVE_USER_WINDOWS = (("1h", 3600), ("24h", 86400), ("7d", 7 * 86400))
+
+
+class ActiveUsers:
+    """Active-user estimates for the ``ACTIVE_USER_WINDOWS``.
+
+    The hour window uses 10-minute buckets, the day and week windows hourly
+    ones; memory is fixed at about 180 KiB whatever the number of users.
+    """
+
+    def __init__(self, precision: int = 10):
+        self._lock = threading.Lock()
+        self._fine = SlidingDistinct(600, 7, precision)
+        self._coarse = SlidingDistinct(3600, 7 * 24 + 1, precision)
+
+    def add(self, user_id: str, now: Optional[float] = None):
+        """Mark a user as active."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._fine.add(user_id, now)
+            self._coarse.add(user_id, now)
+
+    def counts(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Estimated active users per window."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return {
+                name: (self._fine if window <= 3600 else self._coarse).count(
+                    window, now
+                )
+                for name, window in ACTIVE_USER_WINDOWS
+            }
@@ -0,0 +1,155 @@
+"""
+Entity processing helpers shared by the sync and async Home Assistant clients
+"""
+
+import fnmatch
+import re
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Tuple
+
+# Символы, по которым аргумент команды считается шаблоном (light.kitchen_*)
+GLOB_CHARS = "*?["
+
+
+def get_domain(entity_id: str) -> str:
+    """Return the domain part of an entity_id (``light.kitchen`` -> ``light``)."""
+    return entity_id.split(".", 1)[0] if "." in entity_id else ""
+
+
+def project_light(state: Dict) -> Dict:
+    """Project a raw light state onto the fields the bot and web UI use."""
+    entity_id = state.get("entity_id", "")
+    attributes = state.get("attributes", {})
+    return {
+        "entity_id": entity_id,
+        "state": state.get("state", "unknown"),
+        "friendly_name": attributes.get("friendly_name", entity_id),
+        "brightness": attributes.get("brightness"),
+        "color_temp": attributes.get("color_temp"),
+    }
+
+
+def project_switch(state: Dict) -> Dict:
+    """Project a raw switch state onto the fields the bot and web UI use."""
+    entity_id = state.get("entity_id", "")
+    return {
+        "entity_id": entity_id,
+        "state": state.get("state", "unknown"),
+        "friendly_name": state.get("attributes", {}).get("friendly_name", entity_id),
+    }
+
+
+def project_sensor(state: Dict) -> Dict:
+    """Project a raw sensor state onto the fields the bot and web UI use."""
+    entity_id = state.get("entity_id", "")
+    attributes = state.get("attributes", {})
+    return {
+        "entity_id": entity_id,
+        "state": state.get("state", "unknown"),
+        "friendly_name": attributes.get("friendly_name", entity_id),
+        "unit": attributes.get("unit_of_measurement", ""),
+        "device_class": attributes.get("device_class"),
+    }
+
+
+# Проекции для доменов, которые показываются списками
+DOMAIN_PROJECTIONS: Dict[str, Callable[[Dict], Dict]] = {
+    "light": project_light,
+    "switch": project_switch,
+    "sensor": project_sensor,
+}
+
+
+def collation_key(entity: Dict) -> Tuple[str, str, str]:
+    """Sort key for projected entities: case-insensitive friendly name.
+
+    The entity_id makes keys unique so they can be located by bisection.
+    """
+    friendly_name = str(entity["friendly_name"])
+    return (friendly_name.casefold(), friendly_name, entity["entity_id"])
+
+
+def filter_domain(states: List[Dict], domain: str) -> List[Dict]:
+    """Return projected entities of one domain sorted by friendly name."""
+    project = DOMAIN_PROJECTIONS[domain]
+    prefix = f"{domain}."
+    entities = [
+        project(state)
+        for state in states
+        if state.get("entity_id", "").startswith(prefix)
+    ]
+    return sorted(entities, key=collation_key)
+
+
+def paginate(
+    entities: List[Dict], page: int, per_page: int
+) -> Tuple[List[Dict], int, int]:
+    """Slice one page; returns (items, total, page clamped to the last page)."""
+    total = len(entities)
+    total_pages = max(1, (total + per_page - 1) // per_page)
+    page = min(max(1, page), total_pages)
+    start_idx = (page - 1) * per_page
+    return entities[start_idx : start_idx + per_page], total, page
+
+
+def count_by_domain(states: List[Dict]) -> Dict[str, int]:
+    """Count entities per domain."""
+    counts: Dict[str, int] = {}
+    for state in states:
+        domain = get_domain(state.get("entity_id", ""))
+        if domain:
+            counts[domain] = counts.get(domain, 0) + 1
+    return counts
+
+
+def is_pattern(value: str) -> bool:
+    """Whether a command argument is a glob pattern rather than an entity_id."""
+    return any(char in value for char in GLOB_CHARS)
+
+
+def resolve_patterns(
+    patterns: Iterable[str], states: List[Dict], domains: Iterable[str]
+) -> Tuple[List[str], List[str]]:
+    """Expand entity_ids and glob patterns against the known states.
+
+    Patterns only match known entities of ``domains``; plain entity_ids of an
+    allowed domain are kept even if missing from a stale snapshot. Returns
+    the entity_ids in request order without duplicates and the arguments
+    that matched nothing.
+    """
+    domains = set(domains)
+    known = [
+        entity_id
+        for entity_id in (state.get("entity_id", "") for state in states)
+        if get_domain(entity_id) in domains
+    ]
+    resolved: Dict[str, None] = {}
+    unmatched: List[str] = []
+
+    for pattern in patterns:
+        pattern = pattern.strip().lower()
+        if not pattern:
+            continue
+        if is_pattern(pattern):
+            regex = re.compile(fnmatch.translate(pattern))
+            matches = [entity_id for entity_id in known if regex.match(entity_id)]
+        else:
+            matches = [pattern] if get_domain(pattern) in domains else []
+
+        if not matches:
+            unmatched.append(pattern)
+        for entity_id in matches:
+            resolved[entity_id] = None
+
+    return list(resolved), unmatched
+
+
+def group_by_domain(entity_ids: Iterable[str]) -> Dict[str, List[str]]:
+    """Group entity_ids by domain, keeping their order."""
+    groups: Dict[str, List[str]] = {}
+    for entity_id in entity_ids:
+        groups.setdefault(get_domain(entity_id), []).append(entity_id)
+    return groups
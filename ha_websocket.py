@@ -0,0 +1,282 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+
+import websockets
+
+from area_index import AreaIndex
+from state_store import EntityStateStore
+
+logger = logging.getLogger(__name__)
+
+# События реестров, по которым обновляется индекс зон
+REGISTRY_EVENTS = (
+    "area_registry_updated",
+    "device_registry_updated",
+    "entity_registry_updated",
+)
+
+
+class AuthenticationError(Exception):
+    """Home Assistant rejected the access token."""
+
+
+class HomeAssistantWebSocket:
+    """Live entity mirror fed by the Home Assistant WebSocket API.
+
+    After authenticating the client subscribes to ``state_changed`` events,
+    loads the initial states once with ``get_states`` and then applies every
+    event to the shared ``EntityStateStore``. A dropped connection marks the
+    store as no longer live (readers fall back to REST polling) and triggers
+    a reconnect with exponential backoff followed by a full resync.
+
+    With an ``area_index`` the area, device and entity registries are loaded
+    as well and kept current from the ``*_registry_updated`` events.
+    """
+
+    def __init__(
+        self,
+        state_store: EntityStateStore,
+        url: Optional[str] = None,
+        token: Optional[str] = None,
+        area_index: Optional[AreaIndex] = None,
+    ):
+        self.state_store = state_store
+        self.area_index = area_index
+        self.url = url or self._default_url()
+        self.token = token or os.getenv("HOME_ASSISTANT_TOKEN")
+        self.reconnect_min = float(os.getenv("HA_WEBSOCKET_RECONNECT_MIN", "1"))
+        self.reconnect_max = float(os.getenv("HA_WEBSOCKET_RECONNECT_MAX", "60"))
+
+        self.connected = asyncio.Event()
+        self._message_id = 0
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ws = None
+        self._stopped = False
+        self._buffered_events: Optional[List] = None
+        self._registry_tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _default_url() -> str:
+        """Derive the WebSocket URL from the configured REST base URL."""
+        ws_url = os.getenv("HOME_ASSISTANT_WS_URL")
+        if ws_url:
+            return ws_url
+        base_url = os.getenv("HOME_ASSISTANT_URL", "http://localhost:8123").rstrip("/")
+        if base_url.startswith("https://"):
+            base_url = "wss://" + base_url[len("https://") :]
+        elif base_url.startswith("http://"):
+            base_url = "ws://" + base_url[len("http://") :]
+        return f"{base_url}/api/websocket"
+
+    async def run(self):
+        """Keep the mirror connected until ``stop`` is called."""
+        delay = self.reconnect_min
+        while not self._stopped:
+            try:
+                async with websockets.connect(self.url, max_size=None) as ws:
+                    self._ws = ws
+                    await self._authenticate(ws)
+                    delay = self.reconnect_min
+                    await self._session(ws)
+            except asyncio.CancelledError:
+                raise
+            except AuthenticationError as e:
+                logger.error(f"WebSocket authentication failed: {e}")
+            except Exception as e:
+                logger.warning(f"WebSocket connection to {self.url} lost: {e}")
+            finally:
+                self._on_disconnect()
+
+            if self._stopped:
+                break
+            logger.info(f"Reconnecting to Home Assistant WebSocket in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max)
+
+    async def stop(self):
+        """Close the connection and stop reconnecting."""
+        self._stopped = True
+        if self._ws is not None:
+            await self._ws.close()
+
+    def start_in_thread(self) -> threading.Thread:
+        """Run the mirror on a private event loop in a daemon thread.
+
+        Used by the threaded Flask/gunicorn side which has no event loop.
+        """
+        thread = threading.Thread(
+            target=lambda: asyncio.run(self.run()),
+            name="ha-websocket",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    async def _authenticate(self, ws):
+        """Perform the auth_required / auth / auth_ok handshake."""
+        message = json.loads(await ws.recv())
+        if message.get("type") != "auth_required":
+            raise AuthenticationError(f"Unexpected greeting: {message}")
+
+        await ws.send(json.dumps({"type": "auth", "access_token": self.token}))
+        message = json.loads(await ws.recv())
+        if message.get("type") != "auth_ok":
+            raise AuthenticationError(message.get("message", "auth_invalid"))
+        logger.info(f"Authenticated against {self.url}")
+
+    async def _session(self, ws):
+        """Subscribe, resync and apply events until the socket closes."""
+        self._message_id = 0
+        # События до окончания загрузки состояний применяются после неё
+        self._buffered_events = []
+        reader = asyncio.create_task(self._reader(ws))
+        try:
+            # Подписываемся до загрузки состояний, чтобы не потерять события
+            await self.command(
+                {"type": "subscribe_events", "event_type": "state_changed"}
+            )
+            if self.area_index is not None:
+                for event_type in REGISTRY_EVENTS:
+                    await self.command(
+                        {"type": "subscribe_events", "event_type": event_type}
+                    )
+            states = await self.command({"type": "get_states"})
+            self._resync(states)
+            if self.area_index is not None:
+                await self._load_registries()
+            await reader
+        finally:
+            reader.cancel()
+
+    def _resync(self, states: List[Dict]):
+        """Replace the mirror with a full state list and mark it live."""
+        buffered = self._buffered_events
+        self.state_store.replace(states)
+        self._buffered_events = None
+        for entity_id, new_state in buffered:
+            self.state_store.apply_state(entity_id, new_state)
+        self.state_store.set_live(True)
+        self.connected.set()
+        logger.info(
+            f"Mirror synchronised with {len(states)} entities "
+            f"({len(buffered)} buffered events applied)"
+        )
+
+    async def _load_registries(self):
+        """Load the area, device and entity registries into the area index."""
+        areas, devices, entities = await asyncio.gather(
+            self.command({"type": "config/area_registry/list"}),
+            self.command({"type": "config/device_registry/list"}),
+            self.command({"type": "config/entity_registry/list"}),
+        )
+        self.area_index.load(areas, devices, entities)
+        self.area_index.live = True
+
+    async def _apply_registry_event(self, event: Dict):
+        """Update the area index for one registry change."""
+        event_type = event.get("event_type")
+        data = event.get("data", {})
+        try:
+            if event_type == "area_registry_updated":
+                self.area_index.set_areas(
+                    await self.command({"type": "config/area_registry/list"})
+                )
+            elif event_type == "device_registry_updated":
+                self.area_index.set_devices(
+                    await self.command({"type": "config/device_registry/list"})
+                )
+            elif event_type == "entity_registry_updated":
+                entity_id = data.get("entity_id")
+                if data.get("old_entity_id"):
+                    self.area_index.remove_entity(data["old_entity_id"])
+                if data.get("action") == "remove":
+                    self.area_index.remove_entity(entity_id)
+                else:
+                    self.area_index.upsert_entity(
+                        await self.command(
+                            {
+                                "type": "config/entity_registry/get",
+                                "entity_id": entity_id,
+                            }
+                        )
+                    )
+        except Exception as e:
+            logger.warning(f"Could not apply {event_type} to the area index: {e}")
+
+    async def command(self, payload: Dict):
+        """Send a command and wait for its ``result`` message."""
+        self._message_id += 1
+        message_id = self._message_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        await self._ws.send(json.dumps({"id": message_id, **payload}))
+        return await future
+
+    async def _reader(self, ws):
+        """Dispatch incoming messages to pending commands and the mirror."""
+        try:
+            async for raw in ws:
+                message = json.loads(raw)
+                message_type = message.get("type")
+                if message_type == "result":
+                    self._resolve(message)
+                elif message_type == "event":
+                    self._handle_event(message.get("event", {}))
+        finally:
+            self._fail_pending()
+
+    def _resolve(self, message: Dict):
+        """Complete the command future matching a ``result`` message."""
+        future = self._pending.pop(message.get("id"), None)
+        if future is None or future.done():
+            return
+        if message.get("success"):
+            future.set_result(message.get("result"))
+        else:
+            future.set_exception(RuntimeError(message.get("error", {}).get("message")))
+
+    def _fail_pending(self):
+        """Fail every command still waiting for a result."""
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("WebSocket disconnected"))
+        self._pending.clear()
+
+    def _handle_event(self, event: Dict):
+        """Apply a ``state_changed`` or registry event."""
+        if event.get("event_type") in REGISTRY_EVENTS and self.area_index is not None:
+            # Детали изменения запрашиваются отдельной командой - не блокируем чтение
+            task = asyncio.create_task(self._apply_registry_event(event))
+            self._registry_tasks.add(task)
+            task.add_done_callback(self._registry_tasks.discard)
+            return
+        if event.get("event_type") != "state_changed":
+            return
+        data = event.get("data", {})
+        entity_id = data.get("entity_id")
+        if not entity_id:
+            return
+        new_state = data.get("new_state")
+        if self._buffered_events is not None:
+            self._buffered_events.append((entity_id, new_state))
+        else:
+            self.state_store.apply_state(entity_id, new_state)
+
+    def _on_disconnect(self):
+        """Fail pending commands and fall back to REST polling."""
+        self._ws = None
+        self._buffered_events = None
+        self.connected.clear()
+        self._fail_pending()
+        if self.area_index is not None:
+            self.area_index.live = False
+        if self.state_store.live:
+            self.state_store.set_live(False)
+            self.state_store.invalidate()
@@ -1,25 +1,102 @@
 import logging
 import os
+import threading
+import time
 from datetime import datetime
 from typing import Dict
 from typing import List
 from typing import Optional
+from typing import Tuple
+from typing import Union
 
 import requests
-
+from requests.adapters import HTTPAdapter
+
+from entities import group_by_domain
+from entities import paginate
+from entities import project_light
+from entities import resolve_patterns
+from ha_websocket import HomeAssistantWebSocket
+from metrics import metrics_collector
 from metrics import track_device_command
 from metrics import track_homeassistant_request
+from singleflight import SingleFlight
+from state_store import EntityStateStore
+from states_stream import STREAM_CHUNK_SIZE
+from states_stream import StatesStreamParser
+from states_stream import finish_stream
+from tracing import span
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Один пул keep-alive соединений на процесс (потоки gunicorn и все клиенты)
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+
+def http_pool_config() -> Dict[str, int]:
+    """Connection pool limits shared by the sync and async clients."""
+    return {
+        # Количество пулов (по одному на хост), которые держит сессия
+        "pool_connections": int(os.getenv("HA_HTTP_POOL_CONNECTIONS", "4")),
+        # Максимум соединений к одному хосту
+        "pool_maxsize": int(os.getenv("HA_HTTP_POOL_MAXSIZE", "10")),
+    }
+
+
+def get_http_session() -> requests.Session:
+    """Return the process-wide pooled keep-alive session for Home Assistant.
+
+    Created lazily so every gunicorn worker builds its own pool after fork.
+    With ``HA_HTTP_POOL_BLOCK`` enabled callers wait for a free connection
+    instead of opening extra ones beyond ``HA_HTTP_POOL_MAXSIZE``.
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                config = http_pool_config()
+                adapter = HTTPAdapter(
+                    pool_connections=config["pool_connections"],
+                    pool_maxsize=config["pool_maxsize"],
+                    pool_block=os.getenv("HA_HTTP_POOL_BLOCK", "false").lower()
+                    in ("1", "true"),
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _http_session = session
+    return _http_session
+
+
+def _report_pool_stats(session: requests.Session):
+    """Export request/connection counters of the urllib3 pools."""
+    requests_count = 0
+    new_connections = 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        # keys() берет блокировку контейнера; прямая итерация не потокобезопасна
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                requests_count += pool.num_requests
+                new_connections += pool.num_connections
+    metrics_collector.update_http_pool_stats("sync", requests_count, new_connections)
+
 
 class HomeAssistantAPI:
-    def __init__(self):
-        """Initialize Home Assistant API client."""
-        self.base_url = os.getenv("HOME_ASSISTANT_URL", "http://localhost:8123")
-        self.token = os.getenv("HOME_ASSISTANT_TOKEN")
+    def __init__(self, base_url: Optional[str] = None, token: Optional[str] = None):
+        """Initialize Home Assistant API client.
+
+        ``base_url`` and ``token`` default to ``HOME_ASSISTANT_URL`` and
+        ``HOME_ASSISTANT_TOKEN``.
+        """
+        self.base_url = base_url or os.getenv(
+            "HOME_ASSISTANT_URL", "http://localhost:8123"
+        )
+        self.token = token or os.getenv("HOME_ASSISTANT_TOKEN")
 
         if not self.token:
             logger.warning("HOME_ASSISTANT_TOKEN environment variable not set")
@@ -33,22 +110,69 @@ class HomeAssistantAPI:
             "Content-Type": "application/json",
         }
 
-    @track_homeassistant_request("{method}", "{endpoint}")
+        # Общий снимок состояний для всех читателей этого клиента
+        self.state_store = EntityStateStore(
+            ttl=float(os.getenv("HA_STATES_CACHE_TTL", "5"))
+        )
+        self.live_mirror: Optional[HomeAssistantWebSocket] = None
+
+        # Одинаковые одновременные чтения выполняются одним запросом
+        self._state_loads = SingleFlight("sync")
+        self._inflight_requests = SingleFlight("sync")
+
+        # Потоковый разбор /api/states с проекцией только нужных полей
+        self.stream_states = os.getenv("HA_STREAM_STATES", "false").lower() in (
+            "1",
+            "true",
+        )
+
+    def create_live_mirror(self) -> Optional[HomeAssistantWebSocket]:
+        """Create the WebSocket mirror feeding the state store, if enabled.
+
+        The caller is responsible for running it: ``await mirror.run()`` inside
+        an event loop or ``mirror.start_in_thread()`` from threaded code.
+        """
+        if os.getenv("HA_WEBSOCKET_ENABLED", "false").lower() not in ("1", "true"):
+            return None
+        if self.live_mirror is None:
+            self.live_mirror = HomeAssistantWebSocket(
+                self.state_store, token=self.token
+            )
+        return self.live_mirror
+
     def _make_request(
         self, method: str, endpoint: str, data: Optional[Dict] = None
     ) -> Optional[Dict]:
-        """Make HTTP request to Home Assistant API."""
+        """Make HTTP request to Home Assistant API.
+
+        Concurrent GETs of the same endpoint share one request and its result;
+        ``states`` is left to ``get_all_states``, which coalesces whole loads.
+        """
+        with span("ha.request", method=method, endpoint=endpoint):
+            # Полный список уже объединяет get_all_states через _state_loads
+            if method != "GET" or endpoint == "states":
+                return self._send_request(method, endpoint, data)
+            return self._inflight_requests.do(
+                endpoint, lambda: self._send_request(method, endpoint)
+            )
+
+    @track_homeassistant_request("{method}", "{endpoint}")
+    def _send_request(
+        self, method: str, endpoint: str, data: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """Send one HTTP request to Home Assistant API."""
         try:
             url = f"{self.base_url}/api/{endpoint}"
             logger.debug(f"Making {method} request to: {url}")
 
-            response = requests.request(
+            response = get_http_session().request(
                 method=method,
                 url=url,
                 headers=self.headers,
                 json=data,
                 timeout=30,  # Увеличиваем timeout для больших ответов
             )
+            _report_pool_stats(get_http_session())
 
             if response.status_code == 200:
                 try:
@@ -91,23 +215,87 @@ class HomeAssistantAPI:
             logger.error(f"Unexpected error: {e}")
             return None
 
+    @track_homeassistant_request("GET", "states")
+    def _stream_states(self) -> Optional[StatesStreamParser]:
+        """Download ``/api/states`` entity by entity, keeping only used fields.
+
+        A dropped connection or malformed tail still yields the entities
+        parsed so far (with ``complete`` unset).
+        """
+        parser = StatesStreamParser()
+        url = f"{self.base_url}/api/states"
+        logger.debug(f"Streaming GET request to: {url}")
+
+        try:
+            with get_http_session().get(
+                url, headers=self.headers, stream=True, timeout=30
+            ) as response:
+                if response.status_code != 200:
+                    logger.error(
+                        f"API request failed: {response.status_code} - {response.text}"
+                    )
+                    return None
+                for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    parser.feed(chunk)
+                    if parser.error is not None:
+                        break
+        except requests.exceptions.RequestException as e:
+            parser.error = f"request error: {e}"
+        finally:
+            _report_pool_stats(get_http_session())
+
+        return finish_stream(parser)
+
     def get_all_states(self) -> Optional[List[Dict]]:
-        """Get all entity states from Home Assistant."""
-        return self._make_request("GET", "states")
+        """Get all entity states, served from the shared state store.
+
+        On a miss concurrent callers wait for a single reload.
+        """
+        states = self.state_store.lookup()
+        if states is not None:
+            return states
+        return self._state_loads.do("states", self._load_states)
+
+    def _load_states(self) -> Optional[List[Dict]]:
+        """Fetch all states from Home Assistant and install them in the store."""
+        # Команда во время загрузки: снимок может её не учитывать
+        since = self.state_store.invalidations
+        if self.stream_states:
+            with span("ha.request", method="GET", endpoint="states", streamed=True):
+                parser = self._stream_states()
+            if parser is None:
+                return None
+            return self.state_store.replace(
+                parser.states, complete=parser.complete, since=since
+            ).states
+
+        states = self._make_request("GET", "states")
+        if states is None:
+            return None
+        return self.state_store.replace(states, since=since).states
 
     def get_entity_state(self, entity_id: str) -> Optional[Dict]:
         """Get state of a specific entity."""
+        if self.state_store.live:
+            # Живое зеркало актуально - обходимся без запроса к Home Assistant
+            if self.state_store.loaded:
+                return self.state_store.get(entity_id)
         return self._make_request("GET", f"states/{entity_id}")
 
-    def call_service(self, domain: str, service: str, entity_id: str) -> bool:
-        """Call a Home Assistant service."""
+    def call_service(
+        self, domain: str, service: str, entity_id: Union[str, List[str]]
+    ) -> bool:
+        """Call a Home Assistant service for one entity_id or a list of them."""
         try:
             data = {"entity_id": entity_id}
 
             url = f"{self.base_url}/api/services/{domain}/{service}"
             logger.debug(f"Calling service: {url} with data: {data}")
 
-            response = requests.post(url, headers=self.headers, json=data, timeout=15)
+            response = get_http_session().post(
+                url, headers=self.headers, json=data, timeout=15
+            )
+            _report_pool_stats(get_http_session())
 
             logger.debug(
                 f"Service call response: {response.status_code} - {response.text[:200]}"
@@ -116,6 +304,11 @@ class HomeAssistantAPI:
             # Home Assistant API возвращает 200 для успешных команд
             # Даже если устройство недоступно, команда может быть принята
             if response.status_code == 200:
+                # Состояние устройства изменилось - снимок больше не актуален
+                self.state_store.invalidate()
+                # Чтения, начатые до команды, вернут старое состояние
+                self._state_loads.forget("states")
+                self._inflight_requests.forget("states")
                 return True
             else:
                 logger.error(
@@ -127,6 +320,33 @@ class HomeAssistantAPI:
             logger.error(f"Service call error: {e}")
             return False
 
+    def bulk_command(
+        self, service: str, patterns: List[str], domains: Tuple[str, ...]
+    ) -> Dict[str, List[str]]:
+        """Run ``service`` on every entity matched by entity_ids or glob patterns.
+
+        Targets are resolved against the cached states and dispatched as one
+        service call per domain. Returns the ``succeeded`` and ``failed``
+        entity_ids and the ``unmatched`` arguments.
+        """
+        states = self.get_all_states() or []
+        entity_ids, unmatched = resolve_patterns(patterns, states, domains)
+        result: Dict[str, List[str]] = {
+            "succeeded": [],
+            "failed": [],
+            "unmatched": unmatched,
+        }
+
+        for domain, domain_ids in group_by_domain(entity_ids).items():
+            start_time = time.time()
+            success = self.call_service(domain, service, domain_ids)
+            metrics_collector.record_bulk_device_command(
+                domain_ids, service, success, time.time() - start_time
+            )
+            result["succeeded" if success else "failed"].extend(domain_ids)
+
+        return result
+
     def get_lights(self) -> List[Dict]:
         """Get all light entities and their states."""
         try:
@@ -135,23 +355,7 @@ class HomeAssistantAPI:
                 logger.warning("Could not get all states, trying alternative approach")
                 return self._get_lights_alternative()
 
-            lights = []
-            for state in states:
-                entity_id = state.get("entity_id", "")
-                if entity_id.startswith("light."):
-                    lights.append(
-                        {
-                            "entity_id": entity_id,
-                            "state": state.get("state", "unknown"),
-                            "friendly_name": state.get("attributes", {}).get(
-                                "friendly_name", entity_id
-                            ),
-                            "brightness": state.get("attributes", {}).get("brightness"),
-                            "color_temp": state.get("attributes", {}).get("color_temp"),
-                        }
-                    )
-
-            return sorted(lights, key=lambda x: x["friendly_name"])
+            return self.state_store.domain_entities(states, "light")
         except Exception as e:
             logger.error(f"Error in get_lights: {e}")
             return self._get_lights_alternative()
@@ -179,21 +383,7 @@ class HomeAssistantAPI:
                 entity_id = f"light.{light_name}"
                 state_data = self.get_entity_state(entity_id)
                 if state_data:
-                    lights.append(
-                        {
-                            "entity_id": entity_id,
-                            "state": state_data.get("state", "unknown"),
-                            "friendly_name": state_data.get("attributes", {}).get(
-                                "friendly_name", entity_id
-                            ),
-                            "brightness": state_data.get("attributes", {}).get(
-                                "brightness"
-                            ),
-                            "color_temp": state_data.get("attributes", {}).get(
-                                "color_temp"
-                            ),
-                        }
-                    )
+                    lights.append(project_light(state_data))
 
             # Если ничего не нашли, вернем пустой список с пояснением
             if not lights:
@@ -204,27 +394,29 @@ class HomeAssistantAPI:
             logger.error(f"Error in alternative lights method: {e}")
             return []
 
+    def get_entities_page(
+        self, domain: str, page: int, per_page: int
+    ) -> Tuple[List[Dict], int, int]:
+        """Get one page of a domain's entities sorted by friendly name.
+
+        Returns ``(items, total, page)`` with ``page`` clamped to the last one.
+        """
+        states = self.get_all_states()
+        if not states:
+            if domain == "light":
+                return paginate(self._get_lights_alternative(), page, per_page)
+            return [], 0, 1
+
+        with span("entities.page", domain=domain):
+            return self.state_store.domain_page(states, domain, page, per_page)
+
     def get_switches(self) -> List[Dict]:
         """Get all switch entities and their states."""
         states = self.get_all_states()
         if not states:
             return []
 
-        switches = []
-        for state in states:
-            entity_id = state.get("entity_id", "")
-            if entity_id.startswith("switch."):
-                switches.append(
-                    {
-                        "entity_id": entity_id,
-                        "state": state.get("state", "unknown"),
-                        "friendly_name": state.get("attributes", {}).get(
-                            "friendly_name", entity_id
-                        ),
-                    }
-                )
-
-        return sorted(switches, key=lambda x: x["friendly_name"])
+        return self.state_store.domain_entities(states, "switch")
 
     def get_sensors(self) -> List[Dict]:
         """Get all sensor entities and their states."""
@@ -232,22 +424,7 @@ class HomeAssistantAPI:
         if not states:
             return []
 
-        sensors = []
-        for state in states:
-            entity_id = state.get("entity_id", "")
-            if entity_id.startswith("sensor."):
-                attributes = state.get("attributes", {})
-                sensors.append(
-                    {
-                        "entity_id": entity_id,
-                        "state": state.get("state", "unknown"),
-                        "friendly_name": attributes.get("friendly_name", entity_id),
-                        "unit": attributes.get("unit_of_measurement", ""),
-                        "device_class": attributes.get("device_class"),
-                    }
-                )
-
-        return sorted(sensors, key=lambda x: x["friendly_name"])
+        return self.state_store.domain_entities(states, "sensor")
 
     @track_device_command("{entity_id}", "turn_on")
     def turn_on_light(self, entity_id: str) -> bool:
@@ -0,0 +1,276 @@
+"""
+Live-refreshed bot messages that are edited only when their content changes
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+from entities import get_domain
+from metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+Rendered = Tuple[str, Optional[InlineKeyboardMarkup]]
+Render = Callable[[], Awaitable[Optional[Rendered]]]
+Edit = Callable[[str, Optional[InlineKeyboardMarkup]], Awaitable[None]]
+Finish = Callable[[], Awaitable[None]]
+
+# Во сколько раз растёт интервал обновления, если содержимое не менялось
+BACKOFF_FACTOR = 1.5
+
+# Сколько хэшей сообщений помнить для пропуска пустых правок
+CONTENT_HASH_LIMIT = 4096
+
+
+def content_hash(text: str, markup: Optional[InlineKeyboardMarkup]) -> bytes:
+    """Digest of what the user sees: the text and the buttons."""
+    digest = hashlib.blake2b(text.encode(), digest_size=16)
+    if markup is not None:
+        digest.update(markup.to_json().encode())
+    return digest.digest()
+
+
+class ContentHashes:
+    """Last sent content hash per message, bounded LRU."""
+
+    def __init__(self, limit: int = CONTENT_HASH_LIMIT):
+        self.limit = limit
+        self._hashes: "OrderedDict[Hashable, bytes]" = OrderedDict()
+
+    def changed(self, key: Hashable, digest: bytes) -> bool:
+        """Whether ``digest`` differs from what the message shows now."""
+        return self._hashes.get(key) != digest
+
+    def remember(self, key: Hashable, digest: bytes):
+        self._hashes[key] = digest
+        self._hashes.move_to_end(key)
+        while len(self._hashes) > self.limit:
+            self._hashes.popitem(last=False)
+
+    def forget(self, key: Hashable):
+        self._hashes.pop(key, None)
+
+
+class LiveSession:
+    """One live message: what to render, how to edit it and when to refresh."""
+
+    def __init__(
+        self,
+        key: Hashable,
+        render: Render,
+        edit: Edit,
+        domains: Optional[Set[str]],
+        footer: Optional[Callable[[], str]],
+        finish: Optional[Finish],
+        interval: float,
+    ):
+        self.key = key
+        self.render = render
+        self.edit = edit
+        self.domains = domains
+        self.footer = footer
+        self.finish = finish
+        self.interval = interval
+        self.refreshes = 0
+        self.edits = 0
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def watches(self, entity_id: str) -> bool:
+        return self.domains is None or get_domain(entity_id) in self.domains
+
+
+class LiveUpdater:
+    """Keeps messages up to date while the entities they show change.
+
+    A session re-renders its message at an adaptive interval: it halves
+    (down to ``min_interval``) after a refresh that changed the content and
+    grows by ``BACKOFF_FACTOR`` (up to ``max_interval``) after one that did
+    not, so the cadence follows how often the shown entities change. State
+    store listeners wake a session early when an entity of its domains
+    changes; refreshes are still at least ``min_interval`` apart. The edit is
+    sent only when the content hash differs from the last one sent, and the
+    footer (e.g. a timestamp) is left out of the hash. One chat has at most
+    one live message; a session ends after ``duration`` with a call to its
+    ``finish`` callback.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 2.0,
+        max_interval: float = 60.0,
+        duration: float = 600.0,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.duration = duration
+        self.hashes = ContentHashes()
+        self._sessions: Dict[Hashable, LiveSession] = {}
+        self._stores: Set[int] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_env(cls) -> "LiveUpdater":
+        """Build from ``BOT_LIVE_MIN_INTERVAL`` and related settings."""
+        return cls(
+            min_interval=float(os.getenv("BOT_LIVE_MIN_INTERVAL", "2")),
+            max_interval=float(os.getenv("BOT_LIVE_MAX_INTERVAL", "60")),
+            duration=float(os.getenv("BOT_LIVE_DURATION", "600")),
+        )
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def watch_store(self, store):
+        """Wake sessions on changes in ``store`` (a ``EntityStateStore``)."""
+        if id(store) not in self._stores:
+            self._stores.add(id(store))
+            store.add_listener(self._on_state_change)
+
+    def _on_state_change(self, entity_id: str, old_state, new_state):
+        # Слушатель может вызываться из потока WebSocket зеркала
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        for session in list(self._sessions.values()):
+            if session.watches(entity_id) and not session.wakeup.is_set():
+                loop.call_soon_threadsafe(session.wakeup.set)
+
+    async def send_if_changed(
+        self, key: Hashable, text: str, markup: Optional[InlineKeyboardMarkup], edit
+    ) -> bool:
+        """Edit a message unless it already shows this content."""
+        digest = content_hash(text, markup)
+        if not self.hashes.changed(key, digest):
+            metrics_collector.record_message_edit(False)
+            return False
+        await edit(text, markup)
+        self.hashes.remember(key, digest)
+        metrics_collector.record_message_edit(True)
+        return True
+
+    def start(
+        self,
+        chat_id: Hashable,
+        message_key: Hashable,
+        render: Render,
+        edit: Edit,
+        domains: Optional[Set[str]] = None,
+        footer: Optional[Callable[[], str]] = None,
+        finish: Optional[Finish] = None,
+        sent: Optional[Rendered] = None,
+    ) -> LiveSession:
+        """Keep a sent message live, replacing the chat's previous live message.
+
+        ``sent`` is the content the message was sent with, so the first
+        refresh does not repeat it.
+        """
+        self._loop = asyncio.get_running_loop()
+        self.stop(chat_id)
+        if sent is not None:
+            self.hashes.remember(message_key, content_hash(*sent))
+        session = LiveSession(
+            message_key, render, edit, domains, footer, finish, self.min_interval
+        )
+        session.task = asyncio.create_task(self._run(chat_id, session))
+        self._sessions[chat_id] = session
+        metrics_collector.update_live_messages(len(self._sessions))
+        return session
+
+    def session(self, chat_id: Hashable) -> Optional[LiveSession]:
+        """The chat's live message, if any."""
+        return self._sessions.get(chat_id)
+
+    def stop(self, chat_id: Hashable) -> Optional[LiveSession]:
+        """End the chat's live message; returns the stopped session."""
+        session = self._sessions.pop(chat_id, None)
+        if session is None:
+            return None
+        if session.task is not None:
+            session.task.cancel()
+        metrics_collector.update_live_messages(len(self._sessions))
+        return session
+
+    async def _run(self, chat_id: Hashable, session: LiveSession):
+        deadline = time.monotonic() + self.duration
+        last_refresh = time.monotonic()
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if session.finish is not None:
+                        await session.finish()
+                    break
+                try:
+                    await asyncio.wait_for(
+                        session.wakeup.wait(), min(session.interval, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                # Частые изменения не ускоряют обновление сверх min_interval
+                wait = last_refresh + self.min_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                session.wakeup.clear()
+                last_refresh = time.monotonic()
+
+                changed = await self._refresh(session)
+                if changed is None:
+                    break
+                session.interval = (
+                    max(self.min_interval, session.interval / 2)
+                    if changed
+                    else min(self.max_interval, session.interval * BACKOFF_FACTOR)
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Live message {session.key} failed: {e}")
+        finally:
+            if self._sessions.get(chat_id) is session:
+                del self._sessions[chat_id]
+                metrics_collector.update_live_messages(len(self._sessions))
+            # Сообщение могло перейти к новой сессии (смена страницы): её хэш
+            # уже записан в start() и должен остаться
+            if all(other.key != session.key for other in self._sessions.values()):
+                self.hashes.forget(session.key)
+
+    async def _refresh(self, session: LiveSession) -> Optional[bool]:
+        """Re-render once; ``None`` when the message can no longer be edited."""
+        session.refreshes += 1
+        rendered = await session.render()
+        if rendered is None:
+            return False
+        text, markup = rendered
+        digest = content_hash(text, markup)
+        if not self.hashes.changed(session.key, digest):
+            metrics_collector.record_message_edit(False)
+            return False
+        if session.footer is not None:
+            text += session.footer()
+        try:
+            await session.edit(text, markup)
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                self.hashes.remember(session.key, digest)
+                return False
+            logger.info(f"Live message {session.key} stopped: {e}")
+            return None
+        self.hashes.remember(session.key, digest)
+        session.edits += 1
+        metrics_collector.record_message_edit(True)
+        return True
@@ -25,6 +25,17 @@ def start_telegram_bot():
         logger.info("TELEGRAM_BOT_TOKEN not set. Telegram bot disabled.")
         return
 
+    if os.getenv("TELEGRAM_MODE", "polling").lower() == "webhook_flask":
+        # Обновления принимает само Flask приложение, отдельный процесс не нужен
+        try:
+            from bot import build_application
+            from webhook import mount_webhook
+
+            mount_webhook(app, build_application(telegram_token))
+        except Exception as e:
+            logger.error(f"Failed to mount Telegram webhook: {e}")
+        return
+
     try:
         # Start bot as separate process
         bot_process = subprocess.Popen(
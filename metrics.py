@@ -3,21 +3,36 @@ OpenMetrics система для Home Assistant Telegram Bot
 Собирает метрики производительности и использования
 """
 
+import asyncio
 import functools
 import logging
+import os
+import threading
 import time
 from typing import Any
+from typing import Callable
 from typing import Dict
+from typing import List
 from typing import Optional
 
+from prometheus_client import REGISTRY
 from prometheus_client import Counter
 from prometheus_client import Gauge
 from prometheus_client import Histogram
 from prometheus_client import Info
 from prometheus_client import generate_latest
 from prometheus_client import start_http_server
+from prometheus_client.core import GaugeMetricFamily
 from prometheus_client.openmetrics.exposition import CONTENT_TYPE_LATEST
 
+from cardinality import ActiveUsers
+from cardinality import LabelPolicy
+from cardinality import UserActivity
+from entities import count_by_domain
+from entities import get_domain
+from tracing import span
+from tracing import tracer
+
 logger = logging.getLogger(__name__)
 
 # === TELEGRAM BOT МЕТРИКИ ===
@@ -37,10 +52,93 @@ telegram_command_duration = Histogram(
     buckets=[0.1, 0.5, 1.0, 2.0, 5.0, 10.0],
 )
 
-# Активные пользователи
+# Активные пользователи (оценка в скользящих окнах 1h/24h/7d)
 telegram_active_users = Gauge(
     "telegram_bot_active_users",
-    "Количество активных пользователей за последние 24 часа",
+    "Количество активных пользователей за скользящее окно",
+    ["window"],
+)
+
+# Очередь входящих обновлений при параллельной обработке
+telegram_update_queue_depth = Gauge(
+    "telegram_bot_update_queue_depth",
+    "Количество обновлений, ожидающих очереди своего чата или свободного слота",
+)
+
+telegram_updates_in_progress = Gauge(
+    "telegram_bot_updates_in_progress",
+    "Количество обновлений, обрабатываемых в данный момент",
+)
+
+telegram_update_wait = Histogram(
+    "telegram_bot_update_wait_seconds",
+    "Время ожидания обновления в очереди до начала обработки",
+    buckets=[0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0],
+)
+
+# Обновления, полученные через webhook
+telegram_webhook_requests_total = Counter(
+    "telegram_bot_webhook_requests_total",
+    "Количество запросов к webhook Telegram по результату",
+    ["result"],
+)
+
+# Очередь исходящих сообщений с ограничением частоты
+telegram_outbound_queue_length = Gauge(
+    "telegram_bot_outbound_queue_length",
+    "Количество исходящих сообщений, ожидающих отправки",
+)
+
+telegram_outbound_delay = Histogram(
+    "telegram_bot_outbound_throttle_delay_seconds",
+    "Задержка исходящего сообщения в очереди из-за ограничения частоты",
+    ["priority"],
+    buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0],
+)
+
+telegram_outbound_retry_after_total = Counter(
+    "telegram_bot_outbound_retry_after_total",
+    "Количество ответов 429 (retry_after) от Telegram",
+)
+
+telegram_outbound_retry_after_seconds = Counter(
+    "telegram_bot_outbound_retry_after_seconds_total",
+    "Суммарное время ожидания, запрошенное Telegram через retry_after",
+)
+
+telegram_outbound_coalesced_total = Counter(
+    "telegram_bot_outbound_coalesced_total",
+    "Количество правок сообщений, заменённых более новой правкой до отправки",
+    ["method"],
+)
+
+# Кэш отрисованных страниц списков
+telegram_page_cache_requests_total = Counter(
+    "telegram_bot_page_cache_requests_total",
+    "Количество обращений к кэшу страниц списков по результату",
+    ["result"],
+)
+
+telegram_live_messages = Gauge(
+    "telegram_bot_live_messages",
+    "Количество сообщений в режиме живого обновления",
+)
+
+telegram_message_edits_total = Counter(
+    "telegram_bot_message_edits_total",
+    "Правки сообщений: отправленные и пропущенные без изменений содержимого",
+    ["result"],
+)
+
+telegram_watch_subscriptions = Gauge(
+    "telegram_bot_watch_subscriptions",
+    "Количество подписок /watch на изменения состояний",
+)
+
+telegram_watch_notifications_total = Counter(
+    "telegram_bot_watch_notifications_total",
+    "Уведомления подписчикам /watch по результату",
+    ["result"],
 )
 
 # === HOME ASSISTANT API МЕТРИКИ ===
@@ -66,11 +164,58 @@ homeassistant_connection_status = Gauge(
     "Статус подключения к Home Assistant (1=подключен, 0=отключен)",
 )
 
-# Количество сущностей в Home Assistant
-homeassistant_entities_total = Gauge(
-    "homeassistant_entities_total",
-    "Общее количество сущностей в Home Assistant",
-    ["domain"],
+# Количество сущностей в Home Assistant (homeassistant_entities_total)
+# и состояние устройств (device_status) отдаёт HomeAssistantStateCollector
+
+# Обращения к кэшу состояний сущностей
+homeassistant_state_cache_requests_total = Counter(
+    "homeassistant_state_cache_requests_total",
+    "Количество обращений к кэшу состояний Home Assistant",
+    ["result"],
+)
+
+# Возраст снимка состояний на момент обращения
+homeassistant_state_cache_age_seconds = Gauge(
+    "homeassistant_state_cache_age_seconds",
+    "Возраст снимка состояний Home Assistant при последнем обращении",
+)
+
+# Запросы, не отправленные благодаря объединению одинаковых чтений
+homeassistant_coalesced_requests_total = Counter(
+    "homeassistant_coalesced_requests_total",
+    "Количество запросов к Home Assistant, объединённых с уже выполняющимся",
+    ["client", "endpoint"],
+)
+
+# Потоковая загрузка /api/states
+homeassistant_states_stream_total = Counter(
+    "homeassistant_states_stream_total",
+    "Количество потоковых загрузок /api/states по результату",
+    ["result"],
+)
+
+homeassistant_states_stream_entities = Gauge(
+    "homeassistant_states_stream_entities",
+    "Количество сущностей, разобранных при последней потоковой загрузке",
+)
+
+# Переиспользование keep-alive соединений с Home Assistant
+homeassistant_http_pool_requests = Gauge(
+    "homeassistant_http_pool_requests",
+    "Количество HTTP запросов к Home Assistant через пул соединений",
+    ["client"],
+)
+
+homeassistant_http_pool_new_connections = Gauge(
+    "homeassistant_http_pool_new_connections",
+    "Количество новых TCP/TLS соединений, открытых пулом",
+    ["client"],
+)
+
+homeassistant_http_pool_reuse_ratio = Gauge(
+    "homeassistant_http_pool_reuse_ratio",
+    "Доля запросов, выполненных через уже открытое соединение",
+    ["client"],
 )
 
 # === СИСТЕМНЫЕ МЕТРИКИ ===
@@ -86,6 +231,20 @@ app_memory_usage_bytes = Gauge(
     "app_memory_usage_bytes", "Использование памяти приложением в байтах"
 )
 
+# Длительность фонового обновления метрик
+app_metrics_refresh_duration_seconds = Gauge(
+    "app_metrics_refresh_duration_seconds",
+    "Длительность последнего обновления и рендеринга метрик",
+)
+
+# Длительность этапов обработки команд (спаны tracing)
+app_stage_duration_seconds = Histogram(
+    "app_stage_duration_seconds",
+    "Длительность этапов обработки: запросы к Home Assistant, фильтрация, рендеринг, отправка",
+    ["stage"],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0],
+)
+
 # === МЕТРИКИ УСТРОЙСТВ ===
 
 # Команды управления устройствами
@@ -103,21 +262,48 @@ device_command_duration = Histogram(
     buckets=[0.1, 0.5, 1.0, 2.0, 5.0, 10.0],
 )
 
-# Состояние устройств
-device_status = Gauge(
-    "device_status",
-    "Текущее состояние устройств (1=on, 0=off, -1=unavailable)",
-    ["entity_id", "friendly_name"],
+# Время подтверждения нового состояния устройства после команды
+device_state_confirmation_duration = Histogram(
+    "device_state_confirmation_duration_seconds",
+    "Время до подтверждения нового состояния устройства после команды",
+    ["target_state", "result"],
+    buckets=[0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0],
 )
 
+# Домены, для которых экспортируется device_status
+DEVICE_STATUS_DOMAINS = ("light", "switch", "sensor")
+
+
+def device_status_value(state: str) -> int:
+    """Числовое значение состояния устройства для device_status"""
+    if state == "on":
+        return 1
+    if state == "unavailable":
+        return -1
+    return 0
+
 
 class MetricsCollector:
     """Класс для сбора и управления метриками"""
 
     def __init__(self):
         self.start_time = time.time()
-        self.active_users_cache = set()
-        self.last_cleanup = time.time()
+        # Оценка активных пользователей в скользящих окнах, память фиксирована
+        self.active_users = ActiveUsers()
+
+        # Политики ограничения кардинальности меток user_id и entity_id
+        self.user_label = LabelPolicy.from_env("METRICS_USER")
+        self.entity_label = LabelPolicy.from_env("METRICS_ENTITY")
+        # Подробная статистика по пользователям хранится в процессе, а не в метках
+        self.user_activity = UserActivity(
+            int(os.getenv("METRICS_USER_DETAIL_LIMIT", "1000"))
+        )
+
+        # Агрегаты команд для сводки, обновляются при каждой записи
+        self._totals_lock = threading.Lock()
+        self.commands_by_name: Dict[str, int] = {}
+        self.commands_by_status: Dict[str, int] = {"success": 0, "error": 0}
+        self.commands_by_user_label: Dict[str, int] = {}
 
         # Инициализация базовой информации о приложении
         app_info.info(
@@ -160,18 +346,75 @@ class MetricsCollector:
     ):
         """Записать метрики команды Telegram бота"""
         status = "success" if success else "error"
+        user_label = self.user_label(user_id)
 
         # Увеличиваем счетчик команд
         telegram_commands_total.labels(
-            command=command, user_id=user_id, status=status
+            command=command, user_id=user_label, status=status
         ).inc()
+        with self._totals_lock:
+            self.commands_by_name[command] = self.commands_by_name.get(command, 0) + 1
+            self.commands_by_status[status] += 1
+            self.commands_by_user_label[user_label] = (
+                self.commands_by_user_label.get(user_label, 0) + 1
+            )
+        self.user_activity.record(str(user_id), command, success)
 
         # Записываем время выполнения
         telegram_command_duration.labels(command=command).observe(duration)
 
         # Добавляем пользователя в активные
-        self.active_users_cache.add(user_id)
-        self._cleanup_active_users()
+        self.active_users.add(str(user_id))
+
+    def record_update_wait(self, duration: float):
+        """Записать время ожидания обновления в очереди"""
+        telegram_update_wait.observe(duration)
+
+    def update_update_queue(self, waiting: int, active: int):
+        """Обновить глубину очереди обновлений и число обрабатываемых"""
+        telegram_update_queue_depth.set(waiting)
+        telegram_updates_in_progress.set(active)
+
+    def record_webhook_request(self, result: str):
+        """Записать запрос к webhook Telegram"""
+        telegram_webhook_requests_total.labels(result=result).inc()
+
+    def update_outbound_queue(self, length: int):
+        """Обновить длину очереди исходящих сообщений"""
+        telegram_outbound_queue_length.set(length)
+
+    def record_outbound_delay(self, priority: str, delay: float):
+        """Записать задержку отправки сообщения из-за ограничения частоты"""
+        telegram_outbound_delay.labels(priority=priority).observe(delay)
+
+    def record_outbound_retry_after(self, retry_after: float):
+        """Записать ответ 429 от Telegram"""
+        telegram_outbound_retry_after_total.inc()
+        telegram_outbound_retry_after_seconds.inc(retry_after)
+
+    def record_outbound_coalesced(self, method: str):
+        """Записать правку сообщения, объединённую с более новой"""
+        telegram_outbound_coalesced_total.labels(method=method).inc()
+
+    def record_page_cache(self, hit: bool):
+        """Записать обращение к кэшу страниц списков"""
+        telegram_page_cache_requests_total.labels(result="hit" if hit else "miss").inc()
+
+    def update_live_messages(self, count: int):
+        """Обновить количество живых сообщений"""
+        telegram_live_messages.set(count)
+
+    def update_watch_subscriptions(self, count: int):
+        """Обновить количество подписок /watch"""
+        telegram_watch_subscriptions.set(count)
+
+    def record_watch_notification(self, result: str):
+        """Записать уведомление подписчику: sent, debounced, error, forbidden"""
+        telegram_watch_notifications_total.labels(result=result).inc()
+
+    def record_message_edit(self, sent: bool):
+        """Записать правку сообщения или её пропуск"""
+        telegram_message_edits_total.labels(result="sent" if sent else "skipped").inc()
 
     def record_homeassistant_request(
         self, method: str, endpoint: str, status_code: int, duration: float
@@ -195,6 +438,8 @@ class MetricsCollector:
         self, entity_id: str, command: str, success: bool, duration: float
     ):
         """Записать метрики команды управления устройством"""
+        entity_id = self.entity_label(entity_id)
+
         # Увеличиваем счетчик команд устройств
         device_commands_total.labels(
             entity_id=entity_id, command=command, success=str(success).lower()
@@ -205,65 +450,182 @@ class MetricsCollector:
             duration
         )
 
-    def update_device_status(self, entity_id: str, friendly_name: str, state: str):
-        """Обновить статус устройства"""
-        # Преобразуем состояние в числовое значение
-        if state == "on":
-            status_value = 1
-        elif state == "off":
-            status_value = 0
-        elif state == "unavailable":
-            status_value = -1
-        else:
-            status_value = 0
-
-        device_status.labels(entity_id=entity_id, friendly_name=friendly_name).set(
-            status_value
-        )
+    def record_bulk_device_command(
+        self, entity_ids: List[str], command: str, success: bool, duration: float
+    ):
+        """Записать метрики одной групповой команды для каждого устройства"""
+        for entity_id in entity_ids:
+            self.record_device_command(entity_id, command, success, duration)
+
+    def record_state_cache_lookup(self, hit: bool, age: float):
+        """Записать обращение к кэшу состояний Home Assistant"""
+        homeassistant_state_cache_requests_total.labels(
+            result="hit" if hit else "miss"
+        ).inc()
+        homeassistant_state_cache_age_seconds.set(age)
+
+    def record_coalesced_request(self, client: str, endpoint: str):
+        """Записать запрос, дождавшийся результата уже выполняющегося"""
+        homeassistant_coalesced_requests_total.labels(
+            client=client, endpoint=endpoint
+        ).inc()
 
-    def update_homeassistant_entities(self, entities_by_domain: Dict[str, int]):
-        """Обновить количество сущностей по доменам"""
-        for domain, count in entities_by_domain.items():
-            homeassistant_entities_total.labels(domain=domain).set(count)
+    def record_states_stream(self, result: str, entities: int):
+        """Записать результат потоковой загрузки /api/states"""
+        homeassistant_states_stream_total.labels(result=result).inc()
+        homeassistant_states_stream_entities.set(entities)
 
-    def _cleanup_active_users(self):
-        """Очистка кэша активных пользователей (каждые 24 часа)"""
-        current_time = time.time()
-        if current_time - self.last_cleanup > 86400:  # 24 часа
-            self.active_users_cache.clear()
-            self.last_cleanup = current_time
+    def record_metrics_refresh(self, duration: float):
+        """Записать длительность обновления метрик"""
+        app_metrics_refresh_duration_seconds.set(duration)
 
-        # Обновляем метрику активных пользователей
-        telegram_active_users.set(len(self.active_users_cache))
+    def record_stage_duration(self, stage: str, duration: float):
+        """Записать длительность этапа обработки"""
+        app_stage_duration_seconds.labels(stage=stage).observe(duration)
+
+    def record_state_confirmation(
+        self, target_state: str, confirmed: bool, duration: float
+    ):
+        """Записать время подтверждения состояния устройства после команды"""
+        device_state_confirmation_duration.labels(
+            target_state=target_state,
+            result="confirmed" if confirmed else "timeout",
+        ).observe(duration)
+
+    def update_http_pool_stats(self, client: str, requests: int, new_connections: int):
+        """Обновить статистику переиспользования HTTP соединений"""
+        homeassistant_http_pool_requests.labels(client=client).set(requests)
+        homeassistant_http_pool_new_connections.labels(client=client).set(
+            new_connections
+        )
+        if requests:
+            reused = max(requests - new_connections, 0)
+            homeassistant_http_pool_reuse_ratio.labels(client=client).set(
+                reused / requests
+            )
+
+    def update_active_users(self) -> Dict[str, int]:
+        """Обновить метрики активных пользователей по окнам"""
+        counts = self.active_users.counts()
+        for window, count in counts.items():
+            telegram_active_users.labels(window=window).set(count)
+        return counts
 
     def get_metrics_summary(self) -> Dict[str, Any]:
         """Получить сводку всех метрик"""
+        active_users = self.active_users.counts()
+        with self._totals_lock:
+            successful = self.commands_by_status["success"]
+            failed = self.commands_by_status["error"]
+            by_name = dict(self.commands_by_name)
+            by_user_label = dict(self.commands_by_user_label)
         return {
             "uptime_seconds": time.time() - self.start_time,
-            "active_users": len(self.active_users_cache),
-            "total_commands": sum(
-                [
-                    metric.labels(command=cmd, user_id=uid, status=status)._value.get()
-                    for metric in [telegram_commands_total]
-                    for cmd in [
-                        "start",
-                        "help",
-                        "status",
-                        "lights",
-                        "switches",
-                        "sensors",
-                    ]
-                    for uid in ["all"]
-                    for status in ["success", "error"]
-                ]
-            ),
+            "active_users": active_users["24h"],
+            "active_users_by_window": active_users,
+            "total_commands": successful + failed,
+            "successful_commands": successful,
+            "failed_commands": failed,
+            # Разбивка по пользователям идёт по меткам политики METRICS_USER
+            "commands_by_name": by_name,
+            "commands_by_user_label": by_user_label,
             "homeassistant_connection": homeassistant_connection_status._value.get(),
+            "tracked_users": len(self.user_activity),
+            "top_users": self.user_activity.top(),
+            "label_policies": {
+                "user_id": self.user_label.describe(),
+                "entity_id": self.entity_label.describe(),
+            },
         }
 
+    def get_user_activity(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Подробная статистика одного пользователя"""
+        return self.user_activity.get(str(user_id))
+
 
 # Глобальный экземпляр коллектора метрик
 metrics_collector = MetricsCollector()
 
+# Каждый завершённый спан попадает в гистограмму этапов
+tracer.add_listener(
+    lambda span: metrics_collector.record_stage_duration(span.name, span.duration)
+)
+
+
+class HomeAssistantStateCollector:
+    """Exports ``device_status`` and ``homeassistant_entities_total`` on scrape.
+
+    Values are read from the current state snapshot at collection time, so
+    no labelled child is kept per entity and deleted entities disappear with
+    the next snapshot. ``source`` returns the snapshot states (or ``None``)
+    without contacting Home Assistant.
+    """
+
+    def __init__(self, source: Optional[Callable[[], Optional[List[Dict]]]] = None):
+        self.source = source
+
+    def describe(self):
+        return [
+            GaugeMetricFamily(
+                "device_status",
+                "Текущее состояние устройств (1=on, 0=off, -1=unavailable)",
+                labels=["entity_id", "friendly_name"],
+            ),
+            GaugeMetricFamily(
+                "homeassistant_entities_total",
+                "Общее количество сущностей в Home Assistant",
+                labels=["domain"],
+            ),
+        ]
+
+    def collect(self):
+        status, entities = self.describe()
+        states = None
+        if self.source is not None:
+            try:
+                states = self.source()
+            except Exception as e:
+                logger.error(f"Error reading state snapshot for metrics: {e}")
+
+        if states:
+            for domain, count in sorted(count_by_domain(states).items()):
+                entities.add_metric([domain], count)
+
+            entity_label = metrics_collector.entity_label
+            # Метки после политики кардинальности могут совпасть - побеждает
+            # последняя сущность, как раньше при перезаписи Gauge
+            values: Dict[tuple, int] = {}
+            for state in states:
+                entity_id = state.get("entity_id", "")
+                if get_domain(entity_id) not in DEVICE_STATUS_DOMAINS:
+                    continue
+                label = entity_label(entity_id)
+                if entity_label.mode == "full":
+                    friendly_name = str(
+                        state.get("attributes", {}).get("friendly_name", entity_id)
+                    )
+                else:
+                    # При ограниченной кардинальности имя не должно порождать серии
+                    friendly_name = label
+                values[(label, friendly_name)] = device_status_value(
+                    state.get("state", "unknown")
+                )
+            for labels, value in values.items():
+                status.add_metric(list(labels), value)
+
+        yield status
+        yield entities
+
+
+# Коллектор состояний устройств; источник снимка задаёт приложение
+state_collector = HomeAssistantStateCollector()
+REGISTRY.register(state_collector)
+
+
+def set_state_source(source: Callable[[], Optional[List[Dict]]]):
+    """Задать источник снимка состояний для device_status"""
+    state_collector.source = source
+
 
 def track_telegram_command(command_name: str):
     """Декоратор для отслеживания команд Telegram бота"""
@@ -271,21 +633,23 @@ def track_telegram_command(command_name: str):
     def decorator(func):
         @functools.wraps(func)
         async def wrapper(update, context, *args, **kwargs):
-            start_time = time.time()
+            start_time = time.perf_counter()
             user_id = (
                 str(update.effective_user.id) if update.effective_user else "unknown"
             )
             success = False
 
             try:
-                result = await func(update, context, *args, **kwargs)
+                # Корневой спан команды, этапы внутри становятся его детьми
+                with span("telegram.command", command=command_name):
+                    result = await func(update, context, *args, **kwargs)
                 success = True
                 return result
             except Exception as e:
                 logger.error(f"Error in command {command_name}: {e}")
                 raise
             finally:
-                duration = time.time() - start_time
+                duration = time.perf_counter() - start_time
                 metrics_collector.record_telegram_command(
                     command=command_name,
                     user_id=user_id,
@@ -301,10 +665,41 @@ def track_telegram_command(command_name: str):
 def track_homeassistant_request(method: str, endpoint: str):
     """Декоратор для отслеживания запросов к Home Assistant API"""
 
+    def record(start_time: float, status_code: int):
+        duration = time.perf_counter() - start_time
+        metrics_collector.record_homeassistant_request(
+            method=method,
+            endpoint=endpoint,
+            status_code=status_code,
+            duration=duration,
+        )
+
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start_time = time.perf_counter()
+                status_code = 0
+
+                try:
+                    result = await func(*args, **kwargs)
+                    status_code = 200 if result is not None else 500
+                    return result
+                except Exception as e:
+                    status_code = 500
+                    logger.error(
+                        f"Error in Home Assistant request {method} {endpoint}: {e}"
+                    )
+                    raise
+                finally:
+                    record(start_time, status_code)
+
+            return async_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = time.time()
+            start_time = time.perf_counter()
             status_code = 0
 
             try:
@@ -318,13 +713,7 @@ def track_homeassistant_request(method: str, endpoint: str):
                 )
                 raise
             finally:
-                duration = time.time() - start_time
-                metrics_collector.record_homeassistant_request(
-                    method=method,
-                    endpoint=endpoint,
-                    status_code=status_code,
-                    duration=duration,
-                )
+                record(start_time, status_code)
 
         return wrapper
 
@@ -334,10 +723,40 @@ def track_homeassistant_request(method: str, endpoint: str):
 def track_device_command(entity_id: str, command: str):
     """Декоратор для отслеживания команд управления устройствами"""
 
+    def record(start_time: float, success: bool):
+        duration = time.perf_counter() - start_time
+        metrics_collector.record_device_command(
+            entity_id=entity_id,
+            command=command,
+            success=success,
+            duration=duration,
+        )
+
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start_time = time.perf_counter()
+                success = False
+
+                try:
+                    result = await func(*args, **kwargs)
+                    success = bool(result)
+                    return result
+                except Exception as e:
+                    logger.error(
+                        f"Error in device command {command} for {entity_id}: {e}"
+                    )
+                    raise
+                finally:
+                    record(start_time, success)
+
+            return async_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = time.time()
+            start_time = time.perf_counter()
             success = False
 
             try:
@@ -348,13 +767,7 @@ def track_device_command(entity_id: str, command: str):
                 logger.error(f"Error in device command {command} for {entity_id}: {e}")
                 raise
             finally:
-                duration = time.time() - start_time
-                metrics_collector.record_device_command(
-                    entity_id=entity_id,
-                    command=command,
-                    success=success,
-                    duration=duration,
-                )
+                record(start_time, success)
 
         return wrapper
 
@@ -375,3 +788,4 @@ def update_system_metrics():
     """Обновить системные метрики"""
     metrics_collector.update_app_uptime()
     metrics_collector.update_memory_usage()
+    metrics_collector.update_active_users()
@@ -0,0 +1,166 @@
+"""
+Background refresh of gauges and a cached Prometheus exposition
+"""
+
+import gzip
+import logging
+import os
+import threading
+import time
+from typing import Callable
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+
+from prometheus_client import REGISTRY
+from prometheus_client import generate_latest
+from prometheus_client.registry import CollectorRegistry
+
+from metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Уровень сжатия: выгода от 9 на тексте метрик мала, а CPU тратится заметно
+GZIP_LEVEL = 6
+
+# Метрики, которые меняются при каждом рендеринге (время работы, длительность
+# обновления, счётчики процесса и GC); их не сравнивают с кэшем
+VOLATILE_PREFIXES = (
+    "app_uptime_seconds",
+    "app_metrics_refresh_duration_seconds",
+    "process_",
+    "python_gc_",
+)
+
+
+class _Families:
+    """Already collected metric families in the form ``generate_latest`` takes."""
+
+    def __init__(self, families):
+        self.families = families
+
+    def collect(self):
+        return self.families
+
+
+class MetricsRefresher:
+    """Keeps gauges current off the request path and caches the exposition.
+
+    Every ``interval`` seconds a daemon thread runs the ``updaters`` and
+    collects the registry once. Families that change on every render
+    (``VOLATILE_PREFIXES``) are rendered separately and appended; the rest
+    and its gzip form are replaced only when that part differs from the
+    cached one, so ``version`` counts real changes. The gzip copy is then the
+    cached member followed by a small member for the volatile part
+    (multi-member gzip, which Prometheus and other HTTP clients decode). With
+    ``interval`` 0 no thread is started and each scrape refreshes
+    synchronously.
+
+    ``app_metrics_refresh_duration_seconds`` covers the updaters and the
+    render of the stable part of the same cycle.
+    """
+
+    def __init__(
+        self,
+        updaters: Iterable[Callable[[], None]],
+        interval: Optional[float] = None,
+        compress: Optional[bool] = None,
+        registry: CollectorRegistry = REGISTRY,
+    ):
+        self.updaters = list(updaters)
+        if interval is None:
+            interval = float(os.getenv("METRICS_REFRESH_INTERVAL", "15"))
+        self.interval = interval
+        if compress is None:
+            compress = os.getenv("METRICS_GZIP", "true").lower() == "true"
+        self.compress = compress
+        self.registry = registry
+        # Номер версии растёт при каждом изменении отданного текста
+        self.version = 0
+        self._stable: Optional[Tuple[bytes, Optional[bytes]]] = None
+        self._rendered: Optional[Tuple[bytes, Optional[bytes]]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the background thread is refreshing the exposition."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the background thread (no-op when disabled or running)."""
+        if self.interval <= 0 or self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="metrics-refresher", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Metrics refresher started, interval {self.interval}s")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    def refresh(self) -> bool:
+        """Run the updaters and re-render; returns whether the stable part changed."""
+        with self._lock:
+            start_time = time.perf_counter()
+            for update in self.updaters:
+                try:
+                    update()
+                except Exception as e:
+                    name = getattr(update, "__name__", update)
+                    logger.error(f"Metrics updater {name} failed: {e}")
+
+            stable = []
+            volatile_names = set()
+            for family in self.registry.collect():
+                if family.name.startswith(VOLATILE_PREFIXES):
+                    volatile_names.update(sample.name for sample in family.samples)
+                else:
+                    stable.append(family)
+
+            data = generate_latest(_Families(stable))
+            changed = self._stable is None or data != self._stable[0]
+            if changed:
+                gzipped = gzip.compress(data, GZIP_LEVEL) if self.compress else None
+                self._stable = (data, gzipped)
+                self.version += 1
+            metrics_collector.record_metrics_refresh(time.perf_counter() - start_time)
+
+            # Изменчивые метрики собираем после записи длительности этого прохода
+            self._rendered = self._stable
+            if volatile_names:
+                volatile = generate_latest(
+                    self.registry.restricted_registry(volatile_names)
+                )
+                data, gzipped = self._stable
+                self._rendered = (
+                    data + volatile,
+                    (
+                        gzipped + gzip.compress(volatile, GZIP_LEVEL)
+                        if gzipped is not None
+                        else None
+                    ),
+                )
+        return changed
+
+    def exposition(self, accept_gzip: bool = False) -> Tuple[bytes, Optional[str]]:
+        """Cached exposition and its Content-Encoding (``"gzip"`` or ``None``)."""
+        if not self.running or self._rendered is None:
+            # Без фонового потока (или до его первого прохода) обновляем сами
+            self.refresh()
+        data, gzipped = self._rendered
+        if accept_gzip and gzipped is not None:
+            return gzipped, "gzip"
+        return data, None
@@ -0,0 +1,371 @@
+"""
+Outbound Telegram message scheduling with global and per-chat rate limits
+"""
+
+import asyncio
+import datetime
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from typing import Any
+from typing import Callable
+from typing import Coroutine
+from typing import Deque
+from typing import Dict
+from typing import Hashable
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Методы Bot API, на которые распространяются лимиты Telegram на сообщения
+LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+
+# Приоритеты исходящих сообщений: ответы на команды уходят раньше массовых рассылок
+PRIORITIES = {"reply": 0, "bulk": 1}
+DEFAULT_PRIORITY = "reply"
+
+# Сколько бакетов простаивающих чатов держать, прежде чем чистить полные
+BUCKET_PRUNE_THRESHOLD = 1024
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second with bursts of up to ``capacity``."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until one event may happen."""
+        self._refill(now)
+        wait = max(self.paused_until - now, 0.0)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until: float):
+        """Block events until the monotonic time ``until`` (Telegram's retry_after)."""
+        self.paused_until = max(self.paused_until, until)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+
+class _Job:
+    """One queued Bot API call and the future its callers await."""
+
+    __slots__ = (
+        "callback",
+        "args",
+        "kwargs",
+        "chat",
+        "priority",
+        "seq",
+        "edit_key",
+        "queued_at",
+        "attempts",
+        "future",
+    )
+
+    def __init__(self, callback, args, kwargs, chat, priority, seq, edit_key):
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.chat = chat
+        self.priority = priority
+        self.seq = seq
+        self.edit_key = edit_key
+        self.queued_at = time.monotonic()
+        self.attempts = 0
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+def _seconds(retry_after: Any) -> float:
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+def _copy_outcome(source: asyncio.Future, target: asyncio.Future):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class OutboundRateLimiter(BaseRateLimiter[Dict[str, Any]]):
+    """Schedules message sends so the bot stays within Telegram's flood limits.
+
+    Every ``send*``/``edit*``/``copy*``/``forward*`` call is queued per chat
+    and sent by a dispatcher task when both the global bucket and the chat's
+    bucket allow it (groups, i.e. negative chat ids, get the slower group
+    rate). Messages to one chat leave one at a time and in order; across
+    chats, command replies go before bulk traffic. A queued edit of a message
+    is replaced by a newer edit of the same message, and all callers get the
+    result of the last one. ``RetryAfter`` pauses the chat and the whole bot
+    for the requested time and the call is retried up to ``max_retries``
+    times; a retried edit can still absorb newer edits of its message.
+
+    Callers choose the priority per call::
+
+        await bot.send_message(chat_id, text, rate_limit_args={"priority": "bulk"})
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        group_rate: float = 20 / 60,
+        chat_burst: int = 3,
+        max_retries: int = 3,
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, max(global_rate, 1.0))
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._queues: Dict[Hashable, Deque[_Job]] = {}
+        self._edits: Dict[Tuple, _Job] = {}
+        self._in_flight: Set[Hashable] = set()
+        self._sends: Set[asyncio.Task] = set()
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.queued = 0
+
+    @classmethod
+    def from_env(cls) -> "OutboundRateLimiter":
+        """Build from ``TELEGRAM_*_RATE`` and related settings."""
+        return cls(
+            global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", "30")),
+            chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE", "1")),
+            group_rate=float(os.getenv("TELEGRAM_GROUP_RATE", "20")) / 60,
+            chat_burst=int(os.getenv("TELEGRAM_CHAT_BURST", "3")),
+            max_retries=int(os.getenv("TELEGRAM_MAX_RETRIES", "3")),
+        )
+
+    async def initialize(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        for queue in self._queues.values():
+            for job in queue:
+                if not job.future.done():
+                    job.future.set_exception(RuntimeError("Bot is shutting down"))
+        self._queues.clear()
+        self._edits.clear()
+        self._set_queued(0)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ):
+        if self._dispatcher is None or not endpoint.startswith(LIMITED_PREFIXES):
+            return await callback(*args, **kwargs)
+
+        priority_name = (rate_limit_args or {}).get("priority", DEFAULT_PRIORITY)
+        priority = PRIORITIES.get(priority_name, PRIORITIES[DEFAULT_PRIORITY])
+        chat = data.get("chat_id")
+        edit_key = None
+        if endpoint.startswith("edit"):
+            edit_key = (
+                endpoint,
+                chat,
+                data.get("message_id"),
+                data.get("inline_message_id"),
+            )
+            pending = self._edits.get(edit_key)
+            if pending is not None:
+                # Ещё не отправленную правку того же сообщения заменяем новой
+                pending.args = args
+                pending.kwargs = kwargs
+                pending.priority = min(pending.priority, priority)
+                metrics_collector.record_outbound_coalesced(endpoint)
+                return await asyncio.shield(pending.future)
+
+        job = _Job(callback, args, kwargs, chat, priority, next(self._seq), edit_key)
+        self._queues.setdefault(chat, deque()).append(job)
+        if edit_key is not None:
+            self._edits[edit_key] = job
+        self._set_queued(self.queued + 1)
+        self._wakeup.set()
+        return await asyncio.shield(job.future)
+
+    def _bucket(self, chat: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(chat)
+        if bucket is None:
+            if len(self._buckets) >= BUCKET_PRUNE_THRESHOLD:
+                self._prune_buckets()
+            is_group = isinstance(chat, int) and chat < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._buckets[chat] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    def _prune_buckets(self):
+        now = time.monotonic()
+        for chat in [
+            chat
+            for chat, bucket in self._buckets.items()
+            if chat not in self._queues
+            and chat not in self._in_flight
+            and bucket.idle(now)
+        ]:
+            del self._buckets[chat]
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._start_ready()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start_ready(self) -> Optional[float]:
+        """Start every job allowed now; seconds until the next one may be."""
+        while True:
+            now = time.monotonic()
+            best = None
+            next_delay = None
+            for chat, queue in self._queues.items():
+                if chat in self._in_flight:
+                    continue
+                wait = self._bucket(chat).delay(now)
+                if wait > 0:
+                    next_delay = wait if next_delay is None else min(next_delay, wait)
+                    continue
+                job = queue[0]
+                if best is None or (job.priority, job.seq) < (best.priority, best.seq):
+                    best = job
+            if best is None:
+                return next_delay
+            wait = self._global.delay(now)
+            if wait > 0:
+                return wait
+
+            queue = self._queues[best.chat]
+            queue.popleft()
+            if not queue:
+                del self._queues[best.chat]
+            if best.edit_key is not None:
+                self._edits.pop(best.edit_key, None)
+            self._set_queued(self.queued - 1)
+            self._global.take(now)
+            self._bucket(best.chat).take(now)
+            self._in_flight.add(best.chat)
+            metrics_collector.record_outbound_delay(
+                "bulk" if best.priority else "reply", now - best.queued_at
+            )
+            task = asyncio.create_task(self._send(best))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+    async def _send(self, job: _Job):
+        try:
+            result = await job.callback(*job.args, **job.kwargs)
+        except RetryAfter as e:
+            delay = _seconds(e.retry_after)
+            metrics_collector.record_outbound_retry_after(delay)
+            # Лимит Telegram обычно общий для бота, поэтому ждёт и общий бакет
+            until = time.monotonic() + delay
+            self._bucket(job.chat).pause(until)
+            self._global.pause(until)
+            if job.attempts < self.max_retries:
+                logger.warning(
+                    f"Telegram flood limit for chat {job.chat}, retrying in {delay}s"
+                )
+                job.attempts += 1
+                self._requeue(job)
+            elif not job.future.done():
+                job.future.set_exception(e)
+        except BaseException as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._in_flight.discard(job.chat)
+            self._wakeup.set()
+
+    def _requeue(self, job: _Job):
+        """Put a job back after RetryAfter, keeping edits of it coalescible."""
+        newer = self._edits.get(job.edit_key) if job.edit_key is not None else None
+        if newer is not None:
+            # Пока правка ждала ответа, в очередь встала более новая правка того
+            # же сообщения: повторять старую незачем, её вызывающие получат новую
+            newer.priority = min(newer.priority, job.priority)
+            newer.future.add_done_callback(lambda done: _copy_outcome(done, job.future))
+            metrics_collector.record_outbound_coalesced(job.edit_key[0])
+            return
+        # Повтор идёт первым в очереди своего чата, порядок не нарушается
+        self._queues.setdefault(job.chat, deque()).appendleft(job)
+        if job.edit_key is not None:
+            self._edits[job.edit_key] = job
+        self._set_queued(self.queued + 1)
+
+    def _set_queued(self, queued: int):
+        self.queued = queued
+        metrics_collector.update_outbound_queue(queued)
+
+    def describe(self) -> Dict[str, Any]:
+        """Current state for diagnostics."""
+        return {
+            "queued": self.queued,
+            "chats_waiting": len(self._queues),
+            "in_flight": len(self._in_flight),
+            "global_rate": self.global_rate,
+            "chat_rate": self.chat_rate,
+            "group_rate": self.group_rate,
+        }
+
+
+def rate_limiter_from_env() -> Optional[OutboundRateLimiter]:
+    """Limiter unless ``TELEGRAM_RATE_LIMIT`` is turned off."""
+    if os.getenv("TELEGRAM_RATE_LIMIT", "true").lower() not in ("1", "true"):
+        return None
+    return OutboundRateLimiter.from_env()
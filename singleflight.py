@@ -0,0 +1,127 @@
+"""
+Coalescing of concurrent identical Home Assistant reads
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import Optional
+
+from metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+
+def _endpoint_label(key: str) -> str:
+    """Low-cardinality metric label for a key (``states/light.x`` -> ``states``)."""
+    return key.split("/", 1)[0] or "api"
+
+
+def _under(key: str, endpoint: str) -> bool:
+    """Whether ``key`` is ``endpoint`` itself or one of its sub-paths."""
+    return key == endpoint or key.startswith(f"{endpoint}/")
+
+
+class _Call:
+    """One in-flight call shared by its leader and any waiting followers."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time for threaded callers.
+
+    The first caller for a key (the leader) runs the function; callers
+    arriving while it is in flight wait and receive the same result or
+    exception instead of issuing a duplicate request. Results are shared,
+    so callers must treat them as read-only.
+    """
+
+    def __init__(self, client: str):
+        self.client = client
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Return ``fn()``, sharing the call with concurrent callers of ``key``."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics_collector.record_coalesced_request(
+                self.client, _endpoint_label(key)
+            )
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    def forget(self, endpoint: str):
+        """Stop sharing in-flight calls of ``endpoint`` and its sub-paths.
+
+        Callers already waiting still get their result; later callers start
+        a new call, so a read issued after a write never joins one that was
+        sent before it.
+        """
+        with self._lock:
+            for key in [key for key in self._calls if _under(key, endpoint)]:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of ``SingleFlight`` for the bot event loop.
+
+    The shared call runs as a task, so a follower (or the leader) being
+    cancelled does not abort the request for everyone else.
+    """
+
+    def __init__(self, client: str):
+        self.client = client
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await ``fn()``, sharing the call with concurrent callers of ``key``."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._release(key, done))
+        else:
+            metrics_collector.record_coalesced_request(
+                self.client, _endpoint_label(key)
+            )
+        return await asyncio.shield(task)
+
+    def _release(self, key: str, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    def forget(self, endpoint: str):
+        """Stop sharing in-flight calls of ``endpoint`` and its sub-paths.
+
+        See ``SingleFlight.forget``.
+        """
+        for key in [key for key in self._tasks if _under(key, endpoint)]:
+            del self._tasks[key]
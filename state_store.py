@@ -0,0 +1,388 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from entities import DOMAIN_PROJECTIONS
+from entities import collation_key
+from entities import filter_domain
+from entities import get_domain
+from entities import paginate
+from metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+
+class StateSnapshot:
+    """Immutable view of all entity states at one store version."""
+
+    def __init__(self, states: List[Dict], version: int, fetched_at: float):
+        self.states = states
+        self.version = version
+        self.fetched_at = fetched_at
+        self._by_id: Optional[Dict[str, Dict]] = None
+
+    @property
+    def by_id(self) -> Dict[str, Dict]:
+        """States keyed by entity_id, built on first use."""
+        if self._by_id is None:
+            self._by_id = {state.get("entity_id", ""): state for state in self.states}
+        return self._by_id
+
+    def age(self) -> float:
+        """Seconds since the snapshot data was last synchronised."""
+        return time.monotonic() - self.fetched_at
+
+
+class DomainIndex:
+    """Projected entities of one domain kept sorted by their collation key.
+
+    ``keys`` and ``rows`` are parallel lists; since every key ends with the
+    entity_id, an entity is located by bisection instead of a scan.
+    """
+
+    def __init__(self, domain: str):
+        self.domain = domain
+        self.project = DOMAIN_PROJECTIONS[domain]
+        self.keys: List[Tuple[str, str, str]] = []
+        self.rows: List[Dict] = []
+        self.key_by_id: Dict[str, Tuple[str, str, str]] = {}
+
+    def rebuild(self, states: List[Dict]):
+        """Project and sort all entities of the domain from scratch."""
+        rows = filter_domain(states, self.domain)
+        self.rows = rows
+        self.keys = [collation_key(row) for row in rows]
+        self.key_by_id = {row["entity_id"]: key for row, key in zip(rows, self.keys)}
+
+    def upsert(self, state: Dict):
+        """Insert or update one entity keeping the order."""
+        row = self.project(state)
+        key = collation_key(row)
+        old_key = self.key_by_id.get(row["entity_id"])
+        if old_key == key:
+            self.rows[bisect_left(self.keys, key)] = row
+            return
+        self.remove(row["entity_id"])
+        position = bisect_left(self.keys, key)
+        self.keys.insert(position, key)
+        self.rows.insert(position, row)
+        self.key_by_id[row["entity_id"]] = key
+
+    def remove(self, entity_id: str):
+        """Drop one entity from the index if present."""
+        key = self.key_by_id.pop(entity_id, None)
+        if key is None:
+            return
+        position = bisect_left(self.keys, key)
+        del self.keys[position]
+        del self.rows[position]
+
+
+def diff_states(
+    old: Dict[str, Dict], new: Dict[str, Dict], complete: bool = True
+) -> List[Tuple[str, Optional[Dict], Optional[Dict]]]:
+    """Entity changes between two snapshots as ``(entity_id, old, new)``.
+
+    An incomplete ``new`` snapshot may lack entities that still exist, so
+    removals are only reported for complete ones.
+    """
+    changes = [
+        (entity_id, old.get(entity_id), state)
+        for entity_id, state in new.items()
+        if old.get(entity_id) != state
+    ]
+    if complete:
+        changes.extend(
+            (entity_id, state, None)
+            for entity_id, state in old.items()
+            if entity_id not in new
+        )
+    return changes
+
+
+class EntityStateStore:
+    """Process-wide owner of the latest Home Assistant state snapshot.
+
+    Readers get the cached snapshot while it is younger than ``ttl`` seconds;
+    an expired or missing snapshot is reloaded through the supplied loader.
+    While a live mirror feeds the store (see ``ha_websocket``) the snapshot
+    never expires and individual entities are updated in place. Listeners
+    hear about every change, whether it comes from the mirror or from
+    comparing a reloaded snapshot with the previous one.
+    """
+
+    def __init__(self, ttl: float = 5.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entities: Optional[Dict[str, Dict]] = None
+        self._snapshot: Optional[StateSnapshot] = None
+        self._version = 0
+        self._fetched_at = 0.0
+        self._expired = False
+        # Счётчик invalidate(): загрузка, начатая до него, не делает снимок свежим
+        self._invalidations = 0
+        self._live = False
+        # Версии доменов: меняются только при изменении сущностей домена
+        self._generation = 0
+        self._domain_versions: Dict[str, int] = {}
+        # Индексы по доменам строятся лениво и поддерживаются при изменениях
+        self._indexes: Optional[Dict[str, DomainIndex]] = None
+        self._listeners: List[Callable[[str, Optional[Dict], Optional[Dict]], None]] = (
+            []
+        )
+
+    @property
+    def version(self) -> int:
+        """Monotonically increasing version of the current snapshot."""
+        return self._version
+
+    @property
+    def invalidations(self) -> int:
+        """How many times the store was invalidated; pass it to ``replace``."""
+        return self._invalidations
+
+    @property
+    def live(self) -> bool:
+        """Whether a live mirror is currently keeping the store up to date."""
+        return self._live
+
+    def set_live(self, live: bool):
+        """Mark the store as fed (or no longer fed) by a live mirror."""
+        with self._lock:
+            self._live = live
+            self._fetched_at = time.monotonic()
+        logger.info(f"State store live mirror {'enabled' if live else 'disabled'}")
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the store holds any states yet."""
+        return self._entities is not None
+
+    def get(self, entity_id: str) -> Optional[Dict]:
+        """Current state of one entity without building a snapshot.
+
+        With the live mirror every event bumps the version, so reading one
+        entity through ``peek`` would copy all entities per event.
+        """
+        with self._lock:
+            if self._entities is None:
+                return None
+            return self._entities.get(entity_id)
+
+    def peek(self) -> Optional[StateSnapshot]:
+        """Return the current snapshot without loading or touching metrics."""
+        with self._lock:
+            return self._materialize()
+
+    def is_fresh(self) -> bool:
+        """Whether the current snapshot can still be served."""
+        if self._entities is None or self._expired:
+            return False
+        return self._live or self.age() < self.ttl
+
+    def age(self) -> float:
+        """Seconds since the data was synchronised (0 while live)."""
+        if self._live:
+            return 0.0
+        return time.monotonic() - self._fetched_at
+
+    def lookup(self) -> Optional[List[Dict]]:
+        """Return cached states if fresh, otherwise ``None`` (records hit/miss).
+
+        Async callers use this together with ``replace`` to await their own
+        loader instead of passing a blocking one to ``get_states``.
+        """
+        if self.is_fresh():
+            snapshot = self.peek()
+            if snapshot is not None:
+                metrics_collector.record_state_cache_lookup(True, self.age())
+                return snapshot.states
+
+        metrics_collector.record_state_cache_lookup(
+            False, self.age() if self._entities is not None else 0.0
+        )
+        return None
+
+    def get_states(
+        self, loader: Callable[[], Optional[List[Dict]]]
+    ) -> Optional[List[Dict]]:
+        """Return cached states, reloading them with ``loader`` when stale."""
+        states = self.lookup()
+        if states is not None:
+            return states
+
+        since = self._invalidations
+        states = loader()
+        if states is None:
+            return None
+        return self.replace(states, since=since).states
+
+    def replace(
+        self, states: List[Dict], complete: bool = True, since: Optional[int] = None
+    ) -> StateSnapshot:
+        """Install a freshly fetched list of states as the current snapshot.
+
+        An incomplete list (e.g. a truncated download) is served to the
+        current caller but is already expired for the next one. ``since`` is
+        the value of ``invalidations`` taken before the fetch started: if the
+        store was invalidated meanwhile, the states may predate the change
+        and are installed already expired, so a load started before an
+        invalidation cannot make the store fresh again.
+        """
+        with self._lock:
+            previous = self._entities
+            self._entities = {state.get("entity_id", ""): state for state in states}
+            self._version += 1
+            self._fetched_at = time.monotonic()
+            stale = since is not None and since != self._invalidations
+            self._expired = not complete or stale
+            self._indexes = None
+            snapshot = self._materialize()
+            # Без живого зеркала изменения видны только при сравнении снимков
+            changes = []
+            if previous is not None:
+                changes = diff_states(previous, self._entities, complete)
+            if previous is None or not complete:
+                # Неполный снимок мог потерять сущности любого домена
+                self._generation += 1
+                self._domain_versions = {}
+            else:
+                for domain in {get_domain(entity_id) for entity_id, _, _ in changes}:
+                    self._bump_domain(domain)
+
+        logger.debug(
+            f"State snapshot v{snapshot.version} stored ({len(states)} entities)"
+        )
+        for entity_id, old_state, new_state in changes:
+            self._notify(entity_id, old_state, new_state)
+        return snapshot
+
+    def _bump_domain(self, domain: str):
+        self._domain_versions[domain] = self._domain_versions.get(domain, 0) + 1
+
+    def domain_version(self, domain: str) -> Tuple[int, int]:
+        """Version that changes only when entities of ``domain`` change.
+
+        Unlike ``version`` it survives a reload that brought the same states
+        for the domain, so results derived from one domain (rendered list
+        pages) stay valid across TTL reloads and unrelated live events.
+        """
+        return self._generation, self._domain_versions.get(domain, 0)
+
+    def add_listener(
+        self, listener: Callable[[str, Optional[Dict], Optional[Dict]], None]
+    ):
+        """Call ``listener(entity_id, old_state, new_state)`` on every change."""
+        self._listeners.append(listener)
+
+    def remove_listener(
+        self, listener: Callable[[str, Optional[Dict], Optional[Dict]], None]
+    ):
+        """Stop notifying a previously added listener."""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def apply_state(self, entity_id: str, new_state: Optional[Dict]):
+        """Apply a single entity change; ``None`` removes the entity."""
+        with self._lock:
+            if self._entities is None:
+                return
+            if new_state is None:
+                old_state = self._entities.pop(entity_id, None)
+                if old_state is None:
+                    return
+            else:
+                old_state = self._entities.get(entity_id)
+                self._entities[entity_id] = new_state
+            self._version += 1
+            self._bump_domain(get_domain(entity_id))
+
+            index = (self._indexes or {}).get(get_domain(entity_id))
+            if index is not None:
+                if new_state is None:
+                    index.remove(entity_id)
+                else:
+                    index.upsert(new_state)
+
+        self._notify(entity_id, old_state, new_state)
+
+    def _notify(
+        self, entity_id: str, old_state: Optional[Dict], new_state: Optional[Dict]
+    ):
+        """Deliver a change to listeners; a failing listener never breaks others."""
+        for listener in list(self._listeners):
+            try:
+                listener(entity_id, old_state, new_state)
+            except Exception as e:
+                logger.error(f"State listener error for {entity_id}: {e}")
+
+    def invalidate(self):
+        """Force the next read to fetch fresh states from Home Assistant.
+
+        Loads already in flight still install their states, but ``replace``
+        keeps the store expired for them (see its ``since`` argument).
+        """
+        if not self._live:
+            with self._lock:
+                self._expired = True
+                self._invalidations += 1
+
+    def domain_entities(self, states: List[Dict], domain: str) -> List[Dict]:
+        """Sorted projected entities of ``domain`` from ``states``.
+
+        When ``states`` is the store's current snapshot the maintained index
+        is used; any other list is filtered and sorted directly.
+        """
+        with self._lock:
+            index = self._index_for(states, domain)
+            if index is not None:
+                return list(index.rows)
+        return filter_domain(states, domain)
+
+    def domain_page(
+        self, states: List[Dict], domain: str, page: int, per_page: int
+    ) -> Tuple[List[Dict], int, int]:
+        """One page of ``domain_entities`` as ``(items, total, page)``.
+
+        Served from the index this costs only the page size.
+        """
+        with self._lock:
+            index = self._index_for(states, domain)
+            if index is not None:
+                return paginate(index.rows, page, per_page)
+        return paginate(filter_domain(states, domain), page, per_page)
+
+    def _index_for(self, states: List[Dict], domain: str) -> Optional[DomainIndex]:
+        """Index of ``domain`` if ``states`` is the current snapshot (lock held)."""
+        snapshot = self._snapshot
+        if (
+            domain not in DOMAIN_PROJECTIONS
+            or snapshot is None
+            or snapshot.states is not states
+            or snapshot.version != self._version
+        ):
+            return None
+        if self._indexes is None:
+            self._indexes = {}
+        index = self._indexes.get(domain)
+        if index is None:
+            index = DomainIndex(domain)
+            index.rebuild(states)
+            self._indexes[domain] = index
+        return index
+
+    def _materialize(self) -> Optional[StateSnapshot]:
+        """Build the immutable snapshot for the current version (lock held)."""
+        if self._entities is None:
+            return None
+        if self._snapshot is None or self._snapshot.version != self._version:
+            self._snapshot = StateSnapshot(
+                list(self._entities.values()), self._version, self._fetched_at
+            )
+        return self._snapshot
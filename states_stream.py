@@ -0,0 +1,161 @@
+"""
+Incremental parser for the ``/api/states`` JSON array
+"""
+
+import codecs
+import json
+import logging
+import re
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Поля и атрибуты состояния, которые реально читают бот и веб-интерфейс
+STREAM_FIELDS = ("entity_id", "state", "last_changed", "last_updated")
+STREAM_ATTRIBUTES = (
+    "friendly_name",
+    "unit_of_measurement",
+    "device_class",
+    "brightness",
+    "color_temp",
+)
+
+# Размер чанка при чтении тела ответа
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def project_state(state: Dict) -> Dict:
+    """Keep only the fields of a raw state that the application reads."""
+    projected = {field: state[field] for field in STREAM_FIELDS if field in state}
+    attributes = state.get("attributes") or {}
+    projected["attributes"] = {
+        name: attributes[name] for name in STREAM_ATTRIBUTES if name in attributes
+    }
+    return projected
+
+
+class StatesStreamParser:
+    """Parse a JSON array of entity states chunk by chunk.
+
+    Each complete element is projected with ``project_state`` and its raw
+    text dropped right away, so memory is bounded by one entity plus one
+    chunk instead of the whole body. ``complete`` is set only once the
+    closing bracket is seen; entities parsed before a truncated or malformed
+    tail stay available in ``states``.
+    """
+
+    def __init__(self, max_entity_size: int = 1024 * 1024):
+        self.max_entity_size = max_entity_size
+        self.states: List[Dict] = []
+        self.complete = False
+        self.error: Optional[str] = None
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._started = False
+        self._after_element = False
+
+    def feed(self, chunk: bytes) -> int:
+        """Consume a chunk of the body; returns the number of new entities."""
+        if self.complete or self.error is not None:
+            return 0
+        try:
+            self._buffer += self._utf8.decode(chunk)
+        except UnicodeDecodeError as e:
+            self.error = f"invalid UTF-8: {e}"
+            return 0
+        return self._parse()
+
+    def close(self):
+        """Signal the end of the body; a missing ``]`` marks it truncated."""
+        if self.complete or self.error is not None:
+            return
+        try:
+            self._buffer += self._utf8.decode(b"", final=True)
+        except UnicodeDecodeError as e:
+            self.error = f"invalid UTF-8: {e}"
+            return
+        self._parse()
+        if not self.complete and self.error is None:
+            self.error = f"truncated after {len(self.states)} entities"
+
+    def _parse(self) -> int:
+        """Decode every complete element currently in the buffer."""
+        buffer = self._buffer
+        length = len(buffer)
+        pos = 0
+        parsed = 0
+
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos >= length:
+                break
+
+            char = buffer[pos]
+            if not self._started:
+                if char != "[":
+                    self.error = f"expected '[' at start of body, got {char!r}"
+                    break
+                self._started = True
+                pos += 1
+                continue
+
+            if char == "]":
+                self.complete = True
+                pos += 1
+                break
+
+            if self._after_element:
+                if char != ",":
+                    self.error = f"expected ',' between entities, got {char!r}"
+                    break
+                self._after_element = False
+                pos += 1
+                continue
+
+            try:
+                state, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Элемент ещё не пришёл целиком (или испорчен) - ждём данных
+                if length - pos > self.max_entity_size:
+                    self.error = (
+                        f"entity exceeds {self.max_entity_size} bytes or is malformed"
+                    )
+                break
+
+            if isinstance(state, dict):
+                self.states.append(project_state(state))
+                parsed += 1
+            pos = end
+            self._after_element = True
+
+        self._buffer = buffer[pos:]
+        return parsed
+
+
+def finish_stream(parser: StatesStreamParser) -> Optional[StatesStreamParser]:
+    """Close the parser, report the outcome and drop results that are unusable.
+
+    Returns ``None`` when not even one entity could be parsed from a broken
+    body, otherwise the parser with ``states`` and ``complete``.
+    """
+    parser.close()
+    if parser.complete:
+        result = "complete"
+    elif parser.states:
+        result = "partial"
+        logger.warning(
+            f"Streaming /api/states stopped early ({parser.error}), "
+            f"using {len(parser.states)} parsed entities"
+        )
+    else:
+        result = "failed"
+        logger.error(f"Streaming /api/states failed: {parser.error}")
+    metrics_collector.record_states_stream(result, len(parser.states))
+    return None if result == "failed" else parser
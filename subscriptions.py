@@ -0,0 +1,309 @@
+"""
+Entity change subscriptions (/watch) and their delivery to chats
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+from fnmatch import fnmatchcase
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from telegram.error import Forbidden
+
+from entities import get_domain
+from entities import is_pattern
+from metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# entity_id, домен или шаблон со * ? [ ]
+PATTERN_RE = re.compile(r"^[a-z0-9_*?\[\]]+(\.[a-z0-9_*?\[\]]+)?$")
+
+Change = Tuple[str, Optional[Dict], Optional[Dict]]
+Notify = Callable[[Hashable, List[Change]], Awaitable[None]]
+
+
+def normalize_pattern(pattern: str) -> Optional[str]:
+    """Canonical form of a /watch argument, ``None`` if it is not valid.
+
+    A bare domain (``light``) means every entity of it, like ``light.*``.
+    """
+    pattern = pattern.strip().lower()
+    if not PATTERN_RE.match(pattern):
+        return None
+    if "." not in pattern:
+        return pattern if is_pattern(pattern) else f"{pattern}.*"
+    return pattern
+
+
+def pattern_kind(pattern: str) -> Tuple[str, str]:
+    """Which index a normalized pattern lives in and under which key.
+
+    ``("entity", entity_id)`` for exact ids, ``("domain", domain)`` for
+    ``domain.*`` and ``("glob", domain)`` for other globs, where the domain is
+    ``""`` unless the pattern names it literally.
+    """
+    if not is_pattern(pattern):
+        return "entity", pattern
+    domain, _, rest = pattern.partition(".")
+    if is_pattern(domain):
+        return "glob", ""
+    if rest == "*":
+        return "domain", domain
+    return "glob", domain
+
+
+class SubscriptionRegistry:
+    """Who watches which entities, indexed for matching a single change.
+
+    Exact entity_ids and whole domains are dictionary lookups; globs are
+    bucketed by their literal domain, so a change is only compared with the
+    globs of its own domain and those spanning every domain. The registry is
+    saved to ``path`` (JSON) after every change and loaded on start.
+    """
+
+    def __init__(self, path: Optional[str] = None, limit: int = 50):
+        self.path = path
+        self.limit = limit
+        self._by_chat: Dict[Hashable, Set[str]] = {}
+        self._entities: Dict[str, Set[Hashable]] = {}
+        self._domains: Dict[str, Set[Hashable]] = {}
+        self._globs: Dict[str, Dict[str, Set[Hashable]]] = {}
+        if path:
+            self._load()
+
+    @classmethod
+    def from_env(cls) -> "SubscriptionRegistry":
+        """Build from ``BOT_SUBSCRIPTIONS_FILE`` and ``BOT_WATCH_LIMIT``."""
+        return cls(
+            path=os.getenv("BOT_SUBSCRIPTIONS_FILE", "subscriptions.json") or None,
+            limit=int(os.getenv("BOT_WATCH_LIMIT", "50")),
+        )
+
+    def __len__(self) -> int:
+        return sum(len(patterns) for patterns in self._by_chat.values())
+
+    def _index(self, pattern: str) -> Tuple[Dict, str]:
+        kind, key = pattern_kind(pattern)
+        if kind == "entity":
+            return self._entities, key
+        if kind == "domain":
+            return self._domains, key
+        return self._globs.setdefault(key, {}), pattern
+
+    def add(self, chat_id: Hashable, pattern: str) -> bool:
+        """Subscribe a chat; ``False`` if it already watches ``pattern``.
+
+        Raises ``ValueError`` when the chat has reached the limit.
+        """
+        patterns = self._by_chat.setdefault(chat_id, set())
+        if pattern in patterns:
+            return False
+        if len(patterns) >= self.limit:
+            raise ValueError(f"Subscription limit of {self.limit} reached")
+        patterns.add(pattern)
+        index, key = self._index(pattern)
+        index.setdefault(key, set()).add(chat_id)
+        self._changed()
+        return True
+
+    def remove(self, chat_id: Hashable, pattern: str) -> bool:
+        """Unsubscribe a chat from one pattern."""
+        patterns = self._by_chat.get(chat_id)
+        if not patterns or pattern not in patterns:
+            return False
+        self._discard(chat_id, pattern)
+        self._changed()
+        return True
+
+    def remove_chat(self, chat_id: Hashable) -> int:
+        """Drop every subscription of a chat; returns how many there were."""
+        patterns = list(self._by_chat.get(chat_id, ()))
+        for pattern in patterns:
+            self._discard(chat_id, pattern)
+        if patterns:
+            self._changed()
+        return len(patterns)
+
+    def _discard(self, chat_id: Hashable, pattern: str):
+        patterns = self._by_chat[chat_id]
+        patterns.discard(pattern)
+        if not patterns:
+            del self._by_chat[chat_id]
+        kind, domain = pattern_kind(pattern)
+        index, key = self._index(pattern)
+        chats = index.get(key)
+        if chats is not None:
+            chats.discard(chat_id)
+            if not chats:
+                del index[key]
+        if kind == "glob" and not self._globs.get(domain):
+            self._globs.pop(domain, None)
+
+    def patterns(self, chat_id: Hashable) -> List[str]:
+        """Sorted patterns a chat watches."""
+        return sorted(self._by_chat.get(chat_id, ()))
+
+    def match(self, entity_id: str) -> Set[Hashable]:
+        """Chats watching ``entity_id``."""
+        chats = set(self._entities.get(entity_id, ()))
+        domain = get_domain(entity_id)
+        chats.update(self._domains.get(domain, ()))
+        for bucket in (self._globs.get(domain), self._globs.get("")):
+            for pattern, subscribers in (bucket or {}).items():
+                if fnmatchcase(entity_id, pattern):
+                    chats.update(subscribers)
+        return chats
+
+    def _changed(self):
+        metrics_collector.update_watch_subscriptions(len(self))
+        if self.path:
+            self._save()
+
+    def _save(self):
+        data = {
+            "version": 1,
+            "subscriptions": [
+                {"chat_id": chat_id, "pattern": pattern}
+                for chat_id, patterns in self._by_chat.items()
+                for pattern in sorted(patterns)
+            ],
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            # Запись во временный файл и переименование: файл не бывает обрезан
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Could not save subscriptions to {self.path}: {e}")
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load subscriptions from {self.path}: {e}")
+            return
+
+        for item in data.get("subscriptions", []):
+            pattern = normalize_pattern(str(item.get("pattern", "")))
+            if pattern is None or "chat_id" not in item:
+                continue
+            patterns = self._by_chat.setdefault(item["chat_id"], set())
+            patterns.add(pattern)
+            index, key = self._index(pattern)
+            index.setdefault(key, set()).add(item["chat_id"])
+        metrics_collector.update_watch_subscriptions(len(self))
+        logger.info(f"Loaded {len(self)} subscriptions from {self.path}")
+
+
+class WatchDispatcher:
+    """Fans state changes out to subscribed chats with per-chat debounce.
+
+    Changes for one chat are collected for ``debounce`` seconds after the
+    first one and delivered together through ``notify(chat_id, changes)``,
+    one entry per entity with its state before the window and its latest
+    state. An entity that returns to its original state within the window
+    is not reported. Only changes of the ``state`` value count; attribute
+    updates are ignored.
+    """
+
+    def __init__(self, registry: SubscriptionRegistry, debounce: float = 5.0):
+        self.registry = registry
+        self.debounce = debounce
+        self._notify: Optional[Notify] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[Hashable, Dict[str, List]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls, registry: SubscriptionRegistry) -> "WatchDispatcher":
+        """Build with the ``BOT_WATCH_DEBOUNCE`` window."""
+        return cls(registry, debounce=float(os.getenv("BOT_WATCH_DEBOUNCE", "5")))
+
+    def start(self, notify: Notify):
+        """Deliver through ``notify`` on the running event loop."""
+        self._notify = notify
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        """Stop delivering; changes still waiting for their window are dropped."""
+        self._loop = None
+        self._pending.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def on_state_change(
+        self, entity_id: str, old_state: Optional[Dict], new_state: Optional[Dict]
+    ):
+        """State store listener; may be called from another thread."""
+        loop = self._loop
+        if loop is None or _state(old_state) == _state(new_state):
+            return
+        chats = self.registry.match(entity_id)
+        if chats:
+            loop.call_soon_threadsafe(
+                self._collect, chats, entity_id, old_state, new_state
+            )
+
+    def _collect(self, chats, entity_id: str, old_state, new_state):
+        for chat_id in chats:
+            pending = self._pending.get(chat_id)
+            if pending is None:
+                pending = self._pending[chat_id] = {}
+                self._loop.call_later(self.debounce, self._flush, chat_id)
+            if entity_id in pending:
+                pending[entity_id][1] = new_state
+            else:
+                pending[entity_id] = [old_state, new_state]
+
+    def _flush(self, chat_id: Hashable):
+        pending = self._pending.pop(chat_id, None)
+        if not pending or self._notify is None:
+            return
+        changes = [
+            (entity_id, old_state, new_state)
+            for entity_id, (old_state, new_state) in pending.items()
+            if _state(old_state) != _state(new_state)
+        ]
+        if not changes:
+            metrics_collector.record_watch_notification("debounced")
+            return
+        task = self._loop.create_task(self._deliver(chat_id, changes))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, chat_id: Hashable, changes: List[Change]):
+        try:
+            await self._notify(chat_id, changes)
+        except Forbidden as e:
+            # Бот заблокирован или удалён из чата - подписки больше не нужны
+            logger.info(f"Dropping subscriptions of chat {chat_id}: {e}")
+            self.registry.remove_chat(chat_id)
+            metrics_collector.record_watch_notification("forbidden")
+            return
+        except Exception as e:
+            logger.error(f"Watch notification to chat {chat_id} failed: {e}")
+            metrics_collector.record_watch_notification("error")
+            return
+        metrics_collector.record_watch_notification("sent")
+
+
+def _state(state: Optional[Dict]) -> Optional[str]:
+    return state.get("state") if state is not None else None
@@ -2,7 +2,11 @@
 Simplified pytest configuration for Home Assistant Telegram Bot tests
 """
 
+import json
 import os
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
 from unittest.mock import AsyncMock
 from unittest.mock import Mock
 
@@ -15,6 +19,8 @@ os.environ.update(
         "HOME_ASSISTANT_TOKEN": "test_token_123",
         "TELEGRAM_BOT_TOKEN": "test_bot_token_456",
         "SESSION_SECRET": "test_secret_key",
+        # Метрики обновляются синхронно при запросе, без фонового потока
+        "METRICS_REFRESH_INTERVAL": "0",
     }
 )
 
@@ -49,6 +55,26 @@ def mock_home_assistant():
     return mock_ha
 
 
+@pytest.fixture
+def mock_update():
+    """Mock Telegram update with an async message API"""
+    update = Mock()
+    update.effective_user.id = 123456
+    update.effective_chat.id = 123456
+    loading_message = Mock()
+    loading_message.edit_text = AsyncMock()
+    update.message.reply_text = AsyncMock(return_value=loading_message)
+    return update
+
+
+@pytest.fixture
+def mock_context():
+    """Mock Telegram handler context"""
+    context = Mock()
+    context.args = []
+    return context
+
+
 @pytest.fixture
 def flask_app():
     """Flask application test client"""
@@ -76,3 +102,54 @@ def mock_metrics():
     }
 
     return mock_metrics
+
+
+@pytest.fixture
+def fake_ha(monkeypatch):
+    """Local fake Home Assistant; the environment points new clients at it"""
+    from benchmarks.fake_ha import FakeHomeAssistant
+
+    with FakeHomeAssistant(entities=200, websocket=True) as fake:
+        for name, value in fake.env().items():
+            monkeypatch.setenv(name, value)
+        yield fake
+
+
+@pytest.fixture
+def keepalive_server():
+    """Local HTTP/1.1 server answering /api/* that counts TCP connections"""
+    connections = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            connections.append(self.client_address)
+
+        def _reply(self, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._reply({"entity_id": self.path.rsplit("/", 1)[-1], "state": "on"})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self._reply([])
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.connections = connections
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
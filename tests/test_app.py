@@ -95,6 +95,15 @@ class TestFlaskApp:
         assert b"app_uptime_seconds" in response.data
         assert b"app_memory_usage_bytes" in response.data
 
+    def test_metrics_endpoint_gzip(self, flask_app):
+        """Test /metrics serves the compressed copy when accepted"""
+        import gzip
+
+        response = flask_app.get("/metrics", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert b"app_uptime_seconds" in gzip.decompress(response.data)
+
     @patch("app.metrics_collector")
     def test_api_metrics_summary(self, mock_metrics, flask_app):
         """Test /api/metrics-summary endpoint"""
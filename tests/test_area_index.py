@@ -0,0 +1,104 @@
+"""
+Tests for the area to entity index
+"""
+
+from area_index import AreaIndex
+
+AREAS = [
+    {"area_id": "kitchen", "name": "Kitchen"},
+    {"area_id": "living_room", "name": "Living Room"},
+]
+DEVICES = [
+    {"id": "dev_lamp", "area_id": "kitchen"},
+    {"id": "dev_tv", "area_id": "living_room"},
+]
+ENTITIES = [
+    {"entity_id": "light.lamp", "device_id": "dev_lamp", "area_id": None},
+    {"entity_id": "switch.lamp_usb", "device_id": "dev_lamp", "area_id": None},
+    {
+        "entity_id": "sensor.lamp_power",
+        "device_id": "dev_lamp",
+        "area_id": "living_room",
+    },
+    {"entity_id": "media_player.tv", "device_id": "dev_tv", "area_id": None},
+]
+
+
+def make_index():
+    index = AreaIndex()
+    index.load(AREAS, DEVICES, ENTITIES)
+    return index
+
+
+class TestAreaIndex:
+    """Test cases for AreaIndex"""
+
+    def test_entities_inherit_device_area(self):
+        """Test device inheritance and entity-level overrides"""
+        index = make_index()
+
+        assert index.entities("kitchen") == ["light.lamp", "switch.lamp_usb"]
+        assert index.entities("living_room", ("sensor",)) == ["sensor.lamp_power"]
+
+    def test_find_area_by_id_or_name(self):
+        """Test case-insensitive lookup by name or id"""
+        index = make_index()
+
+        assert index.find_area("living room") == "living_room"
+        assert index.find_area("KITCHEN") == "kitchen"
+        assert index.find_area("garage") is None
+
+    def test_device_move_reassigns_only_its_entities(self):
+        """Test that moving a device moves entities without an override"""
+        index = make_index()
+
+        index.set_devices([{"id": "dev_lamp", "area_id": "living_room"}, DEVICES[1]])
+
+        assert index.entities("kitchen") == []
+        assert index.entities("living_room") == [
+            "light.lamp",
+            "media_player.tv",
+            "sensor.lamp_power",
+            "switch.lamp_usb",
+        ]
+
+    def test_entity_upsert_and_remove(self):
+        """Test incremental entity registry updates"""
+        index = make_index()
+
+        index.upsert_entity(
+            {
+                "entity_id": "light.lamp",
+                "device_id": "dev_lamp",
+                "area_id": "living_room",
+            }
+        )
+        index.remove_entity("switch.lamp_usb")
+
+        assert index.entities("kitchen") == []
+        assert "light.lamp" in index.entities("living_room")
+
+    def test_area_removed_and_created(self):
+        """Test that area listings drop members and pick up late areas"""
+        index = make_index()
+        index.upsert_entity(
+            {"entity_id": "light.garage", "device_id": None, "area_id": "garage"}
+        )
+        assert index.find_area("garage") is None
+
+        index.set_areas([AREAS[1], {"area_id": "garage", "name": "Garage"}])
+
+        assert index.entities("kitchen") == []
+        assert index.entities("garage") == ["light.garage"]
+
+    def test_load_members_from_template(self):
+        """Test the REST template fallback"""
+        index = AreaIndex()
+        assert not index.is_fresh(300)
+
+        index.load_members(
+            [{"area_id": "kitchen", "name": "Kitchen", "entities": ["light.a"]}]
+        )
+
+        assert index.is_fresh(300)
+        assert index.entities("kitchen") == ["light.a"]
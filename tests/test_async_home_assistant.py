@@ -0,0 +1,381 @@
+"""
+Tests for the asyncio Home Assistant API client
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from async_home_assistant import AsyncHomeAssistantAPI
+
+STATES = [
+    {
+        "entity_id": "light.kitchen",
+        "state": "on",
+        "attributes": {"friendly_name": "Kitchen Light"},
+    },
+    {
+        "entity_id": "switch.pump",
+        "state": "off",
+        "attributes": {"friendly_name": "Water Pump"},
+    },
+    {
+        "entity_id": "sensor.temp",
+        "state": "21.5",
+        "attributes": {"friendly_name": "Temperature", "unit_of_measurement": "°C"},
+    },
+]
+
+
+def make_api(handler):
+    """Build a client whose HTTP traffic goes to ``handler``"""
+    requests = []
+
+    async def recording_handler(request):
+        requests.append(request)
+        return await handler(request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(recording_handler))
+    return AsyncHomeAssistantAPI(client=client), requests
+
+
+async def states_handler(request):
+    if request.url.path == "/api/states":
+        return httpx.Response(200, json=STATES)
+    if request.url.path.startswith("/api/services/"):
+        return httpx.Response(200, json=[])
+    return httpx.Response(404, text="not found")
+
+
+class TestAsyncHomeAssistantAPI:
+    """Test cases for AsyncHomeAssistantAPI"""
+
+    @pytest.mark.asyncio
+    async def test_get_all_states(self):
+        """Test fetching all states with auth header"""
+        ha, requests = make_api(states_handler)
+
+        states = await ha.get_all_states()
+
+        assert len(states) == 3
+        assert requests[0].headers["Authorization"] == "Bearer test_token_123"
+        assert str(requests[0].url) == "http://test-ha.local:8123/api/states"
+
+    @pytest.mark.asyncio
+    async def test_domain_filters_share_snapshot(self):
+        """Test that lights/switches/sensors are served from one download"""
+        ha, requests = make_api(states_handler)
+
+        lights = await ha.get_lights()
+        switches = await ha.get_switches()
+        sensors = await ha.get_sensors()
+
+        assert [light["entity_id"] for light in lights] == ["light.kitchen"]
+        assert switches[0]["friendly_name"] == "Water Pump"
+        assert sensors[0]["unit"] == "°C"
+        assert len(requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_get_entities_page(self):
+        """Test paging a domain out of the shared snapshot"""
+        ha, requests = make_api(states_handler)
+
+        items, total, page = await ha.get_entities_page("sensor", 5, 6)
+
+        assert [item["entity_id"] for item in items] == ["sensor.temp"]
+        assert (total, page) == (1, 1)
+        assert len(requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_reads_are_coalesced(self):
+        """Test that handlers asking at the same time share one download"""
+
+        async def slow_handler(request):
+            await asyncio.sleep(0.05)
+            return await states_handler(request)
+
+        ha, requests = make_api(slow_handler)
+
+        results = await asyncio.gather(
+            ha.get_lights(), ha.get_switches(), ha.get_sensors(), ha.get_all_states()
+        )
+
+        assert [len(result) for result in results] == [1, 1, 1, 3]
+        assert len(requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_request_failure_returns_none(self):
+        """Test that HTTP errors are reported as None"""
+
+        async def failing_handler(request):
+            return httpx.Response(500, text="boom")
+
+        ha, _ = make_api(failing_handler)
+
+        assert await ha.get_all_states() is None
+        assert await ha.get_switches() == []
+
+    @pytest.mark.asyncio
+    async def test_call_service(self):
+        """Test service call payload and snapshot invalidation"""
+        ha, requests = make_api(states_handler)
+        await ha.get_all_states()
+
+        assert await ha.turn_on_light("light.kitchen") is True
+
+        assert requests[-1].url.path == "/api/services/light/turn_on"
+        assert json.loads(requests[-1].content) == {"entity_id": "light.kitchen"}
+        assert not ha.state_store.is_fresh()
+
+    @pytest.mark.asyncio
+    async def test_load_overlapping_command_stays_expired(self):
+        """Test that states fetched before a command do not look fresh after it"""
+        release = asyncio.Event()
+
+        async def blocked_states(request):
+            if request.url.path == "/api/states":
+                await release.wait()
+            return await states_handler(request)
+
+        ha, _ = make_api(blocked_states)
+        load = asyncio.create_task(ha.get_all_states())
+        await asyncio.sleep(0.01)
+
+        assert await ha.turn_on_light("light.kitchen") is True
+        release.set()
+        assert len(await load) == 3
+
+        assert not ha.state_store.is_fresh()
+
+    @pytest.mark.asyncio
+    async def test_bulk_command_one_call_per_domain(self):
+        """Test that matched entities are sent as one list per domain"""
+        ha, requests = make_api(states_handler)
+
+        result = await ha.bulk_command(
+            "turn_off", ["light.*", "switch.pump", "fan.x"], ("light", "switch")
+        )
+
+        service_calls = sorted(
+            (request.url.path, json.loads(request.content))
+            for request in requests
+            if request.method == "POST"
+        )
+        assert service_calls == [
+            ("/api/services/light/turn_off", {"entity_id": ["light.kitchen"]}),
+            ("/api/services/switch/turn_off", {"entity_id": ["switch.pump"]}),
+        ]
+        assert result == {
+            "succeeded": ["light.kitchen", "switch.pump"],
+            "failed": [],
+            "unmatched": ["fan.x"],
+        }
+
+    @pytest.mark.asyncio
+    async def test_slow_request_does_not_block_loop(self):
+        """Test that a slow Home Assistant call only suspends its caller"""
+        release = asyncio.Event()
+
+        async def slow_handler(request):
+            await release.wait()
+            return await states_handler(request)
+
+        ha, _ = make_api(slow_handler)
+        slow_call = asyncio.create_task(ha.get_all_states())
+
+        # Другие корутины продолжают работать, пока запрос висит
+        await asyncio.sleep(0.01)
+        assert not slow_call.done()
+        release.set()
+
+        assert len(await slow_call) == 3
+
+
+class TestRooms:
+    """Test cases for area based room commands"""
+
+    @pytest.mark.asyncio
+    async def test_room_command_one_call_per_domain(self):
+        """Test that a room is switched with one service call per domain"""
+        rows = [
+            {
+                "area_id": "kitchen",
+                "name": "Kitchen",
+                "entities": ["light.kitchen", "switch.pump", "sensor.temp"],
+            }
+        ]
+
+        async def handler(request):
+            if request.url.path == "/api/template":
+                return httpx.Response(200, text=json.dumps(rows))
+            return await states_handler(request)
+
+        ha, requests = make_api(handler)
+
+        result = await ha.room_command("kitchen", "turn_off")
+        await ha.room_command("Kitchen", "turn_on")
+
+        service_paths = sorted(
+            request.url.path
+            for request in requests
+            if request.url.path.startswith("/api/services/")
+        )
+        assert service_paths == [
+            "/api/services/light/turn_off",
+            "/api/services/light/turn_on",
+            "/api/services/switch/turn_off",
+            "/api/services/switch/turn_on",
+        ]
+        assert result["name"] == "Kitchen"
+        assert sorted(result["succeeded"]) == ["light.kitchen", "switch.pump"]
+        # Индекс зон загружен один раз и переиспользован
+        assert [r.url.path for r in requests].count("/api/template") == 1
+
+    @pytest.mark.asyncio
+    async def test_get_room_states(self):
+        """Test the room status view data"""
+
+        async def handler(request):
+            if request.url.path == "/api/template":
+                return httpx.Response(
+                    200,
+                    text=json.dumps(
+                        [
+                            {
+                                "area_id": "hall",
+                                "name": "Hall",
+                                "entities": ["sensor.temp"],
+                            }
+                        ]
+                    ),
+                )
+            return await states_handler(request)
+
+        ha, _ = make_api(handler)
+
+        room = await ha.get_room("hall")
+
+        assert room["name"] == "Hall"
+        assert [state["state"] for state in room["states"]] == ["21.5"]
+        assert await ha.get_room("garage") is None
+
+
+class TestStreamingStates:
+    """Test cases for streaming /api/states downloads"""
+
+    @pytest.mark.asyncio
+    async def test_stream_complete(self, monkeypatch):
+        """Test that a streamed snapshot is projected and cached"""
+        monkeypatch.setenv("HA_STREAM_STATES", "true")
+        ha, requests = make_api(states_handler)
+
+        states = await ha.get_all_states()
+        await ha.get_all_states()
+
+        assert [state["entity_id"] for state in states] == [
+            "light.kitchen",
+            "switch.pump",
+            "sensor.temp",
+        ]
+        assert states[2]["attributes"]["unit_of_measurement"] == "°C"
+        assert len(requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_stream_truncated(self, monkeypatch):
+        """Test that a truncated body serves parsed entities once"""
+        monkeypatch.setenv("HA_STREAM_STATES", "true")
+        body = json.dumps(STATES).encode()
+
+        async def truncated_handler(request):
+            return httpx.Response(200, content=body[:-30])
+
+        ha, _ = make_api(truncated_handler)
+
+        states = await ha.get_all_states()
+
+        assert [state["entity_id"] for state in states] == [
+            "light.kitchen",
+            "switch.pump",
+        ]
+        assert not ha.state_store.is_fresh()
+
+
+class TestWaitForState:
+    """Test cases for non-blocking state confirmation"""
+
+    @pytest.mark.asyncio
+    async def test_polls_until_state_reached(self):
+        """Test that polling stops as soon as the target state is reported"""
+        polls = []
+
+        async def handler(request):
+            polls.append(request)
+            state = "on" if len(polls) >= 3 else "off"
+            return httpx.Response(
+                200, json={"entity_id": "light.kitchen", "state": state}
+            )
+
+        ha, _ = make_api(handler)
+        ha.confirm_poll_min = 0.01
+
+        assert await ha.wait_for_state("light.kitchen", "on", timeout=2) is True
+        assert len(polls) == 3
+
+    @pytest.mark.asyncio
+    async def test_times_out(self):
+        """Test that the deadline is respected"""
+
+        async def handler(request):
+            return httpx.Response(
+                200, json={"entity_id": "light.kitchen", "state": "off"}
+            )
+
+        ha, _ = make_api(handler)
+        ha.confirm_poll_min = 0.01
+
+        started = asyncio.get_running_loop().time()
+        assert await ha.wait_for_state("light.kitchen", "on", timeout=0.1) is False
+        assert asyncio.get_running_loop().time() - started < 1
+
+    @pytest.mark.asyncio
+    async def test_event_driven_with_live_mirror(self):
+        """Test that a live mirror wakes the waiter without HTTP polling"""
+        ha, requests = make_api(states_handler)
+        ha.state_store.replace([{"entity_id": "light.kitchen", "state": "off"}])
+        ha.state_store.set_live(True)
+
+        async def flip():
+            await asyncio.sleep(0.05)
+            ha.state_store.apply_state(
+                "light.kitchen", {"entity_id": "light.kitchen", "state": "on"}
+            )
+
+        flipper = asyncio.create_task(flip())
+        assert await ha.wait_for_state("light.kitchen", "on", timeout=2) is True
+        await flipper
+
+        assert requests == []
+        assert ha.state_store._listeners == []
+
+
+class TestAsyncConnectionPool:
+    """Test cases for keep-alive reuse in the async client"""
+
+    @pytest.mark.asyncio
+    async def test_connections_are_reused(self, keepalive_server, monkeypatch):
+        """Test that consecutive requests reuse one TCP connection"""
+        monkeypatch.setenv("HOME_ASSISTANT_URL", keepalive_server.base_url)
+        ha = AsyncHomeAssistantAPI()
+
+        try:
+            for _ in range(3):
+                state = await ha.get_entity_state("light.kitchen")
+                assert state["state"] == "on"
+        finally:
+            await ha.close()
+
+        assert len(keepalive_server.connections) == 1
+        assert ha._pool_requests == 3
+        assert ha._pool_new_connections == 1
@@ -48,8 +48,7 @@ class TestBasicFunctionality:
 
         collector = MetricsCollector()
         assert collector.start_time is not None
-        assert collector.active_users_cache == set()
-        assert collector.last_cleanup is not None
+        assert collector.active_users.counts()["24h"] == 0
 
     def test_flask_app_creation(self):
         """Test Flask app creation"""
@@ -0,0 +1,43 @@
+"""
+Tests for the benchmark helpers
+"""
+
+from benchmarks.micro import compare
+from benchmarks.micro import run_benchmarks
+from benchmarks.synthetic import generate_states
+
+
+class TestSyntheticStates:
+    """Test cases for the synthetic state generator"""
+
+    def test_deterministic(self):
+        """The same seed gives the same states"""
+        assert generate_states(50, seed=1) == generate_states(50, seed=1)
+        assert generate_states(50, seed=1) != generate_states(50, seed=2)
+
+    def test_shape(self):
+        """States look like /api/states entries with unique ids"""
+        states = generate_states(500)
+        assert len({state["entity_id"] for state in states}) == 500
+        lights = [s for s in states if s["entity_id"].startswith("light.")]
+        assert lights
+        assert "brightness" in lights[0]["attributes"]
+        assert all("friendly_name" in s["attributes"] for s in states)
+
+
+class TestMicroBenchmarks:
+    """Test cases for the micro-benchmark runner"""
+
+    def test_report_and_compare(self):
+        """A tiny run produces a comparable machine-readable report"""
+        report = run_benchmarks([20], names=["get_lights", "bot.lights_page"], repeat=1)
+
+        assert [r["name"] for r in report["results"]] == [
+            "get_lights",
+            "bot.lights_page",
+        ]
+        assert report["results"][0]["entities"] == 20
+        assert report["results"][0]["median_ms"] >= 0
+
+        rows = compare(report, report)
+        assert [row["ratio"] for row in rows] == [1.0, 1.0]
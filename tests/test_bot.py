@@ -3,6 +3,7 @@ Tests for Telegram bot functionality
 """
 
 from unittest.mock import AsyncMock
+from unittest.mock import Mock
 from unittest.mock import patch
 
 import pytest
@@ -11,6 +12,8 @@ from bot import help_command
 from bot import light_off
 from bot import light_on
 from bot import lights
+from bot import page_callback
+from bot import room
 from bot import sensors
 from bot import start
 from bot import status
@@ -220,3 +223,309 @@ class TestTelegramBot:
         call_args = mock_update.message.reply_text.call_args[0][0]
         assert "Укажите ID света" in call_args
         assert "/light_off light.bedroom" in call_args
+
+
+class TestAsyncHomeAssistantHandlers:
+    """Handlers await the asyncio Home Assistant client"""
+
+    @pytest.mark.asyncio
+    @patch("bot.ha_api")
+    async def test_status_awaits_client(self, mock_ha_api, mock_update, mock_context):
+        """Test /status with the async client"""
+        mock_ha_api.get_all_states = AsyncMock(
+            return_value=[
+                {"entity_id": "light.test", "state": "on"},
+                {"entity_id": "switch.test", "state": "off"},
+            ]
+        )
+        mock_ha_api.get_current_time.return_value = "2024-01-01 00:00:00"
+
+        await status(mock_update, mock_context)
+
+        mock_ha_api.get_all_states.assert_awaited_once()
+        call_args = mock_update.message.reply_text.call_args[0][0]
+        assert "Total entities: 2" in call_args
+
+    @pytest.mark.asyncio
+    @patch("bot.ha_api")
+    async def test_switches_awaits_client(self, mock_ha_api, mock_update, mock_context):
+        """Test /switches renders data from the async client"""
+        mock_ha_api.get_entities_page = AsyncMock(
+            return_value=(
+                [{"entity_id": "switch.fan", "state": "on", "friendly_name": "Fan"}],
+                1,
+                1,
+            )
+        )
+
+        await switches(mock_update, mock_context)
+
+        mock_ha_api.get_entities_page.assert_awaited_once_with("switch", 1, 8)
+
+        loading_message = mock_update.message.reply_text.return_value
+        call_args = loading_message.edit_text.call_args[0][0]
+        assert "Fan" in call_args
+        assert "switch.fan" in call_args
+
+    @pytest.mark.asyncio
+    @patch("bot.ha_api")
+    async def test_light_on_waits_asynchronously(
+        self, mock_ha_api, mock_update, mock_context
+    ):
+        """Test /light_on confirms the state without blocking the loop"""
+        mock_context.args = ["light.kitchen"]
+        mock_ha_api.get_entity_state = AsyncMock(return_value={"state": "off"})
+        mock_ha_api.turn_on_light = AsyncMock(return_value=True)
+        mock_ha_api.wait_for_state = AsyncMock(return_value=True)
+
+        with patch("time.sleep") as mock_sleep:
+            await light_on(mock_update, mock_context)
+
+        mock_sleep.assert_not_called()
+        mock_ha_api.wait_for_state.assert_awaited_once_with("light.kitchen", "on")
+        call_args = mock_update.message.reply_text.call_args[0][0]
+        assert "включено" in call_args
+        assert "⏳" not in call_args
+
+    @pytest.mark.asyncio
+    @patch("bot.ha_api")
+    async def test_bulk_light_off_single_reply(
+        self, mock_ha_api, mock_update, mock_context
+    ):
+        """Test that a glob is executed as one bulk command with one reply"""
+        mock_context.args = ["light.kitchen_*", "light.missing_*"]
+        mock_ha_api.bulk_command = AsyncMock(
+            return_value={
+                "succeeded": ["light.kitchen_main", "light.kitchen_table"],
+                "failed": [],
+                "unmatched": ["light.missing_*"],
+            }
+        )
+
+        await light_off(mock_update, mock_context)
+
+        mock_ha_api.bulk_command.assert_awaited_once_with(
+            "turn_off", ["light.kitchen_*", "light.missing_*"], ("light",)
+        )
+        mock_update.message.reply_text.assert_called_once()
+        call_args = mock_update.message.reply_text.call_args[0][0]
+        assert "Выключено световых устройств: 2" in call_args
+        assert "`light.kitchen_table`" in call_args
+        assert "❓ Не найдено: `light.missing_*`" in call_args
+
+    @pytest.mark.asyncio
+    @patch("bot.ha_api")
+    async def test_room_off(self, mock_ha_api, mock_update, mock_context):
+        """Test that /room <area> off switches the whole area at once"""
+        mock_context.args = ["living", "room", "off"]
+        mock_ha_api.room_command = AsyncMock(
+            return_value={
+                "name": "Living Room",
+                "succeeded": ["light.tv_lamp", "switch.tv"],
+                "failed": [],
+            }
+        )
+
+        await room(mock_update, mock_context)
+
+        mock_ha_api.room_command.assert_awaited_once_with("living room", "turn_off")
+        call_args = mock_update.message.reply_text.call_args[0][0]
+        assert "Living Room" in call_args
+        assert "Выключено: 2" in call_args
+
+
+class TestListPagination:
+    """Test cases for inline-keyboard pagination of entity lists"""
+
+    @pytest.fixture
+    def live_api(self):
+        """Async client whose live store already holds the states"""
+        from async_home_assistant import AsyncHomeAssistantAPI
+        from benchmarks.synthetic import generate_states
+
+        api = AsyncHomeAssistantAPI()
+        api.state_store.replace(generate_states(300, seed=1))
+        api.state_store.set_live(True)
+        with patch("bot.ha_api", api):
+            yield api
+
+    @staticmethod
+    def callback_update(data):
+        update = Mock()
+        update.effective_user.id = 1
+        update.callback_query.data = data
+        update.callback_query.answer = AsyncMock()
+        update.callback_query.edit_message_text = AsyncMock()
+        return update
+
+    @pytest.mark.asyncio
+    async def test_lights_has_page_buttons(self, live_api, mock_update, mock_context):
+        """The list comes with ⬅️/➡️ buttons instead of /lights N hints"""
+        mock_context.args = ["2"]
+        await lights(mock_update, mock_context)
+
+        loading_message = mock_update.message.reply_text.return_value
+        text = loading_message.edit_text.call_args[0][0]
+        keyboard = loading_message.edit_text.call_args[1]["reply_markup"]
+        buttons = keyboard.inline_keyboard[0]
+        assert "(стр. 2/" in text
+        assert "`/lights 3`" not in text
+        assert buttons[0].callback_data == "page:light:1"
+        assert buttons[-1].callback_data == "page:light:3"
+
+    @pytest.mark.asyncio
+    async def test_page_flip_uses_cache(self, live_api):
+        """A flip to an already rendered page makes no Home Assistant call"""
+        first = self.callback_update("page:switch:2")
+        await page_callback(first, Mock())
+        text = first.callback_query.edit_message_text.call_args[0][0]
+
+        second = self.callback_update("page:switch:2")
+        with patch.object(
+            live_api, "get_entities_page", AsyncMock(side_effect=AssertionError)
+        ):
+            await page_callback(second, Mock())
+
+        second.callback_query.answer.assert_awaited_once()
+        second.callback_query.edit_message_text.assert_awaited_once()
+        assert second.callback_query.edit_message_text.call_args[0][0] == text
+
+    @pytest.mark.asyncio
+    async def test_state_change_invalidates_page(self, live_api):
+        """A new snapshot version renders the page again"""
+        await page_callback(self.callback_update("page:light:1"), Mock())
+        light = live_api.state_store.domain_page(
+            live_api.state_store.peek().states, "light", 1, 8
+        )[0][0]
+        state = dict(live_api.state_store.peek().by_id[light["entity_id"]])
+        state["state"] = "unavailable"
+        live_api.state_store.apply_state(light["entity_id"], state)
+
+        update = self.callback_update("page:light:1")
+        await page_callback(update, Mock())
+
+        text = update.callback_query.edit_message_text.call_args[0][0]
+        assert f"⚫ {light['friendly_name']}" in text
+
+    @pytest.mark.asyncio
+    async def test_page_number_button_is_noop(self, live_api):
+        """The middle button only acknowledges the press"""
+        update = self.callback_update("page:noop")
+        await page_callback(update, Mock())
+
+        update.callback_query.answer.assert_awaited_once()
+        update.callback_query.edit_message_text.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_reload_without_domain_change_keeps_page(self, live_api):
+        """A reload that leaves the domain unchanged serves the cached page"""
+        await page_callback(self.callback_update("page:switch:1"), Mock())
+        states = [
+            (
+                {**state, "state": "42"}
+                if state["entity_id"].startswith("sensor.")
+                else state
+            )
+            for state in live_api.state_store.peek().states
+        ]
+        live_api.state_store.replace(states)
+
+        update = self.callback_update("page:switch:1")
+        with patch("bot.page_keyboard", side_effect=AssertionError):
+            await page_callback(update, Mock())
+
+        update.callback_query.edit_message_text.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_same_page_is_not_edited_twice(self, live_api):
+        """A second press on the same message and page sends no edit"""
+        update = self.callback_update("page:switch:2")
+        await page_callback(update, Mock())
+        await page_callback(update, Mock())
+
+        update.callback_query.edit_message_text.assert_awaited_once()
+
+
+class TestLiveMessages:
+    """Test cases for /status live and the ⏹ button"""
+
+    @pytest.mark.asyncio
+    @patch("bot.ha_api")
+    async def test_status_live_and_stop(self, mock_ha_api, mock_update, mock_context):
+        """`/status live` adds a stop button and ⏹ ends the updates"""
+        from bot import live_stop_callback
+        from bot import live_updater
+
+        mock_ha_api.get_all_states = AsyncMock(
+            return_value=[{"entity_id": "light.test", "state": "on"}]
+        )
+        mock_ha_api.get_current_time.return_value = "2024-01-01 00:00:00"
+        message = mock_update.message.reply_text.return_value
+        message.chat_id = 42
+        message.message_id = 7
+        mock_context.args = ["live"]
+
+        await status(mock_update, mock_context)
+
+        keyboard = mock_update.message.reply_text.call_args[1]["reply_markup"]
+        assert keyboard.inline_keyboard[-1][0].callback_data == "live:stop"
+        assert live_updater.session(42) is not None
+
+        stop = Mock()
+        stop.effective_user.id = 1
+        stop.callback_query.message = message
+        stop.callback_query.answer = AsyncMock()
+        await live_stop_callback(stop, Mock())
+
+        assert live_updater.session(42) is None
+        final = message.edit_text.call_args
+        assert "Total entities: 1" in final[0][0]
+        assert "reply_markup" not in final[1]
+
+
+class TestWatchCommands:
+    """Test cases for /watch and /unwatch"""
+
+    @pytest.fixture
+    def registry(self, tmp_path):
+        from subscriptions import SubscriptionRegistry
+
+        registry = SubscriptionRegistry(str(tmp_path / "subscriptions.json"))
+        with patch("bot.watch_registry", registry):
+            yield registry
+
+    @pytest.mark.asyncio
+    async def test_watch_and_unwatch(self, registry, mock_update, mock_context):
+        """A chat subscribes, lists and removes its subscriptions"""
+        from bot import unwatch
+        from bot import watch
+
+        mock_context.args = ["binary_sensor.front_door", "light", "bad;arg"]
+        await watch(mock_update, mock_context)
+
+        reply = mock_update.message.reply_text.call_args[0][0]
+        assert "`binary_sensor.front_door`" in reply
+        assert "bad;arg" in reply
+        assert registry.patterns(123456) == ["binary_sensor.front_door", "light.*"]
+
+        mock_context.args = ["all"]
+        await unwatch(mock_update, mock_context)
+
+        assert registry.patterns(123456) == []
+
+    def test_notification_text(self):
+        """A notification lists the old and new state of every change"""
+        from bot import format_watch_notification
+
+        text = format_watch_notification(
+            [
+                (
+                    "binary_sensor.front_door",
+                    {"state": "off", "attributes": {"friendly_name": "Front door"}},
+                    {"state": "on", "attributes": {"friendly_name": "Front door"}},
+                )
+            ]
+        )
+
+        assert "Front door: off → on" in text
+        assert "`binary_sensor.front_door`" in text
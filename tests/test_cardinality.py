@@ -0,0 +1,122 @@
+"""
+Tests for bounded-cardinality label policies
+"""
+
+import pytest
+
+from cardinality import ActiveUsers
+from cardinality import HyperLogLog
+from cardinality import LabelPolicy
+from cardinality import SpaceSaving
+from cardinality import UserActivity
+
+
+class TestLabelPolicy:
+    """Test cases for LabelPolicy"""
+
+    def test_full_keeps_values(self):
+        """Test the unbounded default"""
+        assert LabelPolicy()("123456") == "123456"
+
+    def test_drop_and_hash(self):
+        """Test constant and hashed labels"""
+        assert LabelPolicy("drop")("123456") == "all"
+
+        policy = LabelPolicy("hash", buckets=4)
+        labels = {policy(str(user_id)) for user_id in range(1000)}
+        assert labels == {"bucket-00", "bucket-01", "bucket-02", "bucket-03"}
+        assert policy("42") == policy("42")
+
+    def test_topk_admits_frequent_values_only(self):
+        """Test that rare values overflow and admitted ones are capped"""
+        policy = LabelPolicy("topk", top_k=2, min_count=3)
+
+        assert [policy("heavy") for _ in range(3)] == ["other", "other", "heavy"]
+        assert policy("rare") == "other"
+        for _ in range(3):
+            policy("second")
+        for _ in range(5):
+            last = policy("third")
+
+        assert last == "other"
+        assert policy("heavy") == "heavy"
+        assert policy.describe()["tracked"] == 2
+
+    def test_from_env(self, monkeypatch):
+        """Test configuration through environment variables"""
+        monkeypatch.setenv("METRICS_USER_LABEL_POLICY", "HASH")
+        monkeypatch.setenv("METRICS_LABEL_BUCKETS", "8")
+        monkeypatch.setenv("METRICS_ENTITY_LABEL_POLICY", "bogus")
+
+        user_policy = LabelPolicy.from_env("METRICS_USER")
+
+        assert user_policy.mode == "hash" and user_policy.buckets == 8
+        assert LabelPolicy.from_env("METRICS_ENTITY").mode == "full"
+        with pytest.raises(ValueError):
+            LabelPolicy("bogus")
+
+    def test_space_saving_is_bounded(self):
+        """Test that the frequency counter never grows past its capacity"""
+        counter = SpaceSaving(4)
+        for value in range(100):
+            counter.add(str(value))
+
+        assert len(counter.counts) == 4
+
+
+class TestUserActivity:
+    """Test cases for the bounded per-user statistics"""
+
+    def test_records_and_evicts_least_recent(self):
+        """Test per-user counters and LRU eviction"""
+        activity = UserActivity(limit=2)
+        activity.record("1", "lights", True)
+        activity.record("2", "status", False)
+        activity.record("1", "lights", True)
+        activity.record("3", "help", True)
+
+        assert len(activity) == 2
+        assert activity.get("2") is None
+        assert activity.get("1")["by_command"] == {"lights": 2}
+        assert [user["user_id"] for user in activity.top()] == ["1", "3"]
+
+
+class TestActiveUsers:
+    """Test cases for the sliding-window active user estimator"""
+
+    def test_hyperloglog_estimate(self):
+        """Repeats are ignored and large counts stay within a few percent"""
+        sketch = HyperLogLog()
+        for _ in range(5):
+            sketch.add("user1")
+        assert sketch.count() == 1
+
+        for i in range(10000):
+            sketch.add(f"user{i}")
+        assert abs(sketch.count() - 10000) < 1000
+
+    def test_windows_slide(self):
+        """Users age out bucket by bucket instead of all at once"""
+        active = ActiveUsers()
+        now = 1_000_000 * 3600.0
+        active.add("recent", now - 60)
+        active.add("today", now - 5 * 3600)
+        active.add("this_week", now - 3 * 86400)
+        active.add("too_old", now - 8 * 86400)
+
+        assert active.counts(now) == {"1h": 1, "24h": 2, "7d": 3}
+        # Через 2 часа недавний пользователь выпадает только из окна 1h
+        assert active.counts(now + 2 * 3600) == {"1h": 0, "24h": 2, "7d": 3}
+
+    def test_fixed_memory(self):
+        """Memory does not depend on the number of users"""
+        active = ActiveUsers()
+        sizes = lambda: sum(  # noqa: E731
+            len(sketch.registers)
+            for ring in (active._fine, active._coarse)
+            for sketch in ring._sketches
+        )
+        before = sizes()
+        for i in range(2000):
+            active.add(f"user{i}", 3600.0 * 1000)
+        assert sizes() == before
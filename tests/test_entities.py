@@ -0,0 +1,55 @@
+"""
+Tests for shared entity helpers
+"""
+
+from entities import group_by_domain
+from entities import resolve_patterns
+
+STATES = [
+    {"entity_id": "light.kitchen_main", "state": "on"},
+    {"entity_id": "light.kitchen_table", "state": "off"},
+    {"entity_id": "light.bedroom", "state": "off"},
+    {"entity_id": "switch.kitchen_kettle", "state": "off"},
+]
+
+
+class TestResolvePatterns:
+    """Test cases for entity_id/glob resolution"""
+
+    def test_glob_matches_known_entities_of_domain(self):
+        """Test that a glob only expands within the allowed domains"""
+        entity_ids, unmatched = resolve_patterns(["*kitchen*"], STATES, ("light",))
+
+        assert entity_ids == ["light.kitchen_main", "light.kitchen_table"]
+        assert unmatched == []
+
+    def test_plain_ids_and_duplicates(self):
+        """Test request order, de-duplication and unknown plain ids"""
+        entity_ids, unmatched = resolve_patterns(
+            ["light.new_lamp", "light.kitchen_*", "Light.Kitchen_Main"],
+            STATES,
+            ("light",),
+        )
+
+        assert entity_ids == [
+            "light.new_lamp",
+            "light.kitchen_main",
+            "light.kitchen_table",
+        ]
+        assert unmatched == []
+
+    def test_unmatched_arguments(self):
+        """Test that empty globs and foreign domains are reported"""
+        entity_ids, unmatched = resolve_patterns(
+            ["light.garage_*", "switch.kitchen_kettle"], STATES, ("light",)
+        )
+
+        assert entity_ids == []
+        assert unmatched == ["light.garage_*", "switch.kitchen_kettle"]
+
+    def test_group_by_domain(self):
+        """Test grouping for one service call per domain"""
+        assert group_by_domain(["light.a", "switch.b", "light.c"]) == {
+            "light": ["light.a", "light.c"],
+            "switch": ["switch.b"],
+        }
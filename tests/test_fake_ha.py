@@ -0,0 +1,103 @@
+"""
+Tests for the fake Home Assistant server
+"""
+
+import asyncio
+import random
+
+import pytest
+import requests
+
+from async_home_assistant import AsyncHomeAssistantAPI
+from benchmarks.fake_ha import FakeHomeAssistant
+from benchmarks.fake_ha import parse_latency
+from ha_websocket import HomeAssistantWebSocket
+from home_assistant import HomeAssistantAPI
+from state_store import EntityStateStore
+
+
+class TestFakeHomeAssistant:
+    """Test cases for FakeHomeAssistant"""
+
+    def test_sync_client(self, fake_ha):
+        """The sync client reads states and changes them through services"""
+        api = HomeAssistantAPI()
+        assert api.test_connection()
+        assert len(api.get_all_states()) == 200
+
+        light = api.get_lights()[0]["entity_id"]
+        target = "off" if fake_ha.get_state(light)["state"] == "on" else "on"
+        service = api.turn_on_light if target == "on" else api.turn_off_light
+        assert service(light)
+        assert api.get_entity_state(light)["state"] == target
+        assert fake_ha.requests["GET /api/states"] == 1
+
+    @pytest.mark.asyncio
+    async def test_async_client_rooms(self, fake_ha):
+        """Areas come from the template endpoint"""
+        api = AsyncHomeAssistantAPI()
+        try:
+            room = await api.get_room("Kitchen")
+        finally:
+            await api.close()
+        assert room["area_id"] == "kitchen"
+        assert room["states"]
+
+    @pytest.mark.asyncio
+    async def test_websocket_mirror(self, fake_ha):
+        """The live mirror syncs and receives state_changed after a service call"""
+        store = EntityStateStore()
+        mirror = HomeAssistantWebSocket(store, url=fake_ha.ws_url, token=fake_ha.token)
+        task = asyncio.create_task(mirror.run())
+        try:
+            await asyncio.wait_for(mirror.connected.wait(), 5)
+            assert store.live
+            assert len(store.peek().states) == 200
+
+            switch = next(
+                state["entity_id"]
+                for state in fake_ha.all_states()
+                if state["entity_id"].startswith("switch.")
+            )
+            await asyncio.to_thread(
+                fake_ha.call_service, "switch", "toggle", {"entity_id": switch}
+            )
+            expected = fake_ha.get_state(switch)["state"]
+            for _ in range(100):
+                if store.peek().by_id[switch]["state"] == expected:
+                    break
+                await asyncio.sleep(0.02)
+            assert store.peek().by_id[switch]["state"] == expected
+        finally:
+            await mirror.stop()
+            task.cancel()
+
+    def test_injected_errors(self):
+        """Error injection answers 500 and clients report no data"""
+        with FakeHomeAssistant(entities=10, error_rate=1.0) as fake:
+            api = HomeAssistantAPI(base_url=fake.base_url, token=fake.token)
+            assert api.get_all_states() is None
+
+    def test_injected_timeouts(self):
+        """Timeout injection leaves requests unanswered"""
+        with FakeHomeAssistant(entities=10, timeout_rate=1.0, timeout=5) as fake:
+            with pytest.raises(requests.exceptions.Timeout):
+                requests.get(
+                    f"{fake.base_url}/api/states",
+                    headers={"Authorization": f"Bearer {fake.token}"},
+                    timeout=0.2,
+                )
+
+    def test_auth_required(self):
+        """Requests without the token are rejected"""
+        with FakeHomeAssistant(entities=10) as fake:
+            assert requests.get(f"{fake.base_url}/api/").status_code == 401
+
+    def test_latency_specs(self):
+        """Latency specs produce samplers of the requested shape"""
+        rng = random.Random(0)
+        assert parse_latency("0.1")(rng) == 0.1
+        assert 0.01 <= parse_latency("uniform:0.01,0.02")(rng) <= 0.02
+        assert parse_latency("lognormal:0.05,0.5")(rng) > 0
+        with pytest.raises(ValueError):
+            parse_latency("pareto:1")
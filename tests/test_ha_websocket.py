@@ -0,0 +1,272 @@
+"""
+Tests for the Home Assistant WebSocket live mirror
+"""
+
+import asyncio
+import json
+
+import pytest
+import websockets
+
+from area_index import AreaIndex
+from ha_websocket import HomeAssistantWebSocket
+from state_store import EntityStateStore
+
+
+class FakeHomeAssistantWebSocket:
+    """Minimal local implementation of the HA WebSocket API"""
+
+    def __init__(self, states, token="test_token_123"):
+        self.states = states
+        self.token = token
+        self.connections = []
+        self.subscriptions = {}
+        self.events_before_states = []
+        self.registries = {
+            "config/area_registry/list": [],
+            "config/device_registry/list": [],
+            "config/entity_registry/list": [],
+        }
+
+    async def handler(self, ws):
+        await ws.send(json.dumps({"type": "auth_required"}))
+        auth = json.loads(await ws.recv())
+        if auth.get("access_token") != self.token:
+            await ws.send(json.dumps({"type": "auth_invalid", "message": "bad"}))
+            return
+        await ws.send(json.dumps({"type": "auth_ok"}))
+        self.connections.append(ws)
+
+        async for raw in ws:
+            message = json.loads(raw)
+            if message["type"] == "subscribe_events":
+                self.subscriptions[ws] = message["id"]
+                await self._result(ws, message["id"], None)
+            elif message["type"] == "get_states":
+                for entity_id, state in self.events_before_states:
+                    await self._event(ws, entity_id, state)
+                await self._result(ws, message["id"], self.states)
+            elif message["type"] in self.registries:
+                await self._result(ws, message["id"], self.registries[message["type"]])
+            elif message["type"] == "config/entity_registry/get":
+                entries = self.registries["config/entity_registry/list"]
+                entry = next(
+                    e for e in entries if e["entity_id"] == message["entity_id"]
+                )
+                await self._result(ws, message["id"], entry)
+
+    async def _result(self, ws, message_id, result):
+        await ws.send(
+            json.dumps(
+                {"id": message_id, "type": "result", "success": True, "result": result}
+            )
+        )
+
+    async def _event(self, ws, entity_id, new_state):
+        await ws.send(
+            json.dumps(
+                {
+                    "id": self.subscriptions[ws],
+                    "type": "event",
+                    "event": {
+                        "event_type": "state_changed",
+                        "data": {"entity_id": entity_id, "new_state": new_state},
+                    },
+                }
+            )
+        )
+
+    async def push_event(self, event_type, data):
+        for ws, subscription_id in list(self.subscriptions.items()):
+            await ws.send(
+                json.dumps(
+                    {
+                        "id": subscription_id,
+                        "type": "event",
+                        "event": {"event_type": event_type, "data": data},
+                    }
+                )
+            )
+
+    async def push_state(self, entity_id, new_state):
+        for ws in list(self.subscriptions):
+            await self._event(ws, entity_id, new_state)
+
+    async def drop_connections(self):
+        for ws in self.connections:
+            await ws.close()
+        self.connections = []
+        self.subscriptions = {}
+
+
+async def _wait_for(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def initial_states():
+    return [
+        {"entity_id": "light.kitchen", "state": "off", "attributes": {}},
+        {"entity_id": "sensor.temp", "state": "21", "attributes": {}},
+    ]
+
+
+class TestHomeAssistantWebSocket:
+    """Test cases for HomeAssistantWebSocket"""
+
+    def test_default_url(self):
+        """Test that the WebSocket URL is derived from HOME_ASSISTANT_URL"""
+        mirror = HomeAssistantWebSocket(EntityStateStore())
+        assert mirror.url == "ws://test-ha.local:8123/api/websocket"
+
+    @pytest.mark.asyncio
+    async def test_initial_sync_and_events(self, initial_states):
+        """Test initial state load and incremental state_changed events"""
+        fake = FakeHomeAssistantWebSocket(initial_states)
+        store = EntityStateStore(ttl=0)
+
+        async with websockets.serve(fake.handler, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            mirror = HomeAssistantWebSocket(store, url=f"ws://127.0.0.1:{port}")
+            task = asyncio.create_task(mirror.run())
+
+            await asyncio.wait_for(mirror.connected.wait(), 5)
+            assert store.live
+            assert store.is_fresh()
+            assert len(store.peek().states) == 2
+
+            await fake.push_state(
+                "light.kitchen",
+                {"entity_id": "light.kitchen", "state": "on", "attributes": {}},
+            )
+            await _wait_for(
+                lambda: store.peek().by_id["light.kitchen"]["state"] == "on"
+            )
+
+            await fake.push_state("sensor.temp", None)
+            await _wait_for(lambda: "sensor.temp" not in store.peek().by_id)
+
+            await mirror.stop()
+            await asyncio.wait_for(task, 5)
+
+        assert not store.live
+
+    @pytest.mark.asyncio
+    async def test_events_during_initial_load_are_applied(self, initial_states):
+        """Test that events received before get_states completes are kept"""
+        fake = FakeHomeAssistantWebSocket(initial_states)
+        fake.events_before_states = [
+            (
+                "light.new",
+                {"entity_id": "light.new", "state": "on", "attributes": {}},
+            )
+        ]
+        store = EntityStateStore()
+
+        async with websockets.serve(fake.handler, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            mirror = HomeAssistantWebSocket(store, url=f"ws://127.0.0.1:{port}")
+            task = asyncio.create_task(mirror.run())
+
+            await asyncio.wait_for(mirror.connected.wait(), 5)
+            assert "light.new" in store.peek().by_id
+
+            await mirror.stop()
+            await asyncio.wait_for(task, 5)
+
+    @pytest.mark.asyncio
+    async def test_reconnect_and_resync(self, initial_states):
+        """Test that a dropped connection is re-established and resynced"""
+        fake = FakeHomeAssistantWebSocket(initial_states)
+        store = EntityStateStore()
+
+        async with websockets.serve(fake.handler, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            mirror = HomeAssistantWebSocket(store, url=f"ws://127.0.0.1:{port}")
+            mirror.reconnect_min = 0.01
+            task = asyncio.create_task(mirror.run())
+
+            await asyncio.wait_for(mirror.connected.wait(), 5)
+            first_version = store.version
+
+            fake.states = initial_states + [
+                {"entity_id": "switch.pump", "state": "on", "attributes": {}}
+            ]
+            await fake.drop_connections()
+            await _wait_for(lambda: not mirror.connected.is_set())
+            await asyncio.wait_for(mirror.connected.wait(), 5)
+
+            assert store.live
+            assert store.version > first_version
+            assert "switch.pump" in store.peek().by_id
+
+            await mirror.stop()
+            await asyncio.wait_for(task, 5)
+
+    @pytest.mark.asyncio
+    async def test_invalid_token(self, initial_states):
+        """Test that a rejected token never marks the store live"""
+        fake = FakeHomeAssistantWebSocket(initial_states, token="other")
+        store = EntityStateStore()
+
+        async with websockets.serve(fake.handler, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            mirror = HomeAssistantWebSocket(store, url=f"ws://127.0.0.1:{port}")
+            mirror.reconnect_min = 0.01
+            task = asyncio.create_task(mirror.run())
+
+            await asyncio.sleep(0.2)
+            assert not store.live
+            assert store.peek() is None
+
+            await mirror.stop()
+            task.cancel()
+
+
+class TestAreaRegistryMirror:
+    """Test cases for keeping the area index current over WebSocket"""
+
+    @pytest.mark.asyncio
+    async def test_registries_loaded_and_updated(self, initial_states):
+        """Test initial registry load and an incremental entity move"""
+        fake = FakeHomeAssistantWebSocket(initial_states)
+        fake.registries["config/area_registry/list"] = [
+            {"area_id": "kitchen", "name": "Кухня"},
+            {"area_id": "hall", "name": "Hall"},
+        ]
+        fake.registries["config/device_registry/list"] = [
+            {"id": "dev1", "area_id": "kitchen"}
+        ]
+        fake.registries["config/entity_registry/list"] = [
+            {"entity_id": "light.kitchen", "device_id": "dev1", "area_id": None},
+            {"entity_id": "sensor.temp", "device_id": None, "area_id": "hall"},
+        ]
+        index = AreaIndex()
+
+        async with websockets.serve(fake.handler, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            mirror = HomeAssistantWebSocket(
+                EntityStateStore(), url=f"ws://127.0.0.1:{port}", area_index=index
+            )
+            task = asyncio.create_task(mirror.run())
+
+            await _wait_for(lambda: index.live)
+            assert index.entities("kitchen") == ["light.kitchen"]
+            assert index.find_area("кухня") == "kitchen"
+
+            fake.registries["config/entity_registry/list"][1]["area_id"] = "kitchen"
+            await fake.push_event(
+                "entity_registry_updated",
+                {"action": "update", "entity_id": "sensor.temp"},
+            )
+            await _wait_for(lambda: len(index.entities("kitchen")) == 2)
+            assert index.entities("hall") == []
+
+            await mirror.stop()
+            await asyncio.wait_for(task, 5)
+
+        assert not index.live
@@ -196,3 +196,48 @@ class TestHomeAssistantAPI:
         result = ha.test_connection()
 
         assert result is False
+
+
+class TestConnectionPool:
+    """Test cases for the pooled keep-alive session"""
+
+    def test_session_is_shared(self):
+        """Test that all clients in the process share one session"""
+        from home_assistant import get_http_session
+
+        assert get_http_session() is get_http_session()
+
+    def test_connections_are_reused(self, keepalive_server, monkeypatch):
+        """Test that consecutive requests reuse one TCP connection"""
+        monkeypatch.setenv("HOME_ASSISTANT_URL", keepalive_server.base_url)
+        ha = HomeAssistantAPI()
+
+        for _ in range(3):
+            assert ha.get_entity_state("light.kitchen")["state"] == "on"
+        assert ha.call_service("light", "turn_on", "light.kitchen") is True
+
+        assert len(keepalive_server.connections) == 1
+
+
+class TestStreamingStates:
+    """Test cases for streaming /api/states downloads"""
+
+    @patch("home_assistant.get_http_session")
+    def test_stream_survives_connection_drop(self, mock_get_session, monkeypatch):
+        """Test that entities read before a dropped connection are returned"""
+        monkeypatch.setenv("HA_STREAM_STATES", "true")
+
+        def chunks(chunk_size):
+            yield b'[{"entity_id": "light.a", "state": "on", "attributes": {}},'
+            raise requests.exceptions.ChunkedEncodingError("connection reset")
+
+        response = mock_get_session.return_value.get.return_value.__enter__.return_value
+        response.status_code = 200
+        response.iter_content.side_effect = chunks
+
+        ha = HomeAssistantAPI()
+        states = ha.get_all_states()
+
+        assert states == [{"entity_id": "light.a", "state": "on", "attributes": {}}]
+        assert mock_get_session.return_value.get.call_args.kwargs["stream"] is True
+        assert not ha.state_store.is_fresh()
@@ -0,0 +1,185 @@
+"""
+Tests for live-refreshed bot messages
+"""
+
+import asyncio
+
+import pytest
+from telegram import InlineKeyboardButton
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+from live_updates import ContentHashes
+from live_updates import LiveUpdater
+from live_updates import content_hash
+from state_store import EntityStateStore
+
+
+class FakeMessage:
+    """Renders a counter and records the edits sent to Telegram"""
+
+    def __init__(self, text="value: 0"):
+        self.text = text
+        self.edits = []
+        self.finished = False
+
+    async def render(self):
+        return self.text, None
+
+    async def edit(self, text, markup):
+        self.edits.append(text)
+
+    async def finish(self):
+        self.finished = True
+
+
+def updater(**kwargs):
+    options = {"min_interval": 0.01, "max_interval": 0.05, "duration": 5.0}
+    options.update(kwargs)
+    return LiveUpdater(**options)
+
+
+class TestContentHashes:
+    """Test cases for ContentHashes"""
+
+    def test_markup_is_part_of_content(self):
+        """The same text with other buttons is a different message"""
+        markup = InlineKeyboardMarkup([[InlineKeyboardButton("⏹", callback_data="x")]])
+        assert content_hash("text", None) != content_hash("text", markup)
+        assert content_hash("text", markup) == content_hash("text", markup)
+
+    def test_lru_limit(self):
+        """Oldest messages are forgotten first"""
+        hashes = ContentHashes(limit=2)
+        for key in ("a", "b", "c"):
+            hashes.remember(key, b"digest")
+        assert hashes.changed("a", b"digest")
+        assert not hashes.changed("c", b"digest")
+
+
+class TestLiveUpdater:
+    """Test cases for LiveUpdater"""
+
+    @pytest.mark.asyncio
+    async def test_unchanged_content_is_not_edited(self):
+        """Refreshes of the same content send no edit and back off"""
+        live = updater()
+        message = FakeMessage()
+        session = live.start(
+            1, (1, 10), message.render, message.edit, sent=("value: 0", None)
+        )
+        await asyncio.sleep(0.2)
+
+        assert session.refreshes >= 2
+        assert message.edits == []
+        assert session.interval == live.max_interval
+        live.stop(1)
+
+    @pytest.mark.asyncio
+    async def test_change_is_edited_once_with_footer(self):
+        """A new content is sent once; the footer does not count as a change"""
+        live = updater()
+        message = FakeMessage()
+        ticks = iter(range(1000))
+        session = live.start(
+            1,
+            (1, 10),
+            message.render,
+            message.edit,
+            footer=lambda: f"\n{next(ticks)}",
+            sent=("value: 0", None),
+        )
+        message.text = "value: 1"
+        await asyncio.sleep(0.2)
+
+        assert len(message.edits) == 1
+        assert message.edits[0].startswith("value: 1\n")
+        assert session.edits == 1
+        live.stop(1)
+
+    @pytest.mark.asyncio
+    async def test_store_change_wakes_matching_session(self):
+        """A state change of a watched domain refreshes before the interval"""
+        live = updater(min_interval=0.01, max_interval=60)
+        store = EntityStateStore()
+        store.replace([{"entity_id": "light.a", "state": "off"}])
+        live.watch_store(store)
+        lights = FakeMessage()
+        sensors = FakeMessage()
+        light_session = live.start(1, (1, 1), lights.render, lights.edit, {"light"})
+        sensor_session = live.start(2, (2, 1), sensors.render, sensors.edit, {"sensor"})
+        # Сбрасываем интервал до максимального, чтобы обновление шло только по событию
+        light_session.interval = sensor_session.interval = 60
+        await asyncio.sleep(0.05)
+
+        store.apply_state("light.a", {"entity_id": "light.a", "state": "on"})
+        await asyncio.sleep(0.05)
+
+        assert light_session.refreshes == 1
+        assert sensor_session.refreshes == 0
+        live.stop(1)
+        live.stop(2)
+
+    @pytest.mark.asyncio
+    async def test_one_live_message_per_chat(self):
+        """Starting a second live message stops the first one"""
+        live = updater()
+        first = live.start(1, (1, 1), FakeMessage().render, FakeMessage().edit)
+        live.start(1, (1, 2), FakeMessage().render, FakeMessage().edit)
+        await asyncio.sleep(0)
+
+        assert len(live) == 1
+        assert first.task.cancelled() or first.task.done()
+        live.stop(1)
+
+    @pytest.mark.asyncio
+    async def test_expiry_finishes_session(self):
+        """After the duration the session ends and calls finish"""
+        live = updater(duration=0.05)
+        message = FakeMessage()
+        session = live.start(
+            1, (1, 1), message.render, message.edit, finish=message.finish
+        )
+        await asyncio.wait_for(session.task, 1)
+
+        assert message.finished
+        assert live.session(1) is None
+
+    @pytest.mark.asyncio
+    async def test_deleted_message_ends_session(self):
+        """An edit failing with "message to edit not found" stops the session"""
+        live = updater()
+
+        async def edit(text, markup):
+            raise BadRequest("Message to edit not found")
+
+        message = FakeMessage()
+        session = live.start(1, (1, 1), message.render, edit, finish=message.finish)
+        await asyncio.wait_for(session.task, 1)
+
+        assert live.session(1) is None
+        assert not message.finished
+
+    @pytest.mark.asyncio
+    async def test_send_if_changed(self):
+        """A repeated edit with the same content is skipped"""
+        live = updater()
+        message = FakeMessage()
+
+        assert await live.send_if_changed((1, 1), "a", None, message.edit)
+        assert not await live.send_if_changed((1, 1), "a", None, message.edit)
+        assert await live.send_if_changed((1, 1), "b", None, message.edit)
+        assert message.edits == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_restart_on_same_message_keeps_hash(self):
+        """A new session of the same message is not undone by the old one ending"""
+        live = updater()
+        message = FakeMessage()
+        live.start(1, (1, 10), message.render, message.edit, sent=("value: 0", None))
+        message.text = "value: 1"
+        live.start(1, (1, 10), message.render, message.edit, sent=("value: 1", None))
+        await asyncio.sleep(0.1)
+
+        assert message.edits == []
+        live.stop(1)
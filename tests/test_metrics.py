@@ -20,8 +20,7 @@ class TestMetricsCollector:
         """Test MetricsCollector initialization"""
         collector = MetricsCollector()
         assert collector.start_time is not None
-        assert collector.active_users_cache == set()
-        assert collector.last_cleanup < time.time()
+        assert collector.active_users.counts() == {"1h": 0, "24h": 0, "7d": 0}
 
     def test_update_app_uptime(self):
         """Test app uptime metric update"""
@@ -52,9 +51,38 @@ class TestMetricsCollector:
         collector.record_telegram_command("start", "user123", True, 0.5)
         collector.record_telegram_command("lights", "user456", False, 1.2)
 
-        # Check that user was added to active users
-        assert "user123" in collector.active_users_cache
-        assert "user456" in collector.active_users_cache
+        # Check that users were counted as active
+        assert collector.update_active_users() == {"1h": 2, "24h": 2, "7d": 2}
+
+    def test_bounded_user_label(self, monkeypatch):
+        """Test that per-user detail moves out of the metric labels"""
+        monkeypatch.setenv("METRICS_USER_LABEL_POLICY", "drop")
+        collector = MetricsCollector()
+
+        with patch("metrics.telegram_commands_total") as mock_counter:
+            collector.record_telegram_command("lights", "user123", True, 0.1)
+
+        mock_counter.labels.assert_called_once_with(
+            command="lights", user_id="all", status="success"
+        )
+        assert collector.get_user_activity("user123")["commands"] == 1
+        assert collector.get_metrics_summary()["top_users"][0]["user_id"] == "user123"
+
+    def test_summary_counts_real_traffic(self, monkeypatch):
+        """Test that summary totals follow recorded commands of any name"""
+        monkeypatch.setenv("METRICS_USER_LABEL_POLICY", "drop")
+        collector = MetricsCollector()
+
+        collector.record_telegram_command("lights", "user1", True, 0.1)
+        collector.record_telegram_command("room", "user2", True, 0.2)
+        collector.record_telegram_command("room", "user2", False, 0.3)
+
+        summary = collector.get_metrics_summary()
+        assert summary["total_commands"] == 3
+        assert summary["successful_commands"] == 2
+        assert summary["failed_commands"] == 1
+        assert summary["commands_by_name"] == {"lights": 1, "room": 2}
+        assert summary["commands_by_user_label"] == {"all": 3}
 
     def test_record_homeassistant_request(self):
         """Test recording Home Assistant request metrics"""
@@ -78,50 +106,13 @@ class TestMetricsCollector:
         # Should not raise any exceptions
         assert True
 
-    def test_update_device_status(self):
-        """Test updating device status metrics"""
-        collector = MetricsCollector()
-
-        collector.update_device_status("light.bedroom", "Bedroom Light", "on")
-        collector.update_device_status("switch.fan", "Fan Switch", "off")
-
-        # Should not raise any exceptions
-        assert True
-
-    def test_update_homeassistant_entities(self):
-        """Test updating Home Assistant entities count"""
-        collector = MetricsCollector()
-
-        entities = {"light": 5, "switch": 3, "sensor": 10, "automation": 2}
-
-        collector.update_homeassistant_entities(entities)
-
-        # Should not raise any exceptions
-        assert True
-
-    def test_cleanup_active_users(self):
-        """Test active users cleanup"""
-        collector = MetricsCollector()
-
-        # Add some users (note: using add instead of dict assignment for set)
-        collector.active_users_cache.add("user1")
-        collector.active_users_cache.add("user2")
-
-        # Force cleanup by setting last_cleanup to old time
-        collector.last_cleanup = time.time() - 25 * 3600
-
-        collector._cleanup_active_users()
-
-        # Should work without errors
-        assert True
-
     def test_get_metrics_summary(self):
         """Test getting metrics summary"""
         collector = MetricsCollector()
 
         # Add some test data
-        collector.active_users_cache.add("user1")
-        collector.active_users_cache.add("user2")
+        collector.active_users.add("user1")
+        collector.active_users.add("user2")
 
         summary = collector.get_metrics_summary()
 
@@ -191,3 +182,61 @@ class TestMetricsDecorators:
             mock_collector.record_telegram_command.assert_called_once()
             call_args = mock_collector.record_telegram_command.call_args
             assert call_args[0][2] is False  # success parameter
+
+
+class TestHomeAssistantStateCollector:
+    """Test cases for the snapshot-backed device_status collector"""
+
+    def collect(self, states):
+        from metrics import HomeAssistantStateCollector
+
+        collector = HomeAssistantStateCollector(lambda: states)
+        return {family.name: family.samples for family in collector.collect()}
+
+    def test_collects_from_snapshot(self):
+        """device_status and entity counts come from the current states"""
+        families = self.collect(
+            [
+                {
+                    "entity_id": "light.bedroom",
+                    "state": "on",
+                    "attributes": {"friendly_name": "Bedroom Light"},
+                },
+                {"entity_id": "switch.fan", "state": "unavailable", "attributes": {}},
+                {"entity_id": "automation.morning", "state": "on", "attributes": {}},
+            ]
+        )
+
+        status = {
+            sample.labels["entity_id"]: (sample.labels["friendly_name"], sample.value)
+            for sample in families["device_status"]
+        }
+        assert status == {
+            "light.bedroom": ("Bedroom Light", 1),
+            "switch.fan": ("switch.fan", -1),
+        }
+        counts = {
+            sample.labels["domain"]: sample.value
+            for sample in families["homeassistant_entities_total"]
+        }
+        assert counts == {"automation": 1, "light": 1, "switch": 1}
+
+    def test_deleted_entities_disappear(self):
+        """Nothing is kept between collections"""
+        from metrics import HomeAssistantStateCollector
+
+        states = [{"entity_id": "light.old", "state": "off", "attributes": {}}]
+        collector = HomeAssistantStateCollector(lambda: states)
+        list(collector.collect())
+        states = []
+
+        families = {family.name: family.samples for family in collector.collect()}
+        assert families["device_status"] == []
+        assert families["homeassistant_entities_total"] == []
+
+    def test_missing_source(self):
+        """Without a snapshot the families are empty"""
+        from metrics import HomeAssistantStateCollector
+
+        families = list(HomeAssistantStateCollector().collect())
+        assert [family.samples for family in families] == [[], []]
@@ -0,0 +1,113 @@
+"""
+Tests for the background metrics refresher
+"""
+
+import gzip
+import threading
+from unittest.mock import Mock
+
+from prometheus_client import CollectorRegistry
+from prometheus_client import Gauge
+
+from metrics_refresher import MetricsRefresher
+
+
+def make_refresher(interval=0, compress=True):
+    registry = CollectorRegistry()
+    gauge = Gauge("test_value", "Test value", registry=registry)
+    updater = Mock()
+    refresher = MetricsRefresher(
+        [updater], interval=interval, compress=compress, registry=registry
+    )
+    return refresher, gauge, updater
+
+
+class TestMetricsRefresher:
+    """Test cases for MetricsRefresher"""
+
+    def test_synchronous_when_disabled(self):
+        """Without a thread every scrape runs the updaters"""
+        refresher, gauge, updater = make_refresher()
+        gauge.set(1)
+        data, encoding = refresher.exposition()
+        refresher.exposition()
+
+        assert b"test_value 1.0" in data
+        assert encoding is None
+        assert updater.call_count == 2
+        refresher.start()
+        assert not refresher.running
+
+    def test_rerenders_only_on_change(self):
+        """Unchanged values keep the cached buffer and version"""
+        refresher, gauge, _ = make_refresher()
+        assert refresher.refresh()
+        first = refresher.exposition()[0]
+        version = refresher.version
+
+        assert not refresher.refresh()
+        assert refresher.version == version
+        assert refresher.exposition()[0] is first
+
+        gauge.set(5)
+        assert refresher.refresh()
+        assert b"test_value 5.0" in refresher.exposition()[0]
+
+    def test_gzip_copy(self):
+        """The compressed copy matches the plain exposition"""
+        refresher, gauge, _ = make_refresher()
+        gauge.set(3)
+        plain, _ = refresher.exposition()
+        compressed, encoding = refresher.exposition(accept_gzip=True)
+
+        assert encoding == "gzip"
+        assert gzip.decompress(compressed) == plain
+
+        uncompressed = make_refresher(compress=False)[0]
+        assert uncompressed.exposition(accept_gzip=True)[1] is None
+
+    def test_failing_updater_still_renders(self):
+        """An updater error is logged and the rest of the output is served"""
+        refresher, gauge, updater = make_refresher()
+        updater.side_effect = RuntimeError("HA down")
+        gauge.set(2)
+
+        data, _ = refresher.exposition()
+        assert b"test_value 2.0" in data
+
+    def test_background_thread(self):
+        """The thread refreshes on its own and scrapes do not run updaters"""
+        refresher, gauge, updater = make_refresher(interval=60)
+        refreshed = threading.Event()
+        updater.side_effect = refreshed.set
+        refresher.start()
+        try:
+            assert refreshed.wait(2)
+            assert refresher.running
+            calls = updater.call_count
+            refresher.exposition()
+            assert updater.call_count - calls <= 1
+        finally:
+            refresher.stop()
+        assert not refresher.running
+
+    def test_volatile_metrics_do_not_count_as_change(self):
+        """Uptime and process metrics are served fresh without a new version"""
+        registry = CollectorRegistry()
+        stable = Gauge("test_value", "Test value", registry=registry)
+        uptime = Gauge("app_uptime_seconds", "Uptime", registry=registry)
+        refresher = MetricsRefresher([], interval=0, registry=registry)
+        stable.set(1)
+        uptime.set(10)
+        assert refresher.refresh()
+        version = refresher.version
+
+        uptime.set(20)
+        assert not refresher.refresh()
+
+        data, _ = refresher.exposition()
+        compressed, _ = refresher.exposition(accept_gzip=True)
+        assert refresher.version == version
+        assert b"app_uptime_seconds 20.0" in data
+        assert b"test_value 1.0" in data
+        assert gzip.decompress(compressed) == data
@@ -0,0 +1,207 @@
+"""
+Tests for the outbound Telegram rate limiter
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+from telegram.error import RetryAfter
+
+from rate_limiter import OutboundRateLimiter
+from rate_limiter import TokenBucket
+
+
+class FakeBotApi:
+    """Records Bot API calls made through the limiter"""
+
+    def __init__(self, failures=None):
+        self.calls = []
+        self.failures = list(failures or [])
+
+    async def call(self, endpoint, data):
+        self.calls.append((endpoint, dict(data), time.monotonic()))
+        if self.failures:
+            raise self.failures.pop(0)
+        return {"endpoint": endpoint, **data}
+
+
+def send(limiter, api, endpoint, rate_limit_args=None, **data):
+    return limiter.process_request(
+        callback=api.call,
+        args=(endpoint, data),
+        kwargs={},
+        endpoint=endpoint,
+        data=data,
+        rate_limit_args=rate_limit_args,
+    )
+
+
+@asynccontextmanager
+async def running(limiter=None):
+    """Initialized limiter: 20 messages per second per chat, no burst"""
+    limiter = limiter or OutboundRateLimiter(
+        global_rate=100, chat_rate=20, chat_burst=1
+    )
+    await limiter.initialize()
+    try:
+        yield limiter
+    finally:
+        await limiter.shutdown()
+
+
+class TestTokenBucket:
+    """Test cases for TokenBucket"""
+
+    def test_burst_then_rate(self):
+        """A full bucket allows a burst, then one event per 1/rate"""
+        bucket = TokenBucket(rate=2, capacity=2)
+        now = bucket.updated
+        for _ in range(2):
+            assert bucket.delay(now) == 0
+            bucket.take(now)
+        assert bucket.delay(now) == pytest.approx(0.5)
+        assert bucket.delay(now + 0.5) == 0
+
+    def test_pause(self):
+        """retry_after blocks the bucket even with tokens left"""
+        bucket = TokenBucket(rate=1, capacity=3)
+        now = bucket.updated
+        bucket.pause(now + 2)
+        assert bucket.delay(now) == pytest.approx(2)
+        assert not bucket.idle(now)
+
+
+class TestOutboundRateLimiter:
+    """Test cases for OutboundRateLimiter"""
+
+    @pytest.mark.asyncio
+    async def test_per_chat_rate_and_order(self):
+        """One chat is throttled and keeps its order; other chats are not held up"""
+        async with running() as limiter:
+            api = FakeBotApi()
+            results = await asyncio.gather(
+                *(
+                    send(limiter, api, "sendMessage", chat_id=1, text=str(i))
+                    for i in range(3)
+                ),
+                send(limiter, api, "sendMessage", chat_id=2, text="other"),
+            )
+            assert limiter.describe()["queued"] == 0
+
+        assert [r["text"] for r in results] == ["0", "1", "2", "other"]
+        chat_one = [call for call in api.calls if call[1]["chat_id"] == 1]
+        assert [call[1]["text"] for call in chat_one] == ["0", "1", "2"]
+        # 20 сообщений в секунду без запаса: не меньше 50 мс между отправками
+        assert chat_one[2][2] - chat_one[0][2] >= 0.09
+        other = next(call for call in api.calls if call[1]["chat_id"] == 2)
+        assert other[2] < chat_one[1][2]
+
+    @pytest.mark.asyncio
+    async def test_replies_before_bulk(self):
+        """Command replies overtake queued bulk messages"""
+        limiter = OutboundRateLimiter(global_rate=50)
+        # Без запаса в глобальном бакете: сообщения уходят по одному
+        limiter._global = TokenBucket(rate=50, capacity=1)
+        api = FakeBotApi()
+        async with running(limiter):
+            bulk = [
+                send(
+                    limiter,
+                    api,
+                    "sendMessage",
+                    {"priority": "bulk"},
+                    chat_id=chat,
+                    text="bulk",
+                )
+                for chat in range(10, 15)
+            ]
+            reply = send(limiter, api, "sendMessage", chat_id=99, text="reply")
+            await asyncio.gather(*bulk, reply)
+
+        texts = [call[1]["text"] for call in api.calls]
+        assert texts.index("reply") <= 1
+
+    @pytest.mark.asyncio
+    async def test_coalesces_pending_edits(self):
+        """Queued edits of one message collapse into the newest one"""
+        api = FakeBotApi()
+        async with running() as limiter:
+            await send(limiter, api, "sendMessage", chat_id=1, text="first")
+            edits = await asyncio.gather(
+                *(
+                    send(
+                        limiter,
+                        api,
+                        "editMessageText",
+                        chat_id=1,
+                        message_id=5,
+                        text=text,
+                    )
+                    for text in "abc"
+                )
+            )
+
+        edit_calls = [call for call in api.calls if call[0] == "editMessageText"]
+        assert [call[1]["text"] for call in edit_calls] == ["c"]
+        assert all(result["text"] == "c" for result in edits)
+
+    @pytest.mark.asyncio
+    async def test_retry_after(self):
+        """RetryAfter pauses the chat and the call is retried"""
+        api = FakeBotApi(failures=[RetryAfter(0.05)])
+        async with running() as limiter:
+            result = await send(limiter, api, "sendMessage", chat_id=3, text="hi")
+
+        assert result["text"] == "hi"
+        assert len(api.calls) == 2
+        assert api.calls[1][2] - api.calls[0][2] >= 0.05
+
+    @pytest.mark.asyncio
+    async def test_retry_after_gives_up(self):
+        """After max_retries the RetryAfter reaches the caller"""
+        api = FakeBotApi(failures=[RetryAfter(0.01), RetryAfter(0.01)])
+        async with running(OutboundRateLimiter(max_retries=1)) as limiter:
+            with pytest.raises(RetryAfter):
+                await send(limiter, api, "sendMessage", chat_id=3, text="hi")
+
+    @pytest.mark.asyncio
+    async def test_edit_waiting_for_retry_is_coalesced(self):
+        """An edit arriving during a RetryAfter wait replaces the retried one"""
+        api = FakeBotApi(failures=[RetryAfter(0.1)])
+        async with running() as limiter:
+            first = asyncio.create_task(
+                send(limiter, api, "editMessageText", chat_id=3, message_id=1, text="a")
+            )
+            await asyncio.sleep(0.03)
+            second = await send(
+                limiter, api, "editMessageText", chat_id=3, message_id=1, text="b"
+            )
+
+        assert (await first)["text"] == "b"
+        assert second["text"] == "b"
+        assert [call[1]["text"] for call in api.calls] == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_retry_after_pauses_all_chats(self):
+        """Telegram's flood wait holds back messages to other chats too"""
+        api = FakeBotApi(failures=[RetryAfter(0.1)])
+        async with running() as limiter:
+            first = asyncio.create_task(
+                send(limiter, api, "sendMessage", chat_id=3, text="hi")
+            )
+            await asyncio.sleep(0.02)
+            await send(limiter, api, "sendMessage", chat_id=4, text="other")
+            await first
+
+        other = next(call for call in api.calls if call[1]["chat_id"] == 4)
+        assert other[2] - api.calls[0][2] >= 0.1
+
+    @pytest.mark.asyncio
+    async def test_other_methods_bypass_queue(self):
+        """Calls that are not messages go straight to the Bot API"""
+        api = FakeBotApi()
+        async with running() as limiter:
+            assert (await send(limiter, api, "getMe"))["endpoint"] == "getMe"
+            assert limiter.describe()["chats_waiting"] == 0
@@ -0,0 +1,246 @@
+"""
+Tests for single-flight request coalescing
+"""
+
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from home_assistant import HomeAssistantAPI
+from singleflight import AsyncSingleFlight
+from singleflight import SingleFlight
+
+
+def run_threads(count, target):
+    results = [None] * count
+
+    def worker(index):
+        results[index] = target()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return results
+
+
+class TestSingleFlight:
+    """Test cases for the threaded SingleFlight"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test that callers arriving mid-flight reuse the leader's result"""
+        flight = SingleFlight("test")
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.1)
+            return ["result"]
+
+        with patch("singleflight.metrics_collector") as mock_collector:
+            results = run_threads(5, lambda: flight.do("states", slow))
+
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        assert mock_collector.record_coalesced_request.call_count == 4
+        mock_collector.record_coalesced_request.assert_called_with("test", "states")
+
+    def test_errors_reach_followers_and_key_is_released(self):
+        """Test that a failing call is shared and does not stick"""
+        flight = SingleFlight("test")
+        started = threading.Event()
+        errors = []
+
+        def failing():
+            started.set()
+            time.sleep(0.05)
+            raise RuntimeError("boom")
+
+        def call():
+            try:
+                flight.do("states", failing)
+            except RuntimeError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(1)
+        call()
+        leader.join(1)
+
+        assert len(errors) == 2
+        assert flight.do("states", lambda: "ok") == "ok"
+
+    def test_different_keys_run_independently(self):
+        """Test that only identical keys are coalesced"""
+        flight = SingleFlight("test")
+
+        assert flight.do("states/light.a", lambda: 1) == 1
+        assert flight.do("states/light.b", lambda: 2) == 2
+
+    def test_forget_starts_a_new_call(self):
+        """Test that callers after forget do not join the earlier call"""
+        flight = SingleFlight("test")
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def before():
+            started.set()
+            release.wait(1)
+            return "before"
+
+        leader = threading.Thread(
+            target=lambda: results.append(flight.do("states/light.a", before))
+        )
+        leader.start()
+        started.wait(1)
+        flight.forget("states")
+
+        assert flight.do("states/light.a", lambda: "after") == "after"
+        release.set()
+        leader.join(1)
+        assert results == ["before"]
+
+
+class TestAsyncSingleFlight:
+    """Test cases for the asyncio AsyncSingleFlight"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_execution(self):
+        """Test that concurrent coroutines await one shared call"""
+        flight = AsyncSingleFlight("test")
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"ok": True}
+
+        results = await asyncio.gather(*(flight.do("states", slow) for _ in range(5)))
+
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        assert await flight.do("states", slow) == {"ok": True}
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        """Test that cancelling one waiter leaves the shared call running"""
+        flight = AsyncSingleFlight("test")
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.create_task(flight.do("states", slow))
+        second = asyncio.create_task(flight.do("states", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert await second == "done"
+
+    @pytest.mark.asyncio
+    async def test_forget_starts_a_new_call(self):
+        """Test that a forgotten call finishes without blocking the next one"""
+        flight = AsyncSingleFlight("test")
+
+        async def value(result, delay):
+            await asyncio.sleep(delay)
+            return result
+
+        first = asyncio.create_task(flight.do("states", lambda: value("before", 0.05)))
+        await asyncio.sleep(0)
+        flight.forget("states")
+        second = asyncio.create_task(flight.do("states", lambda: value("after", 0.1)))
+        assert await first == "before"
+        # Завершение старого вызова не снимает новый с учёта
+        third = flight.do("states", lambda: value("third", 0))
+
+        assert await asyncio.gather(second, third) == ["after", "after"]
+
+
+class TestHomeAssistantCoalescing:
+    """Test cases for coalescing inside HomeAssistantAPI"""
+
+    @patch.object(HomeAssistantAPI, "_send_request")
+    def test_concurrent_state_reads_send_one_request(self, mock_send_request):
+        """Test that simultaneous cache misses trigger a single download"""
+
+        def slow_states(method, endpoint, data=None):
+            time.sleep(0.1)
+            return [{"entity_id": "light.a", "state": "on", "attributes": {}}]
+
+        mock_send_request.side_effect = slow_states
+        ha = HomeAssistantAPI()
+
+        results = run_threads(4, ha.get_all_states)
+
+        assert mock_send_request.call_count == 1
+        assert all(len(states) == 1 for states in results)
+        assert ha.state_store.version == 1
+
+    @patch.object(HomeAssistantAPI, "_send_request")
+    def test_service_calls_are_not_coalesced(self, mock_send_request):
+        """Test that only GET requests are shared"""
+        mock_send_request.return_value = {}
+        ha = HomeAssistantAPI()
+
+        ha._make_request("POST", "services/light/turn_on", {"entity_id": "light.a"})
+        ha._make_request("POST", "services/light/turn_on", {"entity_id": "light.a"})
+
+        assert mock_send_request.call_count == 2
+
+    @patch.object(HomeAssistantAPI, "_send_request")
+    def test_coalesced_state_loads_are_counted_once(self, mock_send_request):
+        """Test that a shared states download is recorded by one layer only"""
+
+        def slow_states(method, endpoint, data=None):
+            time.sleep(0.1)
+            return []
+
+        mock_send_request.side_effect = slow_states
+        ha = HomeAssistantAPI()
+
+        with patch("singleflight.metrics_collector") as mock_collector:
+            run_threads(3, ha.get_all_states)
+
+        assert mock_collector.record_coalesced_request.call_count == 2
+
+    @patch("home_assistant.get_http_session")
+    @patch.object(HomeAssistantAPI, "_send_request")
+    def test_read_after_command_does_not_join_earlier_read(
+        self, mock_send_request, mock_session
+    ):
+        """Test that a GET issued after a service call sends its own request"""
+        started = threading.Event()
+        release = threading.Event()
+
+        def send(method, endpoint, data=None):
+            if not started.is_set():
+                started.set()
+                release.wait(1)
+                return {"entity_id": "light.a", "state": "off"}
+            return {"entity_id": "light.a", "state": "on"}
+
+        mock_send_request.side_effect = send
+        mock_session.return_value.post.return_value.status_code = 200
+        ha = HomeAssistantAPI()
+
+        before = []
+        reader = threading.Thread(
+            target=lambda: before.append(ha.get_entity_state("light.a"))
+        )
+        reader.start()
+        started.wait(1)
+        assert ha.call_service("light", "turn_on", "light.a")
+        after = ha.get_entity_state("light.a")
+        release.set()
+        reader.join(1)
+
+        assert before[0]["state"] == "off"
+        assert after["state"] == "on"
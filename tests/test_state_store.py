@@ -0,0 +1,334 @@
+"""
+Tests for the shared entity state store
+"""
+
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from entities import filter_domain
+from home_assistant import HomeAssistantAPI
+from state_store import EntityStateStore
+
+
+class TestEntityStateStore:
+    """Test cases for EntityStateStore"""
+
+    def test_serves_cached_snapshot_within_ttl(self):
+        """Test that a fresh snapshot is served without calling the loader"""
+        store = EntityStateStore(ttl=60)
+        loader = Mock(return_value=[{"entity_id": "light.test", "state": "on"}])
+
+        first = store.get_states(loader)
+        second = store.get_states(loader)
+
+        assert first == second
+        loader.assert_called_once()
+        assert store.version == 1
+
+    def test_reloads_after_ttl(self):
+        """Test that an expired snapshot is reloaded"""
+        store = EntityStateStore(ttl=0)
+        loader = Mock(return_value=[])
+
+        store.get_states(loader)
+        store.get_states(loader)
+
+        assert loader.call_count == 2
+        assert store.version == 2
+
+    def test_failed_load_keeps_previous_snapshot(self):
+        """Test that a failed reload returns None and keeps the old snapshot"""
+        store = EntityStateStore(ttl=0)
+        store.replace([{"entity_id": "light.test", "state": "on"}])
+
+        assert store.get_states(Mock(return_value=None)) is None
+        assert store.peek().by_id["light.test"]["state"] == "on"
+
+    def test_invalidate(self):
+        """Test that invalidate forces the next read to reload"""
+        store = EntityStateStore(ttl=60)
+        loader = Mock(return_value=[])
+
+        store.get_states(loader)
+        store.invalidate()
+        assert not store.is_fresh()
+        store.get_states(loader)
+
+        assert loader.call_count == 2
+
+    def test_load_started_before_invalidate_stays_expired(self):
+        """Test that a fetch overtaken by invalidate does not look fresh"""
+        store = EntityStateStore(ttl=60)
+
+        def loader():
+            # Команда выполнена, пока список ещё загружается
+            store.invalidate()
+            return [{"entity_id": "light.a", "state": "off"}]
+
+        assert store.get_states(loader)[0]["state"] == "off"
+        assert not store.is_fresh()
+
+        since = store.invalidations
+        store.replace([{"entity_id": "light.a", "state": "on"}], since=since)
+        assert store.is_fresh()
+
+    def test_live_store_applies_changes_in_place(self):
+        """Test that a live store never expires and applies single changes"""
+        store = EntityStateStore(ttl=0)
+        store.replace([{"entity_id": "light.a", "state": "off"}])
+        store.set_live(True)
+        loader = Mock(return_value=[])
+
+        store.apply_state("light.a", {"entity_id": "light.a", "state": "on"})
+        store.apply_state("light.b", {"entity_id": "light.b", "state": "on"})
+        states = store.get_states(loader)
+
+        loader.assert_not_called()
+        assert {s["entity_id"]: s["state"] for s in states} == {
+            "light.a": "on",
+            "light.b": "on",
+        }
+        assert store.version == 3
+
+    def test_cache_metrics(self):
+        """Test that hits and misses are reported to the metrics collector"""
+        store = EntityStateStore(ttl=60)
+
+        with patch("state_store.metrics_collector") as mock_collector:
+            store.get_states(Mock(return_value=[]))
+            store.get_states(Mock(return_value=[]))
+
+        hits = [
+            call.args[0]
+            for call in mock_collector.record_state_cache_lookup.call_args_list
+        ]
+        assert hits == [False, True]
+
+
+def sensor(entity_id, name, state="1"):
+    return {
+        "entity_id": entity_id,
+        "state": state,
+        "attributes": {"friendly_name": name},
+    }
+
+
+class TestDomainIndex:
+    """Test cases for the per-domain sorted index"""
+
+    def test_pages_follow_collation_order(self):
+        """Test that pages are sliced from a case-insensitive sorted index"""
+        store = EntityStateStore(ttl=60)
+        states = store.replace(
+            [
+                sensor("sensor.c", "charlie"),
+                sensor("sensor.a", "Alpha"),
+                sensor("sensor.b", "bravo"),
+                {"entity_id": "light.x", "state": "on", "attributes": {}},
+            ]
+        ).states
+
+        items, total, page = store.domain_page(states, "sensor", 1, 2)
+        assert [item["friendly_name"] for item in items] == ["Alpha", "bravo"]
+        assert total == 3 and page == 1
+
+        items, _, page = store.domain_page(states, "sensor", 9, 2)
+        assert [item["entity_id"] for item in items] == ["sensor.c"]
+        assert page == 2
+
+    def test_index_is_reused_between_pages(self):
+        """Test that stepping through pages does not re-sort the domain"""
+        store = EntityStateStore(ttl=60)
+        states = store.replace(
+            [sensor(f"sensor.s{i}", f"Sensor {i:03d}") for i in range(50)]
+        ).states
+
+        with patch("state_store.filter_domain", wraps=filter_domain) as mock_filter:
+            for page in range(1, 10):
+                store.domain_page(states, "sensor", page, 6)
+
+        assert mock_filter.call_count == 1
+
+    def test_live_updates_keep_index_sorted(self):
+        """Test that mirrored changes update the index in place"""
+        store = EntityStateStore(ttl=60)
+        store.replace([sensor("sensor.a", "A"), sensor("sensor.b", "B")])
+        store.domain_page(store.peek().states, "sensor", 1, 10)
+
+        store.apply_state("sensor.a", sensor("sensor.a", "Z", state="5"))
+        store.apply_state("sensor.c", sensor("sensor.c", "C"))
+        store.apply_state("sensor.b", None)
+
+        items, total, _ = store.domain_page(store.peek().states, "sensor", 1, 10)
+        assert [item["entity_id"] for item in items] == ["sensor.c", "sensor.a"]
+        assert items[1]["state"] == "5"
+        assert total == 2
+
+    def test_foreign_states_are_filtered_directly(self):
+        """Test that a list that is not the current snapshot is still served"""
+        store = EntityStateStore(ttl=60)
+        store.replace([sensor("sensor.a", "A")])
+
+        items = store.domain_entities([sensor("sensor.z", "Z")], "sensor")
+
+        assert [item["entity_id"] for item in items] == ["sensor.z"]
+
+
+class TestHomeAssistantStateCache:
+    """Test cases for the state store behind HomeAssistantAPI"""
+
+    @patch.object(HomeAssistantAPI, "_make_request")
+    def test_readers_share_one_fetch(self, mock_make_request):
+        """Test that get_lights/get_switches/get_sensors reuse one download"""
+        mock_make_request.return_value = [
+            {"entity_id": "light.a", "state": "on", "attributes": {}},
+            {"entity_id": "switch.b", "state": "off", "attributes": {}},
+            {"entity_id": "sensor.c", "state": "1", "attributes": {}},
+        ]
+
+        ha = HomeAssistantAPI()
+        ha.get_all_states()
+        assert len(ha.get_lights()) == 1
+        assert len(ha.get_switches()) == 1
+        assert len(ha.get_sensors()) == 1
+
+        mock_make_request.assert_called_once_with("GET", "states")
+
+    @patch.object(HomeAssistantAPI, "_make_request")
+    def test_entity_state_from_live_mirror(self, mock_make_request):
+        """Test that single-entity reads use the live mirror"""
+        ha = HomeAssistantAPI()
+        ha.state_store.replace([{"entity_id": "light.a", "state": "on"}])
+        ha.state_store.set_live(True)
+
+        assert ha.get_entity_state("light.a")["state"] == "on"
+        mock_make_request.assert_not_called()
+
+    @patch("home_assistant.get_http_session")
+    def test_call_service_invalidates_snapshot(self, mock_get_session):
+        """Test that a successful service call expires the snapshot"""
+        mock_get_session.return_value.post.return_value = Mock(
+            status_code=200, text="[]"
+        )
+
+        ha = HomeAssistantAPI()
+        ha.state_store.replace([])
+        assert ha.state_store.is_fresh()
+
+        assert ha.call_service("light", "turn_on", "light.a") is True
+        assert not ha.state_store.is_fresh()
+
+    @patch("home_assistant.get_http_session")
+    @patch.object(HomeAssistantAPI, "_make_request")
+    def test_load_overlapping_command_stays_expired(
+        self, mock_make_request, mock_get_session
+    ):
+        """Test that states fetched before a command do not look fresh after it"""
+        mock_get_session.return_value.post.return_value = Mock(
+            status_code=200, text="[]"
+        )
+        ha = HomeAssistantAPI()
+
+        def fetch(method, endpoint, data=None):
+            # GET ещё не вернулся, а команда уже выполнена
+            assert ha.call_service("light", "turn_on", "light.a") is True
+            return [{"entity_id": "light.a", "state": "off"}]
+
+        mock_make_request.side_effect = fetch
+
+        assert ha.get_all_states()[0]["state"] == "off"
+        assert not ha.state_store.is_fresh()
+
+
+class TestSnapshotDiff:
+    """Listeners hear about changes between reloaded snapshots"""
+
+    def test_replace_reports_changes(self):
+        """Changed, added and removed entities are reported once each"""
+        store = EntityStateStore()
+        changes = []
+        store.add_listener(lambda *change: changes.append(change))
+        store.replace(
+            [
+                {"entity_id": "light.a", "state": "off"},
+                {"entity_id": "light.b", "state": "on"},
+            ]
+        )
+        assert changes == []
+
+        store.replace(
+            [
+                {"entity_id": "light.a", "state": "on"},
+                {"entity_id": "light.c", "state": "on"},
+            ]
+        )
+
+        assert sorted(
+            (entity_id, new and new["state"]) for entity_id, _, new in changes
+        ) == [
+            ("light.a", "on"),
+            ("light.b", None),
+            ("light.c", "on"),
+        ]
+
+    def test_incomplete_snapshot_reports_no_removals(self):
+        """A truncated reload does not look like removed entities"""
+        store = EntityStateStore()
+        changes = []
+        store.add_listener(lambda *change: changes.append(change))
+        store.replace([{"entity_id": "light.a", "state": "off"}])
+
+        store.replace([], complete=False)
+
+        assert changes == []
+
+
+class TestSingleEntityReads:
+    """Single-entity reads do not rebuild the full snapshot"""
+
+    def test_get_reads_live_entity_without_snapshot(self):
+        """A live change is visible through get() while peek() stays unbuilt"""
+        store = EntityStateStore()
+        store.replace([{"entity_id": "light.a", "state": "off"}])
+        snapshot = store.peek()
+        store.set_live(True)
+
+        store.apply_state("light.a", {"entity_id": "light.a", "state": "on"})
+
+        assert store.get("light.a")["state"] == "on"
+        assert store.get("light.missing") is None
+        assert store._snapshot is snapshot
+
+    def test_get_before_first_load(self):
+        """An empty store reports no entity and is not loaded"""
+        store = EntityStateStore()
+
+        assert not store.loaded
+        assert store.get("light.a") is None
+
+
+class TestDomainVersion:
+    """Per-domain versions for caches derived from one domain"""
+
+    def test_changes_only_with_its_domain(self):
+        """Reloads and events of other domains keep a domain's version"""
+        store = EntityStateStore()
+        store.replace(
+            [
+                {"entity_id": "light.a", "state": "off"},
+                {"entity_id": "sensor.t", "state": "20"},
+            ]
+        )
+        light = store.domain_version("light")
+
+        store.replace(
+            [
+                {"entity_id": "light.a", "state": "off"},
+                {"entity_id": "sensor.t", "state": "21"},
+            ]
+        )
+        store.apply_state("sensor.t", {"entity_id": "sensor.t", "state": "22"})
+        assert store.domain_version("light") == light
+
+        store.apply_state("light.a", {"entity_id": "light.a", "state": "on"})
+        assert store.domain_version("light") != light
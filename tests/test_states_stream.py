@@ -0,0 +1,111 @@
+"""
+Tests for the incremental /api/states parser
+"""
+
+import json
+
+from states_stream import StatesStreamParser
+from states_stream import finish_stream
+
+STATES = [
+    {
+        "entity_id": "sensor.temp",
+        "state": "21.5",
+        "attributes": {
+            "friendly_name": "Температура",
+            "unit_of_measurement": "°C",
+            "icon": "mdi:thermometer",
+            "huge": ["x"] * 100,
+        },
+        "context": {"id": "abc"},
+    },
+    {
+        "entity_id": "light.kitchen",
+        "state": "on",
+        "attributes": {"friendly_name": "Kitchen", "brightness": 255},
+    },
+]
+
+
+def feed_in_chunks(parser, body, size):
+    for start in range(0, len(body), size):
+        parser.feed(body[start : start + size])
+
+
+class TestStatesStreamParser:
+    """Test cases for StatesStreamParser"""
+
+    def test_parses_across_chunk_boundaries(self):
+        """Test that tiny chunks (splitting UTF-8 characters) parse correctly"""
+        parser = StatesStreamParser()
+        body = json.dumps(STATES, ensure_ascii=False, indent=2).encode("utf-8")
+
+        feed_in_chunks(parser, body, 3)
+        parser.close()
+
+        assert parser.complete and parser.error is None
+        assert [state["entity_id"] for state in parser.states] == [
+            "sensor.temp",
+            "light.kitchen",
+        ]
+        assert parser.states[0]["attributes"]["friendly_name"] == "Температура"
+
+    def test_projects_only_used_fields(self):
+        """Test that unused fields and attributes are discarded"""
+        parser = StatesStreamParser()
+
+        parser.feed(json.dumps(STATES).encode())
+
+        assert "context" not in parser.states[0]
+        assert parser.states[0]["attributes"] == {
+            "friendly_name": "Температура",
+            "unit_of_measurement": "°C",
+        }
+        assert parser.states[1]["attributes"]["brightness"] == 255
+
+    def test_truncated_tail_keeps_parsed_entities(self):
+        """Test that a cut-off body still yields the complete entities"""
+        parser = StatesStreamParser()
+        body = json.dumps(STATES).encode()
+
+        parser.feed(body[: len(body) - 20])
+        parser.close()
+
+        assert not parser.complete
+        assert "truncated" in parser.error
+        assert [state["entity_id"] for state in parser.states] == ["sensor.temp"]
+
+    def test_malformed_separator_stops_parsing(self):
+        """Test that garbage between entities ends the stream"""
+        parser = StatesStreamParser()
+
+        parser.feed(b'[{"entity_id": "a.b", "state": "1"} x {"entity_id": "c.d"}]')
+        result = finish_stream(parser)
+
+        assert result is parser
+        assert [state["entity_id"] for state in parser.states] == ["a.b"]
+        assert not parser.complete
+
+    def test_oversized_entity_is_rejected(self):
+        """Test that buffering is bounded for an entity that never closes"""
+        parser = StatesStreamParser(max_entity_size=100)
+
+        parser.feed(b'[{"entity_id": "a.b", "state": "' + b"x" * 200)
+
+        assert parser.error is not None
+        assert parser.feed(b'"}]') == 0
+
+    def test_unusable_body_returns_none(self):
+        """Test that a body without a single entity is reported as failure"""
+        parser = StatesStreamParser()
+        parser.feed(b"<html>502 Bad Gateway</html>")
+
+        assert finish_stream(parser) is None
+
+    def test_empty_array_is_complete(self):
+        """Test that an installation without entities is a valid result"""
+        parser = StatesStreamParser()
+        parser.feed(b"[]")
+
+        assert finish_stream(parser) is parser
+        assert parser.states == []
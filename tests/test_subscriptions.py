@@ -0,0 +1,192 @@
+"""
+Tests for /watch subscriptions and their delivery
+"""
+
+import asyncio
+import json
+
+import pytest
+from telegram.error import Forbidden
+
+from state_store import EntityStateStore
+from subscriptions import SubscriptionRegistry
+from subscriptions import WatchDispatcher
+from subscriptions import normalize_pattern
+from subscriptions import pattern_kind
+
+
+def state(entity_id, value):
+    return {"entity_id": entity_id, "state": value}
+
+
+class TestPatterns:
+    """Test cases for pattern normalization"""
+
+    def test_normalize(self):
+        """Domains become domain globs, invalid arguments are rejected"""
+        assert normalize_pattern("Binary_Sensor.Front_Door") == (
+            "binary_sensor.front_door"
+        )
+        assert normalize_pattern("light") == "light.*"
+        assert normalize_pattern("*door*") == "*door*"
+        assert normalize_pattern("light.kitchen; rm") is None
+        assert normalize_pattern("a.b.c") is None
+
+    def test_kind(self):
+        """Each pattern is indexed by the most specific key available"""
+        assert pattern_kind("light.kitchen") == ("entity", "light.kitchen")
+        assert pattern_kind("light.*") == ("domain", "light")
+        assert pattern_kind("light.kitchen_*") == ("glob", "light")
+        assert pattern_kind("*.door") == ("glob", "")
+
+
+class TestSubscriptionRegistry:
+    """Test cases for SubscriptionRegistry"""
+
+    def test_match_by_entity_domain_and_glob(self):
+        """A change reaches exact, domain and glob subscribers only"""
+        registry = SubscriptionRegistry()
+        registry.add(1, "binary_sensor.front_door")
+        registry.add(2, "binary_sensor.*")
+        registry.add(3, "binary_sensor.*door*")
+        registry.add(4, "*door*")
+        registry.add(5, "light.*")
+        registry.add(6, "light.*door*")
+
+        assert registry.match("binary_sensor.front_door") == {1, 2, 3, 4}
+        assert registry.match("binary_sensor.window") == {2}
+        assert registry.match("sensor.temperature") == set()
+
+    def test_remove_and_limit(self):
+        """Removing cleans the indexes; the per-chat limit is enforced"""
+        registry = SubscriptionRegistry(limit=2)
+        assert registry.add(1, "light.kitchen_*")
+        assert not registry.add(1, "light.kitchen_*")
+        registry.add(1, "switch.pump")
+        with pytest.raises(ValueError):
+            registry.add(1, "sensor.*")
+
+        assert registry.remove(1, "light.kitchen_*")
+        assert registry.match("light.kitchen_main") == set()
+        assert registry.remove_chat(1) == 1
+        assert len(registry) == 0
+
+    def test_persists_across_restarts(self, tmp_path):
+        """Subscriptions are saved on change and loaded by a new registry"""
+        path = tmp_path / "subscriptions.json"
+        registry = SubscriptionRegistry(str(path))
+        registry.add(1, "binary_sensor.front_door")
+        registry.add(-100, "light.*")
+        registry.remove(1, "binary_sensor.front_door")
+        registry.add(1, "*door*")
+
+        restored = SubscriptionRegistry(str(path))
+        assert restored.patterns(1) == ["*door*"]
+        assert restored.match("light.hall") == {-100}
+        assert json.loads(path.read_text())["version"] == 1
+
+    def test_corrupt_file_starts_empty(self, tmp_path):
+        """An unreadable file does not prevent the bot from starting"""
+        path = tmp_path / "subscriptions.json"
+        path.write_text("{not json")
+
+        assert len(SubscriptionRegistry(str(path))) == 0
+
+
+class TestWatchDispatcher:
+    """Test cases for WatchDispatcher"""
+
+    @staticmethod
+    def dispatcher(registry, failures=None):
+        dispatcher = WatchDispatcher(registry, debounce=0.05)
+        sent = []
+
+        async def notify(chat_id, changes):
+            if failures:
+                raise failures.pop(0)
+            sent.append((chat_id, [(e, o["state"], n["state"]) for e, o, n in changes]))
+
+        dispatcher.start(notify)
+        return dispatcher, sent
+
+    @pytest.mark.asyncio
+    async def test_debounce_coalesces_changes(self):
+        """Changes within the window arrive as one notification per chat"""
+        registry = SubscriptionRegistry()
+        registry.add(1, "binary_sensor.*")
+        registry.add(2, "binary_sensor.front_door")
+        dispatcher, sent = self.dispatcher(registry)
+
+        dispatcher.on_state_change(
+            "binary_sensor.front_door",
+            state("binary_sensor.front_door", "off"),
+            state("binary_sensor.front_door", "on"),
+        )
+        dispatcher.on_state_change(
+            "binary_sensor.window",
+            state("binary_sensor.window", "off"),
+            state("binary_sensor.window", "on"),
+        )
+        await asyncio.sleep(0.15)
+
+        assert sorted(sent) == [
+            (
+                1,
+                [
+                    ("binary_sensor.front_door", "off", "on"),
+                    ("binary_sensor.window", "off", "on"),
+                ],
+            ),
+            (2, [("binary_sensor.front_door", "off", "on")]),
+        ]
+        await dispatcher.stop()
+
+    @pytest.mark.asyncio
+    async def test_flapping_and_attribute_changes_are_dropped(self):
+        """Returning to the original state or changing attributes sends nothing"""
+        registry = SubscriptionRegistry()
+        registry.add(1, "binary_sensor.front_door")
+        dispatcher, sent = self.dispatcher(registry)
+        off = state("binary_sensor.front_door", "off")
+        on = state("binary_sensor.front_door", "on")
+
+        dispatcher.on_state_change("binary_sensor.front_door", off, on)
+        dispatcher.on_state_change("binary_sensor.front_door", on, off)
+        dispatcher.on_state_change("binary_sensor.front_door", off, dict(off))
+        await asyncio.sleep(0.15)
+
+        assert sent == []
+        await dispatcher.stop()
+
+    @pytest.mark.asyncio
+    async def test_blocked_chat_is_unsubscribed(self):
+        """Forbidden from Telegram removes the chat's subscriptions"""
+        registry = SubscriptionRegistry()
+        registry.add(1, "light.*")
+        dispatcher, sent = self.dispatcher(
+            registry, failures=[Forbidden("bot was blocked by the user")]
+        )
+
+        dispatcher.on_state_change(
+            "light.a", state("light.a", "off"), state("light.a", "on")
+        )
+        await asyncio.sleep(0.15)
+
+        assert registry.patterns(1) == []
+        await dispatcher.stop()
+
+    @pytest.mark.asyncio
+    async def test_reloaded_snapshot_drives_notifications(self):
+        """Without a live mirror, comparing snapshots reports the changes"""
+        registry = SubscriptionRegistry()
+        registry.add(1, "binary_sensor.front_door")
+        dispatcher, sent = self.dispatcher(registry)
+        store = EntityStateStore()
+        store.add_listener(dispatcher.on_state_change)
+
+        store.replace([state("binary_sensor.front_door", "off")])
+        store.replace([state("binary_sensor.front_door", "on"), state("light.a", "on")])
+        await asyncio.sleep(0.15)
+
+        assert sent == [(1, [("binary_sensor.front_door", "off", "on")])]
+        await dispatcher.stop()
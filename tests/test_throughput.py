@@ -0,0 +1,53 @@
+"""
+Tests for the end-to-end throughput benchmark
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.throughput import FakeBotTransport
+from benchmarks.throughput import percentile
+from benchmarks.throughput import run_throughput
+
+
+class TestThroughput:
+    """Test cases for the throughput harness"""
+
+    def test_percentile(self):
+        """Nearest-rank percentiles"""
+        values = [float(i) for i in range(1, 101)]
+        assert percentile(values, 50) == 50.0
+        assert percentile(values, 99) == 99.0
+        assert percentile([3.0], 95) == 3.0
+
+    @pytest.mark.asyncio
+    async def test_commands_reach_handlers(self, fake_ha, monkeypatch):
+        """Every fed command is answered through the fake Bot API"""
+        import bot
+
+        monkeypatch.setattr(bot, "ha_api", bot.ha_api)
+        report = await run_throughput(
+            commands=20, rate=200, chats=4, fake=fake_ha, timeout=30
+        )
+
+        assert report["completed"] == 20
+        assert report["commands_per_second"] > 0
+        assert report["latency"]["p50_ms"] <= report["latency"]["p99_ms"]
+        assert report["bot_api_calls"]["sendMessage"] == 20
+        assert report["error_replies"] == 0
+        assert set(report["event_loop_lag"]) == {"max_ms", "p99_ms", "blocked_ms"}
+
+    @pytest.mark.asyncio
+    async def test_transport_answers_send_message(self):
+        """sendMessage echoes the chat and text back"""
+        transport = FakeBotTransport()
+        data = SimpleNamespace(parameters={"chat_id": 7, "text": "❌ нет"})
+        code, body = await transport.do_request(
+            "https://api.telegram.org/botX/sendMessage", "POST", data
+        )
+
+        assert code == 200
+        assert b'"chat": {"id": 7' in body
+        assert transport.error_replies == 1
+        assert transport.calls == {"sendMessage": 1}
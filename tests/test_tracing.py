@@ -0,0 +1,95 @@
+"""
+Tests for span tracing
+"""
+
+import asyncio
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from tracing import FileSpanExporter
+from tracing import OtlpHttpSpanExporter
+from tracing import Tracer
+
+
+def make_tracer(exporter=None):
+    tracer = Tracer(exporter)
+    finished = []
+    tracer.add_listener(finished.append)
+    return tracer, finished
+
+
+class TestTracer:
+    """Test cases for Tracer"""
+
+    def test_nested_spans(self):
+        """Nested spans share the trace and point at their parent"""
+        tracer, finished = make_tracer()
+        with tracer.span("telegram.command", command="lights") as root:
+            with tracer.span("ha.request", endpoint="states"):
+                pass
+
+        child, parent = finished
+        assert parent is root
+        assert child.trace_id == root.trace_id
+        assert child.parent_id == root.span_id
+        assert root.parent_id is None
+        assert child.attributes == {"endpoint": "states"}
+        assert 0 <= child.duration <= root.duration
+
+    @pytest.mark.asyncio
+    async def test_async_children(self):
+        """Spans opened in gathered coroutines get the awaiting span as parent"""
+        tracer, finished = make_tracer()
+
+        async def stage(name):
+            with tracer.span(name):
+                await asyncio.sleep(0)
+
+        with tracer.span("root") as root:
+            await asyncio.gather(stage("a"), stage("b"))
+
+        children = [span for span in finished if span is not root]
+        assert {span.parent_id for span in children} == {root.span_id}
+
+    def test_error_recorded(self):
+        """An exception marks the span and is re-raised"""
+        tracer, finished = make_tracer()
+        with pytest.raises(ValueError):
+            with tracer.span("render"):
+                raise ValueError("boom")
+
+        assert finished[0].error == "ValueError: boom"
+        assert finished[0].to_otlp()["status"]["code"] == 2
+
+    def test_file_exporter(self, tmp_path):
+        """Spans are written as JSON lines"""
+        path = tmp_path / "traces.jsonl"
+        tracer, _ = make_tracer(FileSpanExporter(str(path)))
+        with tracer.span("ha.request", method="GET"):
+            pass
+        tracer.flush()
+
+        record = json.loads(path.read_text().strip())
+        assert record["name"] == "ha.request"
+        assert record["attributes"] == {"method": "GET"}
+        assert record["duration_ms"] >= 0
+
+    def test_otlp_exporter(self):
+        """Spans are posted in the OTLP/JSON layout"""
+        exporter = OtlpHttpSpanExporter("http://collector:4318/", "test-service")
+        exporter.session = Mock()
+        tracer, _ = make_tracer(exporter)
+        with tracer.span("telegram.send", chars=12):
+            pass
+        tracer.flush()
+
+        url = exporter.session.post.call_args[0][0]
+        payload = exporter.session.post.call_args[1]["json"]
+        assert url == "http://collector:4318/v1/traces"
+        resource_spans = payload["resourceSpans"][0]
+        span = resource_spans["scopeSpans"][0]["spans"][0]
+        assert span["name"] == "telegram.send"
+        assert span["attributes"] == [{"key": "chars", "value": {"intValue": "12"}}]
+        assert int(span["endTimeUnixNano"]) >= int(span["startTimeUnixNano"])
@@ -0,0 +1,142 @@
+"""
+Tests for concurrent update processing with per-chat ordering
+"""
+
+import asyncio
+
+import pytest
+from telegram import Update
+
+from update_processor import ChatOrderedUpdateProcessor
+from update_processor import chat_key
+from update_processor import update_processor_from_env
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private"},
+                "text": "/status",
+            },
+        },
+        None,
+    )
+
+
+class TestChatOrderedUpdateProcessor:
+    """Test cases for ChatOrderedUpdateProcessor"""
+
+    def test_from_env(self, monkeypatch):
+        """BOT_CONCURRENT_UPDATES=1 keeps the sequential default"""
+        monkeypatch.setenv("BOT_CONCURRENT_UPDATES", "1")
+        assert update_processor_from_env() is None
+        monkeypatch.setenv("BOT_CONCURRENT_UPDATES", "8")
+        assert update_processor_from_env().limit == 8
+
+    def test_chat_key(self):
+        """Updates are ordered by chat"""
+        assert chat_key(make_update(1, 42)) == 42
+        assert chat_key(object()) is None
+
+    @pytest.mark.asyncio
+    async def test_same_chat_in_order(self):
+        """A slow update delays later updates of its chat only"""
+        processor = ChatOrderedUpdateProcessor(4)
+        log = []
+
+        async def handle(name, delay):
+            log.append(f"{name}:start")
+            await asyncio.sleep(delay)
+            log.append(f"{name}:end")
+
+        await asyncio.gather(
+            processor.process_update(make_update(1, 1), handle("on", 0.05)),
+            processor.process_update(make_update(2, 1), handle("off", 0)),
+            processor.process_update(make_update(3, 2), handle("other", 0)),
+        )
+
+        assert log.index("on:end") < log.index("off:start")
+        assert log.index("other:end") < log.index("on:end")
+        assert processor.describe()["chats"] == 0
+
+    @pytest.mark.asyncio
+    async def test_global_limit(self):
+        """No more than max_concurrent_updates run at once"""
+        processor = ChatOrderedUpdateProcessor(2)
+        running = []
+        peak = []
+
+        async def handle():
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+        await asyncio.gather(
+            *(processor.process_update(make_update(i, i), handle()) for i in range(6))
+        )
+
+        assert max(peak) == 2
+        assert processor.waiting == 0
+        assert processor.active == 0
+
+    @pytest.mark.asyncio
+    async def test_busy_chat_keeps_one_slot(self):
+        """Queued updates of one chat do not take slots from other chats"""
+        processor = ChatOrderedUpdateProcessor(2)
+        release = asyncio.Event()
+        done = []
+
+        async def slow():
+            await release.wait()
+
+        async def fast():
+            done.append("other")
+
+        busy = [
+            asyncio.create_task(processor.process_update(make_update(i, 1), slow()))
+            for i in range(5)
+        ]
+        await asyncio.sleep(0)
+        await asyncio.wait_for(
+            processor.process_update(make_update(10, 2), fast()), timeout=1
+        )
+        assert done == ["other"]
+        assert processor.describe()["waiting"] == 4
+
+        release.set()
+        await asyncio.gather(*busy)
+
+    @pytest.mark.asyncio
+    async def test_cancelled_while_queued(self):
+        """A cancelled queued update is dropped and its coroutine closed"""
+        processor = ChatOrderedUpdateProcessor(1)
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+
+        async def never():
+            raise AssertionError("must not run")
+
+        first = asyncio.create_task(processor.process_update(make_update(1, 1), slow()))
+        queued = asyncio.create_task(
+            processor.process_update(make_update(2, 1), never())
+        )
+        await asyncio.sleep(0)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        release.set()
+        await first
+
+        assert processor.describe() == {
+            "limit": 1,
+            "waiting": 0,
+            "active": 0,
+            "chats": 0,
+        }
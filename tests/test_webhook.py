@@ -0,0 +1,113 @@
+"""
+Tests for webhook delivery of Telegram updates
+"""
+
+import time
+
+import pytest
+from flask import Flask
+
+from benchmarks.throughput import BOT_TOKEN
+from benchmarks.throughput import FakeBotTransport
+from webhook import SECRET_HEADER
+from webhook import WebhookBot
+from webhook import default_secret
+from webhook import webhook_blueprint
+
+
+def command_update(update_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 77, "type": "private"},
+            "from": {"id": 77, "is_bot": False, "first_name": "Test"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def webhook_app(monkeypatch):
+    """Flask app with the webhook blueprint and a bot on a fake Bot API"""
+    import bot
+    from async_home_assistant import AsyncHomeAssistantAPI
+
+    monkeypatch.setattr(bot, "ha_api", AsyncHomeAssistantAPI())
+    monkeypatch.setenv("TELEGRAM_WEBHOOK_URL", "https://bot.example.com/hook")
+    monkeypatch.delenv("TELEGRAM_WEBHOOK_SECRET", raising=False)
+    transport = FakeBotTransport()
+    webhook_bot = WebhookBot.from_env(
+        bot.build_application(BOT_TOKEN, request=transport)
+    )
+    webhook_bot.start()
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(webhook_blueprint(webhook_bot))
+    try:
+        yield flask_app.test_client(), webhook_bot, transport
+    finally:
+        webhook_bot.stop()
+
+
+class TestWebhook:
+    """Test cases for the Telegram webhook"""
+
+    def test_default_secret(self):
+        """The derived secret is stable and uses only allowed characters"""
+        secret = default_secret("123:abc")
+        assert secret == default_secret("123:abc")
+        assert secret != default_secret("123:abd")
+        assert "123:abc" not in secret
+        assert secret.isalnum()
+
+    def test_registers_webhook_with_secret(self, webhook_app):
+        """setWebhook is called once the application is started"""
+        _, webhook_bot, transport = webhook_app
+        assert webhook_bot.running
+        assert transport.calls["setWebhook"] == 1
+        assert webhook_bot.secret_token == default_secret(BOT_TOKEN)
+
+    def test_rejects_wrong_secret(self, webhook_app):
+        """Requests without the secret token are refused"""
+        client, _, transport = webhook_app
+        response = client.post(
+            "/telegram/webhook",
+            json=command_update(1, "/help"),
+            headers={SECRET_HEADER: "wrong"},
+        )
+        assert response.status_code == 403
+        response = client.post("/telegram/webhook", json=command_update(2, "/help"))
+        assert response.status_code == 403
+        assert "sendMessage" not in transport.calls
+
+    def test_rejects_invalid_payload(self, webhook_app):
+        """Bodies that are not updates are refused"""
+        client, webhook_bot, _ = webhook_app
+        response = client.post(
+            "/telegram/webhook",
+            data="not json",
+            headers={SECRET_HEADER: webhook_bot.secret_token},
+        )
+        assert response.status_code == 400
+
+    def test_posted_update_is_handled(self, webhook_app):
+        """A posted command reaches its handler and is answered"""
+        client, webhook_bot, transport = webhook_app
+        response = client.post(
+            "/telegram/webhook",
+            json=command_update(3, "/help"),
+            headers={SECRET_HEADER: webhook_bot.secret_token},
+        )
+        assert response.status_code == 200
+        assert wait_for(lambda: transport.calls.get("sendMessage") == 1)
@@ -0,0 +1,267 @@
+"""
+Span tracing for bot commands and Home Assistant calls
+"""
+
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Размер пачки спанов и предел очереди на экспорт
+EXPORT_BATCH_SIZE = 256
+EXPORT_QUEUE_SIZE = 4096
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage; duration comes from a monotonic clock."""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "attributes",
+        "start_unix_ns",
+        "duration",
+        "error",
+        "_start",
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        # Время начала по часам - только для экспорта, длительность по monotonic
+        self.start_unix_ns = time.time_ns()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self._start = time.perf_counter()
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Flat representation used by the file exporter."""
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_unix_ns": self.start_unix_ns,
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """OTLP/JSON representation of the span."""
+        end_unix_ns = self.start_unix_ns + int((self.duration or 0.0) * 1e9)
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_unix_ns),
+            "endTimeUnixNano": str(end_unix_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": (
+                {"code": 2, "message": self.error} if self.error else {"code": 1}
+            ),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class FileSpanExporter:
+    """Appends spans as JSON lines to a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False) + "\n")
+
+
+class OtlpHttpSpanExporter:
+    """Sends spans to an OTLP/HTTP collector using the JSON encoding."""
+
+    def __init__(self, endpoint: str, service_name: str):
+        self.url = f"{endpoint.rstrip('/')}/v1/traces"
+        self.resource = {
+            "attributes": [
+                {"key": "service.name", "value": {"stringValue": service_name}}
+            ]
+        }
+        self.session = requests.Session()
+
+    def export(self, spans: List[Span]):
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": self.resource,
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [span.to_otlp() for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        response = self.session.post(self.url, json=payload, timeout=10)
+        response.raise_for_status()
+
+
+class Tracer:
+    """Creates spans, reports their durations and batches them for export.
+
+    Finished spans go to every listener (the per-stage histogram in
+    ``metrics``) and, when an exporter is configured, into a bounded queue
+    drained by a daemon thread so the event loop never waits on I/O. Spans
+    are dropped rather than queued without limit when the exporter falls
+    behind.
+    """
+
+    def __init__(self, exporter=None, flush_interval: float = 5.0):
+        self.exporter = exporter
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._listeners: List[Callable[[Span], None]] = []
+        self._queue: "queue.Queue[Span]" = queue.Queue(EXPORT_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """Build a tracer from ``TRACING_EXPORTER`` and related settings."""
+        mode = os.getenv("TRACING_EXPORTER", "none").lower()
+        exporter = None
+        if mode == "file":
+            exporter = FileSpanExporter(os.getenv("TRACING_FILE", "traces.jsonl"))
+        elif mode == "otlp":
+            exporter = OtlpHttpSpanExporter(
+                os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318"),
+                os.getenv("OTEL_SERVICE_NAME", "ha-telegram-bot"),
+            )
+        elif mode != "none":
+            logger.warning(f"Unknown TRACING_EXPORTER={mode!r}, spans not exported")
+        return cls(exporter, float(os.getenv("TRACING_FLUSH_INTERVAL", "5")))
+
+    def add_listener(self, listener: Callable[[Span], None]):
+        """Call ``listener(span)`` for every finished span."""
+        self._listeners.append(listener)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Time a stage; nested spans become its children."""
+        current = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            current.end()
+            self._finish(current)
+
+    def _finish(self, span: Span):
+        for listener in self._listeners:
+            try:
+                listener(span)
+            except Exception as e:
+                logger.error(f"Span listener failed: {e}")
+
+        if self.exporter is None:
+            return
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._queue.qsize() >= EXPORT_BATCH_SIZE:
+            self._wakeup.set()
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="span-exporter", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Export every queued span (also used on shutdown and in tests)."""
+        with self._export_lock:
+            while True:
+                batch = []
+                while len(batch) < EXPORT_BATCH_SIZE:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                self._export(batch)
+
+    def _export(self, batch: List[Span]):
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            logger.warning(f"Failed to export {len(batch)} spans: {e}")
+
+
+# Глобальный трассировщик приложения
+tracer = Tracer.from_env()
+span = tracer.span
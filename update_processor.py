@@ -0,0 +1,142 @@
+"""
+Concurrent processing of Telegram updates with per-chat ordering
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from typing import Any
+from typing import Awaitable
+from typing import Dict
+from typing import Hashable
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений может ждать своей очереди одновременно
+MAX_PENDING_UPDATES = 10000
+
+
+def chat_key(update: object) -> Optional[Hashable]:
+    """Ordering key of an update: its chat, else its user, else none."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return ("user", update.effective_user.id)
+    return None
+
+
+class _ChatQueue:
+    """FIFO lock of one chat and the number of updates holding or awaiting it."""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates of different chats concurrently, one chat in order.
+
+    The Application starts a task per update in arrival order; each task
+    first queues on the lock of its chat (``asyncio.Lock`` wakes waiters in
+    FIFO order) and only then takes one of ``max_concurrent_updates``
+    processing slots. A chat sending many commands therefore never occupies
+    more than one slot, and ``/light_on`` followed by ``/light_off`` can not
+    swap places. The ``max_concurrent_updates`` property of the base class
+    reports ``MAX_PENDING_UPDATES``, the bound on updates in flight.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        # Семафор базового класса ограничивает только число ожидающих задач:
+        # слот обработки занимается, когда обновление дошло до головы очереди чата
+        super().__init__(MAX_PENDING_UPDATES)
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates must be a positive integer")
+        self.limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._chats: Dict[Hashable, _ChatQueue] = {}
+        self.waiting = 0
+        self.active = 0
+
+    async def initialize(self) -> None:
+        """Nothing to allocate."""
+
+    async def shutdown(self) -> None:
+        """Nothing to release; the Application awaits running updates itself."""
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        key = chat_key(update)
+        chat = self._join(key)
+        queued = time.perf_counter()
+        started = False
+        self._set_waiting(1)
+        try:
+            async with chat.lock if chat else contextlib.nullcontext():
+                async with self._slots:
+                    started = True
+                    self._set_waiting(-1)
+                    metrics_collector.record_update_wait(time.perf_counter() - queued)
+                    self.active += 1
+                    self._report()
+                    try:
+                        await coroutine
+                    finally:
+                        self.active -= 1
+                        self._report()
+        finally:
+            if not started:
+                # Обновление отменили в очереди - корутина так и не запускалась
+                self._set_waiting(-1)
+                getattr(coroutine, "close", lambda: None)()
+            self._leave(key, chat)
+
+    def _join(self, key: Optional[Hashable]) -> Optional[_ChatQueue]:
+        if key is None:
+            return None
+        chat = self._chats.get(key)
+        if chat is None:
+            chat = self._chats[key] = _ChatQueue()
+        chat.users += 1
+        return chat
+
+    def _leave(self, key: Optional[Hashable], chat: Optional[_ChatQueue]):
+        if chat is None:
+            return
+        chat.users -= 1
+        if chat.users == 0:
+            del self._chats[key]
+
+    def _set_waiting(self, delta: int):
+        self.waiting += delta
+        self._report()
+
+    def _report(self):
+        metrics_collector.update_update_queue(self.waiting, self.active)
+
+    def describe(self) -> Dict[str, Any]:
+        """Current load for diagnostics."""
+        return {
+            "limit": self.limit,
+            "waiting": self.waiting,
+            "active": self.active,
+            "chats": len(self._chats),
+        }
+
+
+def update_processor_from_env() -> Optional[ChatOrderedUpdateProcessor]:
+    """Processor for ``BOT_CONCURRENT_UPDATES``; ``None`` keeps sequential handling."""
+    limit = int(os.getenv("BOT_CONCURRENT_UPDATES", "16"))
+    if limit <= 1:
+        return None
+    return ChatOrderedUpdateProcessor(limit)
@@ -0,0 +1,220 @@
+"""
+Webhook delivery of Telegram updates
+"""
+
+import asyncio
+import atexit
+import hashlib
+import hmac
+import logging
+import os
+import threading
+from typing import Any
+from typing import Dict
+from typing import Optional
+
+from flask import Blueprint
+from flask import Flask
+from flask import jsonify
+from flask import request
+from telegram import Update
+from telegram.ext import Application
+from werkzeug.serving import make_server
+
+from metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передаёт secret_token из setWebhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+DEFAULT_WEBHOOK_PATH = "/telegram/webhook"
+
+
+def default_secret(bot_token: str) -> str:
+    """Secret derived from the bot token, identical in every process.
+
+    Telegram allows ``A-Z``, ``a-z``, ``0-9``, ``_`` and ``-`` in the
+    secret, so a hex digest fits; the token itself can not be recovered.
+    """
+    return hashlib.sha256(f"webhook:{bot_token}".encode()).hexdigest()
+
+
+class WebhookBot:
+    """Runs the Application on its own event loop thread and feeds it posted updates.
+
+    Updates are only parsed and queued in the caller's thread (a Flask or
+    gunicorn worker), so the HTTP response goes back to Telegram right away
+    and handlers run on the bot loop as with polling.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        secret_token: str,
+        webhook_url: Optional[str] = None,
+    ):
+        self.application = application
+        self.secret_token = secret_token
+        self.webhook_url = webhook_url
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    @classmethod
+    def from_env(cls, application: Application) -> "WebhookBot":
+        """Build from ``TELEGRAM_WEBHOOK_URL`` and ``TELEGRAM_WEBHOOK_SECRET``."""
+        return cls(
+            application,
+            secret_token=os.getenv("TELEGRAM_WEBHOOK_SECRET")
+            or default_secret(application.bot.token),
+            webhook_url=os.getenv("TELEGRAM_WEBHOOK_URL") or None,
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, timeout: float = 30.0):
+        """Initialize and start the Application, then register the webhook."""
+        if self.running:
+            return
+        self._ready.clear()
+        self._error = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run, name="telegram-webhook", daemon=True
+        )
+        self._thread.start()
+        if not self._ready.wait(timeout):
+            raise TimeoutError("Telegram application did not start in time")
+        if self._error is not None:
+            raise self._error
+
+    def stop(self, timeout: float = 30.0):
+        """Stop the Application and its event loop."""
+        if not self.running:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._startup())
+        except BaseException as e:
+            logger.error(f"Failed to start Telegram webhook bot: {e}")
+            self._error = e
+            self._loop.close()
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.run_until_complete(self._cleanup())
+            self._loop.close()
+
+    async def _startup(self):
+        application = self.application
+        await application.initialize()
+        # post_init/post_shutdown вызывает только run_polling/run_webhook
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        if self.webhook_url:
+            await application.bot.set_webhook(
+                self.webhook_url,
+                secret_token=self.secret_token,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info(f"Telegram webhook set to {self.webhook_url}")
+
+    async def _cleanup(self):
+        application = self.application
+        try:
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+        except Exception as e:
+            logger.error(f"Error stopping Telegram webhook bot: {e}")
+
+    def check_secret(self, token: Optional[str]) -> bool:
+        """Whether a request carries the configured secret token."""
+        return hmac.compare_digest((token or "").encode(), self.secret_token.encode())
+
+    def submit(self, payload: Dict[str, Any]) -> bool:
+        """Queue one update posted by Telegram; ``False`` if it is not an update."""
+        if not self.running:
+            raise RuntimeError("Telegram webhook bot is not running")
+        update = Update.de_json(payload, self.application.bot)
+        if update is None:
+            return False
+        self._loop.call_soon_threadsafe(
+            self.application.update_queue.put_nowait, update
+        )
+        return True
+
+
+def webhook_blueprint(
+    webhook_bot: WebhookBot, path: str = DEFAULT_WEBHOOK_PATH
+) -> Blueprint:
+    """Flask blueprint accepting Telegram updates at ``path``."""
+    blueprint = Blueprint("telegram_webhook", __name__)
+
+    @blueprint.route(path, methods=["POST"])
+    def telegram_webhook():
+        """Endpoint Telegram posts updates to"""
+        if not webhook_bot.check_secret(request.headers.get(SECRET_HEADER)):
+            metrics_collector.record_webhook_request("forbidden")
+            return jsonify({"status": "error", "error": "forbidden"}), 403
+        payload = request.get_json(silent=True)
+        try:
+            accepted = isinstance(payload, dict) and webhook_bot.submit(payload)
+        except Exception as e:
+            logger.error(f"Telegram webhook error: {e}")
+            metrics_collector.record_webhook_request("error")
+            return jsonify({"status": "error", "error": str(e)}), 500
+        if not accepted:
+            metrics_collector.record_webhook_request("invalid")
+            return jsonify({"status": "error", "error": "invalid update"}), 400
+        metrics_collector.record_webhook_request("accepted")
+        return jsonify({"status": "success"})
+
+    return blueprint
+
+
+def mount_webhook(flask_app: Flask, application: Application) -> WebhookBot:
+    """Serve the webhook from an existing Flask app (the gunicorn app in main.py)."""
+    webhook_bot = WebhookBot.from_env(application)
+    webhook_bot.start()
+    atexit.register(webhook_bot.stop)
+    path = os.getenv("TELEGRAM_WEBHOOK_PATH", DEFAULT_WEBHOOK_PATH)
+    flask_app.register_blueprint(webhook_blueprint(webhook_bot, path))
+    flask_app.extensions["telegram_webhook"] = webhook_bot
+    logger.info(f"Telegram webhook mounted at {path}")
+    return webhook_bot
+
+
+def serve_webhook(application: Application):
+    """Run a standalone HTTP listener for the webhook until interrupted."""
+    listen = os.getenv("TELEGRAM_WEBHOOK_LISTEN", "0.0.0.0")
+    port = int(os.getenv("TELEGRAM_WEBHOOK_PORT", "8443"))
+    path = os.getenv("TELEGRAM_WEBHOOK_PATH", DEFAULT_WEBHOOK_PATH)
+
+    listener = Flask(__name__)
+    webhook_bot = WebhookBot.from_env(application)
+    listener.register_blueprint(webhook_blueprint(webhook_bot, path))
+    server = make_server(listen, port, listener, threaded=True)
+
+    webhook_bot.start()
+    logger.info(f"Telegram webhook listening on {listen}:{port}{path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        webhook_bot.stop()